@@ -0,0 +1,316 @@
+import re
+import subprocess
+from dataclasses import dataclass, replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core import (
+    ALIGN_HOP_SECONDS,
+    ALIGN_ONSET_LAG_SECONDS,
+    ALIGN_RANGE_PAD_SECONDS,
+    ALIGN_RANGED_MAX_FRACTION,
+    ALIGN_READ_SECONDS,
+    ALIGN_SAMPLE_RATE,
+    ALIGN_SCENE_CUT_SCORE,
+    ALIGN_SCENE_FPS,
+    ALIGN_SCENE_WIDTH,
+    DEFAULT_ALIGN_MIN_SALIENCE,
+    DEFAULT_ALIGN_SCENE_WEIGHT,
+    DEFAULT_ALIGN_WINDOW_SECONDS,
+    METRICS,
+    Commentary,
+    probe_audio_sample_rate,
+    probe_media_duration,
+    run_ffmpeg,
+    seconds_to_timestamp,
+)
+from mixing import estimate_speech_seconds
+
+
+# Local, CPU-only refinement of Gemini's second-level timestamps: each event is moved to
+# the strongest audio onset or scene cut near it, using a low-rate envelope of the audio
+# track and ffmpeg's scene scores on a thumbnail-sized decode.
+
+__all__ = [
+    "AlignmentPolicy",
+    "event_ranges",
+    "audio_onset_strength",
+    "scene_change_scores",
+    "compute_salience",
+    "snap_event_times",
+    "snap_commentary",
+    "align_commentary",
+]
+
+SCENE_METADATA_PATTERN = re.compile(r"pts_time:(\S+)\s*\n\s*lavfi\.scene_score=(\S+)")
+
+
+@dataclass
+class AlignmentPolicy:
+    window: float = DEFAULT_ALIGN_WINDOW_SECONDS
+    min_salience: float = DEFAULT_ALIGN_MIN_SALIENCE
+    scene_weight: float = DEFAULT_ALIGN_SCENE_WEIGHT
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"window": self.window, "min_salience": self.min_salience, "scene_weight": self.scene_weight}
+
+
+def event_ranges(
+    centers: Sequence[float],
+    window: float,
+    duration: float,
+    pad: float = ALIGN_RANGE_PAD_SECONDS,
+) -> List[Tuple[float, float]]:
+    # Merged (start, end) spans covering every event's snapping window, padded on both
+    # sides so onsets and cuts at the window edges still have a frame or hop before them.
+    ranges: List[Tuple[float, float]] = []
+    for center in sorted(centers):
+        start = max(0.0, center - window - pad)
+        end = min(duration, center + window + pad)
+        if end <= start:
+            continue
+        if ranges and start <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def seek_args(span: Optional[Tuple[float, float]]) -> List[str]:
+    if span is None:
+        return []
+    start, end = span
+    return ["-ss", f"{start:.3f}", "-t", f"{end - start:.3f}"]
+
+
+def audio_energy(video_path: Path, hop_seconds: float, span: Optional[Tuple[float, float]] = None) -> np.ndarray:
+    # Streams mono audio at a low rate and keeps only one energy value per hop, so memory
+    # stays proportional to the hop count rather than the sample count.
+    hop_frames = max(1, int(round(ALIGN_SAMPLE_RATE * hop_seconds)))
+    hop_bytes = hop_frames * 4
+    block_bytes = hop_bytes * max(1, int(ALIGN_READ_SECONDS / hop_seconds))
+    process = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            *seek_args(span),
+            "-i",
+            str(video_path),
+            "-map",
+            "0:a:0",
+            "-ac",
+            "1",
+            "-ar",
+            str(ALIGN_SAMPLE_RATE),
+            "-f",
+            "f32le",
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdout is not None and process.stderr is not None
+    energies: List[np.ndarray] = []
+    pending = b""
+    while True:
+        data = process.stdout.read(block_bytes)
+        if not data:
+            break
+        data = pending + data
+        usable = len(data) - len(data) % hop_bytes
+        pending = data[usable:]
+        frames = np.frombuffer(data, dtype=np.float32, count=usable // 4).reshape(-1, hop_frames)
+        energies.append(np.einsum("ij,ij->i", frames, frames) / hop_frames)
+    stderr = process.stderr.read()
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+    return np.concatenate(energies) if energies else np.zeros(0, dtype=np.float32)
+
+
+def onset_from_energy(energy: np.ndarray, hop_seconds: float) -> np.ndarray:
+    # Positive change in smoothed log energy over a short lag: crowd roars, punches and
+    # whistles show up as sharp rises, steady noise does not.
+    level = 10 * np.log10(energy + 1e-10)
+    level = np.convolve(level, np.ones(3) / 3, mode="same")
+    lag = max(1, int(round(ALIGN_ONSET_LAG_SECONDS / hop_seconds)))
+    onset = np.zeros_like(level)
+    onset[lag:] = np.maximum(level[lag:] - level[:-lag], 0.0)
+    return onset
+
+
+@METRICS.traced("alignment.audio")
+def audio_onset_strength(
+    video_path: Path,
+    hop_seconds: float = ALIGN_HOP_SECONDS,
+    ranges: Optional[Sequence[Tuple[float, float]]] = None,
+    hop_count: int = 0,
+) -> np.ndarray:
+    # With `ranges`, only those spans are decoded (seeking to each) and the rest of the
+    # returned envelope, sized to `hop_count`, stays zero.
+    if probe_audio_sample_rate(video_path) is None:
+        return np.zeros(hop_count if ranges is not None else 0, dtype=np.float32)
+    if ranges is None:
+        onset = onset_from_energy(audio_energy(video_path, hop_seconds), hop_seconds)
+        decoded = onset
+    else:
+        onset = np.zeros(hop_count, dtype=np.float32)
+        pieces: List[np.ndarray] = []
+        for span in ranges:
+            piece = onset_from_energy(audio_energy(video_path, hop_seconds, span), hop_seconds)
+            first = int(round(span[0] / hop_seconds))
+            piece = piece[: max(0, hop_count - first)]
+            onset[first : first + len(piece)] = piece
+            pieces.append(piece)
+        decoded = np.concatenate(pieces) if pieces else onset[:0]
+    scale = float(np.percentile(decoded, 99)) if len(decoded) else 0.0
+    METRICS.annotate(hops=len(decoded), ranges=len(ranges) if ranges is not None else None)
+    return np.clip(onset / scale, 0.0, 1.0).astype(np.float32) if scale > 0 else onset.astype(np.float32)
+
+
+def scene_metadata(video_path: Path, span: Optional[Tuple[float, float]] = None) -> str:
+    with TemporaryDirectory() as temp_dir:
+        metadata_path = Path(temp_dir) / "scenes.txt"
+        run_ffmpeg(
+            [
+                "-v",
+                "error",
+                *seek_args(span),
+                "-i",
+                str(video_path),
+                "-an",
+                "-vf",
+                (
+                    f"fps={ALIGN_SCENE_FPS},scale={ALIGN_SCENE_WIDTH}:-2,select='gte(scene,0)',"
+                    f"metadata=mode=print:key=lavfi.scene_score:file={metadata_path}"
+                ),
+                "-f",
+                "null",
+                "-",
+            ]
+        )
+        return metadata_path.read_text() if metadata_path.exists() else ""
+
+
+@METRICS.traced("alignment.scenes")
+def scene_change_scores(
+    video_path: Path,
+    hop_count: int,
+    hop_seconds: float = ALIGN_HOP_SECONDS,
+    ranges: Optional[Sequence[Tuple[float, float]]] = None,
+) -> np.ndarray:
+    # Seeked decodes restart their timestamps at zero, so each span's scores are offset
+    # by its start.
+    scores = np.zeros(hop_count, dtype=np.float32)
+    for span in ranges if ranges is not None else [None]:
+        offset = span[0] if span else 0.0
+        for match in SCENE_METADATA_PATTERN.finditer(scene_metadata(video_path, span)):
+            index = int(round((offset + float(match.group(1))) / hop_seconds))
+            if 0 <= index < hop_count:
+                scores[index] = max(scores[index], float(match.group(2)))
+    METRICS.annotate(ranges=len(ranges) if ranges is not None else None)
+    return np.clip(scores / ALIGN_SCENE_CUT_SCORE, 0.0, 1.0)
+
+
+@METRICS.traced("alignment.salience")
+def compute_salience(
+    video_path: Path,
+    policy: AlignmentPolicy,
+    hop_seconds: float = ALIGN_HOP_SECONDS,
+    centers: Optional[Sequence[float]] = None,
+    scene_path: Optional[Path] = None,
+) -> np.ndarray:
+    # Given the event times in `centers`, only the windows around them are decoded while
+    # those windows cover a small part of the video; the scene pass reads `scene_path`
+    # (a low-resolution copy such as the analysis proxy) when one is available.
+    duration = probe_media_duration(video_path)
+    hop_count = int(np.ceil(duration / hop_seconds))
+    ranges: Optional[List[Tuple[float, float]]] = None
+    if centers is not None:
+        ranges = event_ranges(centers, policy.window, duration)
+        if sum(end - start for start, end in ranges) > ALIGN_RANGED_MAX_FRACTION * duration:
+            ranges = None
+    METRICS.annotate(ranged=ranges is not None)
+    salience = audio_onset_strength(video_path, hop_seconds, ranges, hop_count)
+    if policy.scene_weight > 0:
+        hop_count = max(len(salience), hop_count)
+        salience = np.pad(salience, (0, hop_count - len(salience)))
+        scenes = scene_change_scores(scene_path or video_path, hop_count, hop_seconds, ranges)
+        salience = salience + policy.scene_weight * scenes
+    return salience
+
+
+def snap_event_times(
+    starts: Sequence[float],
+    salience: np.ndarray,
+    policy: AlignmentPolicy,
+    hop_seconds: float = ALIGN_HOP_SECONDS,
+    durations: Optional[Sequence[float]] = None,
+) -> List[float]:
+    # Each event takes the most salient hop within its window, weighted towards the original
+    # time. A window starts after the previous snapped event has (by its estimated duration)
+    # finished speaking and ends before the next event's original time, so events never
+    # swap order or land on the same instant; events without a strong enough hop keep
+    # their original time.
+    snapped: List[float] = []
+    window_hops = max(1, int(round(policy.window / hop_seconds)))
+    for index, start in enumerate(starts):
+        center = int(round(start / hop_seconds))
+        low = max(center - window_hops, 0)
+        if snapped:
+            previous_hop = int(round(snapped[-1] / hop_seconds))
+            spoken_hops = int(np.ceil(durations[index - 1] / hop_seconds)) if durations else 0
+            low = max(low, previous_hop + max(1, spoken_hops))
+        high = min(center + window_hops, len(salience) - 1)
+        if index + 1 < len(starts):
+            high = min(high, int(round(starts[index + 1] / hop_seconds)) - 1)
+        if high < low:
+            snapped.append(start)
+            continue
+        candidates = salience[low : high + 1]
+        distance = np.abs(np.arange(low, high + 1) - center) / window_hops
+        best = int(np.argmax(candidates * (1.0 - 0.5 * distance)))
+        if candidates[best] < policy.min_salience:
+            snapped.append(start)
+            continue
+        snapped.append((low + best) * hop_seconds)
+    return snapped
+
+
+def snap_commentary(
+    commentary: Commentary,
+    salience: np.ndarray,
+    policy: AlignmentPolicy,
+    hop_seconds: float = ALIGN_HOP_SECONDS,
+) -> Commentary:
+    starts = [event.start_seconds for event in commentary.events]
+    durations = [estimate_speech_seconds(event.call) for event in commentary.events]
+    snapped = snap_event_times(starts, salience, policy, hop_seconds, durations)
+    shifts = [new - old for old, new in zip(starts, snapped) if abs(new - old) >= hop_seconds]
+    METRICS.annotate(events=len(starts), moved=len(shifts))
+    if shifts:
+        median_shift = float(np.median(np.abs(shifts)))
+        print(f"Aligned {len(shifts)} of {len(starts)} events to nearby action (median shift {median_shift:.2f}s)")
+    else:
+        print(f"Kept all {len(starts)} event timestamps; no stronger action found nearby")
+    events = [
+        replace(event, timestamp=seconds_to_timestamp(new)) if abs(new - old) >= hop_seconds else event
+        for event, old, new in zip(commentary.events, starts, snapped)
+    ]
+    return replace(commentary, events=events)
+
+
+@METRICS.traced("alignment")
+def align_commentary(
+    video_path: Path,
+    commentary: Commentary,
+    policy: Optional[AlignmentPolicy] = None,
+    scene_path: Optional[Path] = None,
+) -> Commentary:
+    policy = policy or AlignmentPolicy()
+    centers = [event.start_seconds for event in commentary.events]
+    salience = compute_salience(video_path, policy, centers=centers, scene_path=scene_path)
+    return snap_commentary(commentary, salience, policy)
@@ -0,0 +1,966 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core import (
+    DEFAULT_ANALYSIS_CACHE_TTL_HOURS,
+    DEFAULT_ANALYSIS_CONCURRENCY,
+    DEFAULT_ANALYSIS_FPS,
+    DEFAULT_GEMINI_MODEL,
+    DEFAULT_INLINE_VIDEO_MAX_MB,
+    DEFAULT_PROXY_CRF,
+    DEFAULT_PROXY_SHORT_SIDE,
+    DEFAULT_SEGMENT_OVERLAP_SECONDS,
+    FILE_UPLOAD_POLL_SECONDS,
+    FILE_UPLOAD_TIMEOUT_SECONDS,
+    INLINE_REQUEST_OVERHEAD_BYTES,
+    METRICS,
+    PROXY_AUDIO_BITRATE,
+    PROXY_AUDIO_SAMPLE_RATE,
+    PROXY_KEYFRAME_SECONDS,
+    TRAILING_COMMA_PATTERN,
+    Commentary,
+    CommentaryEvent,
+    hash_file,
+    normalize_commentator_key,
+    probe_media_duration,
+    run_ffmpeg,
+    seconds_to_timestamp,
+)
+
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+
+# google.genai accounts for most of the CLI's import time, so it is imported inside the
+# functions that talk to Gemini rather than at module load.
+
+__all__ = [
+    "AnalysisCache",
+    "guess_video_mime_type",
+    "upload_video_file",
+    "build_video_part",
+    "delete_uploaded_file",
+    "AnalysisProxy",
+    "analysis_cache_extra",
+    "COMMENTARY_RESPONSE_SCHEMA",
+    "TRANSLATION_RESPONSE_SCHEMA",
+    "TRANSLATION_PROMPT",
+    "commentary_generation_config",
+    "is_structured_output_unsupported",
+    "call_with_structured_output",
+    "generate_commentary",
+    "translate_commentary",
+    "IncrementalEventParser",
+    "loads_lenient",
+    "recover_commentary_payload",
+    "stream_commentary",
+    "plan_analysis_windows",
+    "cut_video_window",
+    "merge_window_commentaries",
+    "generate_commentary_segmented",
+    "extract_commentary_payload",
+    "report_recovered_payload",
+    "try_parse_commentary_text",
+    "generate_json_candidates",
+    "strip_code_fence",
+]
+
+
+class AnalysisCache:
+    def __init__(self, directory: Path, ttl_seconds: float = DEFAULT_ANALYSIS_CACHE_TTL_HOURS * 3600) -> None:
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        video_path: Path,
+        prompt_text: str,
+        model: str,
+        fps: float,
+        extra: Optional[Dict[str, Any]] = None,
+        video_sha256: Optional[str] = None,
+    ) -> str:
+        # Callers that key several stages on the same video pass its digest in, so a large
+        # source is read once per run instead of once per lookup.
+        material = json.dumps(
+            {
+                "video_sha256": video_sha256 or hash_file(video_path),
+                "prompt_sha256": hashlib.sha256(prompt_text.encode("utf-8")).hexdigest(),
+                "model": model,
+                "fps": fps,
+                "extra": extra or {},
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Commentary]:
+        path = self.path_for(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        if self.ttl_seconds > 0 and time.time() - stat.st_mtime > self.ttl_seconds:
+            path.unlink(missing_ok=True)
+            return None
+        try:
+            return Commentary.from_dict(json.loads(path.read_text()))
+        except (json.JSONDecodeError, ValueError):
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, key: str, commentary: Commentary) -> None:
+        path = self.path_for(key)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps(commentary.to_dict(), indent=2))
+        os.replace(temp_path, path)
+
+
+def guess_video_mime_type(video_path: Path) -> str:
+    suffix = video_path.suffix.lower()
+    if suffix in {".mov", ".qt"}:
+        return "video/quicktime"
+    if suffix in {".webm"}:
+        return "video/webm"
+    return "video/mp4"
+
+
+def upload_video_file(client: genai.Client, video_path: Path, mime_type: str) -> types.File:
+    from google.genai import types
+
+    # The SDK streams the file from disk in chunks, so memory stays flat regardless of size.
+    uploaded = client.files.upload(
+        file=str(video_path),
+        config=types.UploadFileConfig(mime_type=mime_type, display_name=video_path.name),
+    )
+    deadline = time.monotonic() + FILE_UPLOAD_TIMEOUT_SECONDS
+    while uploaded.state == types.FileState.PROCESSING:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for Gemini to process uploaded video {uploaded.name}.")
+        time.sleep(FILE_UPLOAD_POLL_SECONDS)
+        uploaded = client.files.get(name=uploaded.name or "")
+    if uploaded.state == types.FileState.FAILED or not uploaded.uri:
+        raise RuntimeError(f"Gemini failed to process uploaded video {uploaded.name}: {uploaded.error}")
+    return uploaded
+
+
+def build_video_part(
+    client: genai.Client,
+    video_path: Path,
+    fps: float,
+    inline_max_bytes: int,
+    prompt_text: str = "",
+) -> Tuple[types.Part, Optional[str]]:
+    from google.genai import types
+
+    mime_type = guess_video_mime_type(video_path)
+    video_metadata = types.VideoMetadata(fps=fps)
+
+    # inline_max_bytes caps the whole request: inline data is base64-encoded (4 bytes per
+    # 3) and travels with the prompt and the JSON framing around them.
+    video_size = video_path.stat().st_size
+    request_size = 4 * -(-video_size // 3) + len(prompt_text.encode("utf-8")) + INLINE_REQUEST_OVERHEAD_BYTES
+    if inline_max_bytes > 0 and request_size <= inline_max_bytes:
+        METRICS.annotate(bytes=video_size)
+        part = types.Part(
+            inline_data=types.Blob(
+                data=video_path.read_bytes(),
+                mime_type=mime_type,
+            ),
+            video_metadata=video_metadata,
+        )
+        return part, None
+
+    print(f"Uploading {video_path} to the Gemini Files API")
+    with METRICS.span("analysis.upload", bytes=video_size):
+        uploaded = upload_video_file(client, video_path, mime_type)
+    part = types.Part(
+        file_data=types.FileData(file_uri=uploaded.uri, mime_type=uploaded.mime_type or mime_type),
+        video_metadata=video_metadata,
+    )
+    return part, uploaded.name
+
+
+def delete_uploaded_file(client: genai.Client, uploaded_name: Optional[str]) -> None:
+    if not uploaded_name:
+        return
+    try:
+        client.files.delete(name=uploaded_name)
+    except Exception as error:
+        print(f"Warning: failed to delete uploaded video {uploaded_name}: {error}")
+
+
+@dataclass
+class AnalysisProxy:
+    # A small H.264 copy of the source at the analysis frame rate; Gemini samples frames
+    # at `fps` anyway, so the full-resolution original only costs upload time.
+    short_side: int = DEFAULT_PROXY_SHORT_SIDE
+    crf: int = DEFAULT_PROXY_CRF
+    keep_audio: bool = True
+    directory: Optional[Path] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"short_side": self.short_side, "crf": self.crf, "keep_audio": self.keep_audio}
+
+    def path_for(self, video_path: Path, fps: float) -> Path:
+        suffix = f"{self.short_side}p-{fps:g}fps-crf{self.crf}{'' if self.keep_audio else '-noaudio'}"
+        if self.directory is None:
+            return video_path.parent / f".{video_path.stem}.analysis-{suffix}.mp4"
+        source_id = hashlib.sha256(str(video_path.resolve()).encode("utf-8")).hexdigest()[:12]
+        return self.directory / f"{video_path.stem}-{source_id}.analysis-{suffix}.mp4"
+
+    def existing(self, video_path: Path, fps: float) -> Optional[Path]:
+        proxy_path = self.path_for(video_path, fps)
+        if proxy_path.exists() and proxy_path.stat().st_mtime >= video_path.stat().st_mtime:
+            return proxy_path
+        return None
+
+    @METRICS.traced("analysis.proxy")
+    def prepare(self, video_path: Path, fps: float) -> Path:
+        proxy_path = self.existing(video_path, fps)
+        if proxy_path is not None:
+            METRICS.annotate(cache_hit=True, bytes=proxy_path.stat().st_size)
+            return proxy_path
+        proxy_path = self.path_for(video_path, fps)
+
+        proxy_path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = proxy_path.with_name(f"{proxy_path.name}.{os.getpid()}.{threading.get_ident()}.partial")
+        # Scale the shorter side so portrait phone footage keeps the same detail as landscape,
+        # and keep keyframes frequent so segmented analysis can still cut windows with -c copy.
+        short_side = self.short_side
+        scale = (
+            f"scale='if(gt(iw,ih),-2,min({short_side},iw))':'if(gt(iw,ih),min({short_side},ih),-2)'"
+        )
+        audio_args = (
+            ["-map", "0:a:0?", "-c:a", "aac", "-ac", "1", "-ar", str(PROXY_AUDIO_SAMPLE_RATE), "-b:a", PROXY_AUDIO_BITRATE]
+            if self.keep_audio
+            else ["-an"]
+        )
+        print(f"Preparing analysis proxy for {video_path}")
+        try:
+            run_ffmpeg(
+                [
+                    "-y",
+                    "-i",
+                    str(video_path),
+                    "-map",
+                    "0:v:0",
+                    "-vf",
+                    f"fps={fps:g},{scale}",
+                    "-c:v",
+                    "libx264",
+                    "-preset",
+                    "veryfast",
+                    "-crf",
+                    str(self.crf),
+                    "-pix_fmt",
+                    "yuv420p",
+                    "-g",
+                    str(max(1, int(round(fps * PROXY_KEYFRAME_SECONDS)))),
+                    *audio_args,
+                    "-movflags",
+                    "+faststart",
+                    "-f",
+                    "mp4",
+                    str(partial_path),
+                ]
+            )
+            os.replace(partial_path, proxy_path)
+        finally:
+            partial_path.unlink(missing_ok=True)
+
+        proxy_bytes = proxy_path.stat().st_size
+        METRICS.annotate(cache_hit=False, bytes=proxy_bytes, source_bytes=video_path.stat().st_size)
+        print(f"Analysis proxy is {proxy_bytes / 1e6:.1f} MB (source {video_path.stat().st_size / 1e6:.1f} MB)")
+        return proxy_path
+
+
+def analysis_cache_extra(
+    proxy: Optional[AnalysisProxy],
+    segmentation: Optional[Dict[str, Any]] = None,
+) -> Optional[Dict[str, Any]]:
+    extra: Dict[str, Any] = dict(segmentation or {})
+    if proxy:
+        extra["proxy"] = proxy.to_dict()
+    return extra or None
+
+
+COMMENTARY_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "matchSummary": {"type": "STRING"},
+        "commentators": {
+            "type": "OBJECT",
+            "properties": {"playByPlay": {"type": "STRING"}, "analyst": {"type": "STRING"}},
+        },
+        "events": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "timestamp": {"type": "STRING"},
+                    "commentator": {"type": "STRING", "enum": ["playByPlay", "analyst"]},
+                    "call": {"type": "STRING"},
+                    "context": {"type": "STRING"},
+                },
+                # Single-voice prompts never name a commentator; from_dict falls back to play-by-play.
+                "required": ["timestamp", "call"],
+                "property_ordering": ["timestamp", "commentator", "call", "context"],
+            },
+        },
+    },
+    # Commentary.from_dict rejects a payload without a summary, so the schema requires it.
+    "required": ["matchSummary", "events"],
+    # Summary first, so streamed events are not held back behind it.
+    "property_ordering": ["matchSummary", "commentators", "events"],
+}
+
+
+TRANSLATION_RESPONSE_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {"lines": {"type": "ARRAY", "items": {"type": "STRING"}}},
+    "required": ["lines"],
+}
+
+TRANSLATION_PROMPT = (
+    "Translate each line of this live sports commentary into {language}; the first line summarizes the "
+    "match, so use it to pick the sport's own terminology. Keep the energy, keep names "
+    "unchanged, and keep every line about as long to speak as the original so it still fits its moment. "
+    'Return only JSON of the form {{"lines": [...]}} with exactly {count} strings in the same order.\n\n{lines}'
+)
+
+
+def commentary_generation_config() -> types.GenerateContentConfig:
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=COMMENTARY_RESPONSE_SCHEMA,
+    )
+
+
+def is_structured_output_unsupported(error: Exception) -> bool:
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    message = str(error).lower()
+    return code == 400 and any(term in message for term in ("response_schema", "response_mime_type", "json mode"))
+
+
+def call_with_structured_output(
+    request: Callable[[Optional[types.GenerateContentConfig]], Any],
+    structured_output: bool,
+    model: str,
+) -> Any:
+    if not structured_output:
+        return request(None)
+    try:
+        return request(commentary_generation_config())
+    except Exception as error:
+        if not is_structured_output_unsupported(error):
+            raise
+        print(f"Warning: {model} rejected structured JSON output; retrying without it: {error}")
+        return request(None)
+
+
+@METRICS.traced("analysis")
+def generate_commentary(
+    video_path: Path,
+    prompt_path: Path,
+    api_key: str,
+    model: str = DEFAULT_GEMINI_MODEL,
+    fps: float = DEFAULT_ANALYSIS_FPS,
+    cache: Optional[AnalysisCache] = None,
+    bypass_cache: bool = False,
+    inline_max_bytes: int = DEFAULT_INLINE_VIDEO_MAX_MB * 1024 * 1024,
+    client: Optional[genai.Client] = None,
+    proxy: Optional[AnalysisProxy] = None,
+    structured_output: bool = True,
+    allow_empty: bool = False,
+    video_sha256: Optional[str] = None,
+) -> Commentary:
+    prompt_text = prompt_path.read_text()
+
+    cache_key = None
+    if cache:
+        cache_key = AnalysisCache.make_key(
+            video_path, prompt_text, model, fps, extra=analysis_cache_extra(proxy), video_sha256=video_sha256
+        )
+        if not bypass_cache:
+            cached = cache.get(cache_key)
+            METRICS.annotate(cache_hit=cached is not None)
+            if cached is not None:
+                print(f"Using cached commentary analysis for {video_path}")
+                return cached
+
+    from google import genai
+    from google.genai import types
+
+    client = client or genai.Client(api_key=api_key)
+    analysis_path = proxy.prepare(video_path, fps) if proxy else video_path
+    video_part, uploaded_name = build_video_part(client, analysis_path, fps, inline_max_bytes, prompt_text)
+    contents = types.Content(
+        parts=[
+            video_part,
+            types.Part(text=prompt_text),
+        ]
+    )
+    try:
+        with METRICS.span("analysis.gemini_request", model=model, structured_output=structured_output):
+            response = call_with_structured_output(
+                lambda config: client.models.generate_content(model=model, contents=contents, config=config),
+                structured_output,
+                model,
+            )
+    finally:
+        delete_uploaded_file(client, uploaded_name)
+
+    commentary_payload = extract_commentary_payload(response)
+    commentary = Commentary.from_dict(commentary_payload, allow_empty=allow_empty)
+    METRICS.annotate(events=len(commentary.events))
+    if cache and cache_key:
+        cache.put(cache_key, commentary)
+    return commentary
+
+
+@METRICS.traced("analysis.translate")
+def translate_commentary(
+    commentary: Commentary,
+    language: str,
+    api_key: str,
+    model: str = DEFAULT_GEMINI_MODEL,
+    cache: Optional[AnalysisCache] = None,
+    client: Optional[genai.Client] = None,
+    structured_output: bool = True,
+) -> Commentary:
+    source_lines = [commentary.match_summary, *(event.call for event in commentary.events)]
+    material = json.dumps(
+        {"lines": source_lines, "language": language, "model": model, "prompt": TRANSLATION_PROMPT},
+        sort_keys=True,
+    )
+    cache_key = hashlib.sha256(material.encode("utf-8")).hexdigest()
+    cached = cache.get(cache_key) if cache else None
+    METRICS.annotate(language=language, cache_hit=cached is not None)
+    if cached is not None:
+        print(f"Using cached {language} translation")
+        return cached
+
+    from google import genai
+    from google.genai import types
+
+    client = client or genai.Client(api_key=api_key)
+    contents = TRANSLATION_PROMPT.format(
+        language=language,
+        count=len(source_lines),
+        lines=json.dumps(source_lines, ensure_ascii=False, indent=0),
+    )
+    config = None
+    if structured_output:
+        config = types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=TRANSLATION_RESPONSE_SCHEMA,
+        )
+    response = client.models.generate_content(model=model, contents=contents, config=config)
+    payload = try_parse_commentary_text(getattr(response, "text", None) or "")
+    lines = payload.get("lines") if isinstance(payload, dict) else None
+    if (
+        not isinstance(lines, list)
+        or len(lines) != len(source_lines)
+        or not all(isinstance(line, str) and line.strip() for line in lines)
+    ):
+        raise ValueError(f"Gemini did not return {len(source_lines)} translated lines for {language}.")
+
+    translated = Commentary(
+        match_summary=lines[0].strip(),
+        commentators=dict(commentary.commentators),
+        events=[replace(event, call=line.strip()) for event, line in zip(commentary.events, lines[1:])],
+    )
+    if cache:
+        cache.put(cache_key, translated)
+    return translated
+
+
+class IncrementalEventParser:
+    # Scans streamed JSON text and returns each object of the top-level `events`
+    # array as soon as its closing brace arrives. Other top-level fields are kept in
+    # `fields`, so a response cut off mid-array or followed by prose can still be
+    # recovered event by event instead of failing as a whole.
+
+    def __init__(self) -> None:
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = -1
+        self.key: Optional[str] = None
+        self.expect_value = False
+        self.events_depth: Optional[int] = None
+        self.object_start = -1
+        self.field_start = -1
+        self.fields: Dict[str, Any] = {}
+        self.dropped = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self.buffer += text
+        found: List[Dict[str, Any]] = []
+        buffer = self.buffer
+        for index in range(self.position, len(buffer)):
+            char = buffer[index]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.events_depth != 1:
+                        self._top_level_string(buffer[self.string_start : index + 1])
+                continue
+
+            if char == '"':
+                self.in_string = True
+                self.string_start = index
+            elif char == ":" and self.depth == 1:
+                self.expect_value = True
+            elif char == "," and self.depth == 1:
+                self.expect_value = False
+            elif char in "{[":
+                self.depth += 1
+                if self.depth == 1 and char == "[" and self.events_depth is None:
+                    # A bare array of events instead of the documented wrapper object.
+                    self.events_depth = 1
+                elif self.depth == 2 and self.events_depth != 1:
+                    if char == "[" and self.key == "events" and self.events_depth is None:
+                        self.events_depth = 2
+                    elif self.expect_value and self.key is not None:
+                        self.field_start = index
+                    self.expect_value = False
+                elif char == "{" and self.events_depth is not None and self.depth == self.events_depth + 1:
+                    self.object_start = index
+            elif char in "}]":
+                if char == "}" and self.object_start >= 0 and self.depth == (self.events_depth or 0) + 1:
+                    parsed = loads_lenient(buffer[self.object_start : index + 1])
+                    if isinstance(parsed, dict):
+                        found.append(parsed)
+                    else:
+                        self.dropped += 1
+                    self.object_start = -1
+                elif self.depth == 2 and self.field_start >= 0 and self.key is not None:
+                    parsed = loads_lenient(buffer[self.field_start : index + 1])
+                    if parsed is not None:
+                        self.fields[self.key] = parsed
+                    self.field_start = -1
+                self.depth = max(0, self.depth - 1)
+        self.position = len(buffer)
+        return found
+
+    def _top_level_string(self, quoted: str) -> None:
+        try:
+            value = json.loads(quoted)
+        except json.JSONDecodeError:
+            return
+        if self.expect_value and self.key is not None:
+            self.fields[self.key] = value
+            self.expect_value = False
+        else:
+            self.key = value
+
+    def finish(self) -> int:
+        # An event object still open at the end of the text was cut off mid-way.
+        if self.object_start >= 0:
+            self.dropped += 1
+            self.object_start = -1
+        return self.dropped
+
+
+def loads_lenient(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(TRAILING_COMMA_PATTERN.sub(r"\1", text))
+    except json.JSONDecodeError:
+        return None
+
+
+def recover_commentary_payload(text: str) -> Optional[Tuple[Dict[str, Any], int]]:
+    parser = IncrementalEventParser()
+    events = parser.feed(text)
+    dropped = parser.finish()
+    if not events:
+        return None
+    payload = {key: value for key, value in parser.fields.items() if key != "events"}
+    payload["events"] = events
+    return payload, dropped
+
+
+@METRICS.traced("analysis.stream")
+def stream_commentary(
+    video_path: Path,
+    prompt_path: Path,
+    api_key: str,
+    on_event: Callable[[CommentaryEvent], None],
+    model: str = DEFAULT_GEMINI_MODEL,
+    fps: float = DEFAULT_ANALYSIS_FPS,
+    cache: Optional[AnalysisCache] = None,
+    bypass_cache: bool = False,
+    inline_max_bytes: int = DEFAULT_INLINE_VIDEO_MAX_MB * 1024 * 1024,
+    client: Optional[genai.Client] = None,
+    proxy: Optional[AnalysisProxy] = None,
+    structured_output: bool = True,
+    video_sha256: Optional[str] = None,
+) -> Commentary:
+    prompt_text = prompt_path.read_text()
+
+    cache_key = None
+    if cache:
+        cache_key = AnalysisCache.make_key(
+            video_path, prompt_text, model, fps, extra=analysis_cache_extra(proxy), video_sha256=video_sha256
+        )
+        if not bypass_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                print(f"Using cached commentary analysis for {video_path}")
+                for event in cached.events:
+                    on_event(event)
+                return cached
+
+    from google import genai
+    from google.genai import types
+
+    client = client or genai.Client(api_key=api_key)
+    analysis_path = proxy.prepare(video_path, fps) if proxy else video_path
+    video_part, uploaded_name = build_video_part(client, analysis_path, fps, inline_max_bytes, prompt_text)
+    parser = IncrementalEventParser()
+    texts: List[str] = []
+    started = time.perf_counter()
+    first_event_seconds: Optional[float] = None
+    contents = types.Content(
+        parts=[
+            video_part,
+            types.Part(text=prompt_text),
+        ]
+    )
+
+    def consume_stream(config: Optional[types.GenerateContentConfig]) -> None:
+        nonlocal first_event_seconds
+        # Rejections of the response schema arrive before any text, so a retry
+        # without it never replays events.
+        stream = client.models.generate_content_stream(model=model, contents=contents, config=config)
+        for chunk in stream:
+            text = chunk.text
+            if not text:
+                continue
+            texts.append(text)
+            for raw_event in parser.feed(text):
+                event = CommentaryEvent.from_dict(raw_event)
+                if event is not None:
+                    if first_event_seconds is None:
+                        first_event_seconds = time.perf_counter() - started
+                        METRICS.annotate(time_to_first_event_seconds=round(first_event_seconds, 6))
+                    on_event(event)
+
+    try:
+        call_with_structured_output(consume_stream, structured_output, model)
+    finally:
+        delete_uploaded_file(client, uploaded_name)
+
+    full_text = "".join(texts)
+    METRICS.annotate(response_chars=len(full_text))
+    commentary_payload = try_parse_commentary_text(full_text)
+    if commentary_payload is None:
+        recovered = recover_commentary_payload(full_text)
+        if recovered is None:
+            sample = full_text.strip().replace("\n", " ")
+            raise ValueError(
+                f"Gemini response did not contain valid JSON commentary. First text snippet: {sample[:200]}..."
+            )
+        commentary_payload = report_recovered_payload(*recovered)
+    commentary = Commentary.from_dict(commentary_payload)
+    if cache and cache_key:
+        cache.put(cache_key, commentary)
+    return commentary
+
+
+def plan_analysis_windows(
+    duration: float,
+    window_seconds: float,
+    overlap_seconds: float,
+) -> List[Tuple[float, float]]:
+    if window_seconds <= 0 or duration <= window_seconds:
+        return [(0.0, duration)]
+    overlap_seconds = min(max(overlap_seconds, 0.0), window_seconds / 2)
+    step = window_seconds - overlap_seconds
+    windows: List[Tuple[float, float]] = []
+    start = 0.0
+    while True:
+        end = min(start + window_seconds, duration)
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start += step
+    return windows
+
+
+def cut_video_window(video_path: Path, start: float, end: float, output_path: Path) -> None:
+    run_ffmpeg(
+        [
+            "-y",
+            "-ss",
+            f"{start:.3f}",
+            "-t",
+            f"{end - start:.3f}",
+            "-i",
+            str(video_path),
+            "-map",
+            "0:v:0",
+            "-map",
+            "0:a:0?",
+            "-c",
+            "copy",
+            str(output_path),
+        ]
+    )
+
+
+def merge_window_commentaries(
+    windows: Sequence[Tuple[float, float]],
+    commentaries: Sequence[Commentary],
+    overlap_seconds: float,
+) -> Commentary:
+    # Each window owns the span up to the midpoint of its overlap with the next one,
+    # so events detected twice in an overlap are kept only once.
+    owned_ranges: List[Tuple[float, float]] = []
+    for index, (start, end) in enumerate(windows):
+        owned_start = 0.0 if index == 0 else (start + windows[index - 1][1]) / 2
+        owned_end = float("inf") if index == len(windows) - 1 else (windows[index + 1][0] + end) / 2
+        owned_ranges.append((owned_start, owned_end))
+
+    events: List[CommentaryEvent] = []
+    seen_calls: Dict[str, float] = {}
+    match_summary = ""
+    commentators: Dict[str, str] = {}
+
+    for (start, _), (owned_start, owned_end), commentary in zip(windows, owned_ranges, commentaries):
+        # A quiet window (no events) has nothing to say about the match as a whole.
+        if not commentary.events:
+            continue
+        # Each window summarizes only its own stretch; the first one introduces the match.
+        match_summary = match_summary or commentary.match_summary
+        for key, name in commentary.commentators.items():
+            commentators.setdefault(key, name)
+
+        for event in commentary.events:
+            global_seconds = start + event.start_seconds
+            if not owned_start <= global_seconds < owned_end:
+                continue
+            call_key = f"{normalize_commentator_key(event.commentator)}|{event.call.strip().lower()}"
+            previous = seen_calls.get(call_key)
+            if previous is not None and abs(previous - global_seconds) <= overlap_seconds:
+                continue
+            seen_calls[call_key] = global_seconds
+            events.append(
+                CommentaryEvent(
+                    timestamp=seconds_to_timestamp(global_seconds),
+                    commentator=event.commentator,
+                    call=event.call,
+                    context=event.context,
+                    interrupts=event.interrupts,
+                )
+            )
+
+    if not events:
+        raise ValueError("Segmented analysis produced no valid events.")
+
+    events.sort(key=lambda event: event.start_seconds)
+    return Commentary(match_summary=match_summary, commentators=commentators, events=events)
+
+
+@METRICS.traced("analysis.segmented")
+def generate_commentary_segmented(
+    video_path: Path,
+    prompt_path: Path,
+    api_key: str,
+    window_seconds: float,
+    overlap_seconds: float = DEFAULT_SEGMENT_OVERLAP_SECONDS,
+    concurrency: int = DEFAULT_ANALYSIS_CONCURRENCY,
+    model: str = DEFAULT_GEMINI_MODEL,
+    fps: float = DEFAULT_ANALYSIS_FPS,
+    cache: Optional[AnalysisCache] = None,
+    bypass_cache: bool = False,
+    inline_max_bytes: int = DEFAULT_INLINE_VIDEO_MAX_MB * 1024 * 1024,
+    client: Optional[genai.Client] = None,
+    proxy: Optional[AnalysisProxy] = None,
+    structured_output: bool = True,
+    video_sha256: Optional[str] = None,
+) -> Commentary:
+    duration = probe_media_duration(video_path)
+    windows = plan_analysis_windows(duration, window_seconds, overlap_seconds)
+    if len(windows) == 1:
+        return generate_commentary(
+            video_path,
+            prompt_path,
+            api_key,
+            model=model,
+            fps=fps,
+            cache=cache,
+            bypass_cache=bypass_cache,
+            inline_max_bytes=inline_max_bytes,
+            client=client,
+            proxy=proxy,
+            structured_output=structured_output,
+            video_sha256=video_sha256,
+        )
+
+    cache_key = None
+    if cache:
+        segmentation = {"window_seconds": window_seconds, "overlap_seconds": overlap_seconds}
+        cache_key = AnalysisCache.make_key(
+            video_path,
+            prompt_path.read_text(),
+            model,
+            fps,
+            extra=analysis_cache_extra(proxy, segmentation),
+            video_sha256=video_sha256,
+        )
+        if not bypass_cache:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                print(f"Using cached segmented commentary analysis for {video_path}")
+                return cached
+
+    from google import genai
+
+    client = client or genai.Client(api_key=api_key)
+    METRICS.annotate(windows=len(windows))
+    # Windows are cut from the proxy once, rather than re-encoding each window separately.
+    source_path = proxy.prepare(video_path, fps) if proxy else video_path
+    print(f"Analyzing {video_path} in {len(windows)} windows of up to {window_seconds:.0f}s")
+    with TemporaryDirectory() as temp_dir:
+
+        def analyze(index: int, window: Tuple[float, float]) -> Commentary:
+            start, end = window
+            window_path = Path(temp_dir) / f"window_{index:03d}{source_path.suffix}"
+            cut_video_window(source_path, start, end, window_path)
+            commentary = generate_commentary(
+                window_path,
+                prompt_path,
+                api_key,
+                model=model,
+                fps=fps,
+                inline_max_bytes=inline_max_bytes,
+                client=client,
+                structured_output=structured_output,
+                allow_empty=True,
+            )
+            print(
+                f"Analyzed window {index + 1}/{len(windows)} "
+                f"({seconds_to_timestamp(start)}-{seconds_to_timestamp(end)}): {len(commentary.events)} events"
+            )
+            return commentary
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = [executor.submit(analyze, index, window) for index, window in enumerate(windows)]
+            commentaries = [future.result() for future in futures]
+
+    commentary = merge_window_commentaries(windows, commentaries, overlap_seconds)
+    if cache and cache_key:
+        cache.put(cache_key, commentary)
+    return commentary
+
+
+@METRICS.traced("analysis.extract_payload")
+def extract_commentary_payload(response: Any) -> Dict[str, Any]:
+    attempted_texts: List[str] = []
+    candidates = getattr(response, "candidates", None) or []
+    for candidate in candidates:
+        content = getattr(candidate, "content", None)
+        parts = getattr(content, "parts", None) if content else None
+        for part in parts or []:
+            text = getattr(part, "text", None)
+            if not isinstance(text, str):
+                continue
+            attempted_texts.append(text)
+            parsed = try_parse_commentary_text(text)
+            if parsed is not None:
+                return parsed
+
+    text = getattr(response, "text", None)
+    if isinstance(text, str):
+        attempted_texts.append(text)
+        parsed = try_parse_commentary_text(text)
+        if parsed is not None:
+            return parsed
+
+    for attempted_text in attempted_texts:
+        recovered = recover_commentary_payload(attempted_text)
+        if recovered is not None:
+            return report_recovered_payload(*recovered)
+
+    snippet = ""
+    if attempted_texts:
+        sample = attempted_texts[0].strip().replace("\n", " ")
+        snippet = f" First candidate text snippet: {sample[:200]}..."
+    raise ValueError(f"Gemini response did not contain valid JSON commentary.{snippet}")
+
+
+def report_recovered_payload(payload: Dict[str, Any], dropped: int) -> Dict[str, Any]:
+    recovered = len(payload["events"])
+    METRICS.annotate(recovered_events=recovered, dropped_events=dropped)
+    print(f"Warning: Gemini returned malformed JSON; recovered {recovered} events and dropped {dropped}.")
+    return payload
+
+
+def try_parse_commentary_text(text: str) -> Optional[Dict[str, Any]]:
+    stripped = text.strip()
+    if not stripped:
+        return None
+
+    if stripped.startswith("```"):
+        stripped = strip_code_fence(stripped)
+
+    for candidate in generate_json_candidates(stripped):
+        try:
+            return json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def generate_json_candidates(text: str) -> Iterable[str]:
+    yield text
+    start = text.find("{")
+    end = text.rfind("}")
+    if 0 <= start < end:
+        yield text[start : end + 1]
+
+
+def strip_code_fence(text: str) -> str:
+    lines = text.splitlines()
+    if not lines:
+        return text
+
+    start = 0
+    end = len(lines)
+
+    if lines and lines[0].startswith("```"):
+        start = 1
+    if len(lines) > 1 and lines[-1].startswith("```"):
+        end = len(lines) - 1
+
+    return "\n".join(lines[start:end]).strip()
@@ -0,0 +1,455 @@
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, List, Optional, Set
+
+from elevenlabs import ElevenLabs  # type: ignore
+from google import genai
+
+from main import (
+    BASE_DIR,
+    DEFAULT_ALIGN_MIN_SALIENCE,
+    DEFAULT_ALIGN_WINDOW_SECONDS,
+    DEFAULT_ANALYSIS_CACHE_TTL_HOURS,
+    DEFAULT_ANALYSIS_FPS,
+    DEFAULT_CLIP_STORE_MEMORY_MB,
+    DEFAULT_DUCK_ATTACK_SECONDS,
+    DEFAULT_DUCK_IDLE_VOLUME,
+    DEFAULT_DUCK_RELEASE_SECONDS,
+    DEFAULT_FADE_OUT_SECONDS,
+    DEFAULT_GEMINI_MODEL,
+    DEFAULT_INLINE_VIDEO_MAX_MB,
+    DEFAULT_MIX_ENGINE,
+    DEFAULT_PROMPT_PATH,
+    DEFAULT_PROXY_SHORT_SIDE,
+    DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS,
+    DEFAULT_TTS_BATCH_LINES,
+    DEFAULT_TTS_CACHE_MAX_AGE_DAYS,
+    DEFAULT_TTS_CACHE_MAX_MB,
+    DEFAULT_TTS_CONCURRENCY,
+    DEFAULT_TTS_MAX_RETRIES,
+    METRICS,
+    MIX_ENGINES,
+    PROJECT_ROOT,
+    AnalysisCache,
+    ClipSynthesizer,
+    TTSCache,
+    align_commentary,
+    alignment_policy_from_args,
+    alignment_scene_path,
+    analysis_proxy_from_args,
+    build_voice_map,
+    clip_store_from_args,
+    scheduled_events,
+    ducking_policy_from_args,
+    generate_commentary,
+    group_events_by_voice,
+    load_env_files,
+    mix_commentary_with_video,
+    schedule_policy_from_args,
+    write_commentary_json,
+)
+
+
+DEFAULT_ANALYSIS_WORKERS = 2
+DEFAULT_MIX_WORKERS = 2
+
+
+@dataclass
+class BatchJob:
+    job_id: str
+    video: Path
+    prompt: Path
+    output: Optional[Path]
+    voice_id: str
+    voice2_id: Optional[str]
+    commentary_json: Optional[Path] = None
+    clips_dir: Optional[Path] = None
+    background_volume: float = 0.45
+    commentary_volume: float = 1.0
+    stability: float = 0.5
+    similarity: float = 0.65
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any], base_dir: Path, defaults: argparse.Namespace) -> "BatchJob":
+        def optional_path(key: str) -> Optional[Path]:
+            value = payload.get(key)
+            if not isinstance(value, str) or not value.strip():
+                return None
+            path = Path(value.strip()).expanduser()
+            return path if path.is_absolute() else base_dir / path
+
+        video = optional_path("video")
+        if video is None:
+            raise ValueError("Manifest job missing string `video`.")
+        output = optional_path("output")
+        skip_video = bool(payload.get("skip_video"))
+        if output is None and not skip_video:
+            raise ValueError(f"Manifest job for {video} missing string `output`.")
+        clips_dir = optional_path("clips_dir")
+        if skip_video and clips_dir is None:
+            raise ValueError(f"Manifest job for {video} sets `skip_video` without `clips_dir`.")
+
+        voice_id = payload.get("voice_id") or defaults.voice_id
+        if not voice_id:
+            raise ValueError(f"Manifest job for {video} has no `voice_id` and no default voice is configured.")
+
+        job_id = payload.get("id")
+        if not isinstance(job_id, str) or not job_id.strip():
+            job_id = str(output or clips_dir)
+
+        return cls(
+            job_id=job_id.strip(),
+            video=video,
+            prompt=optional_path("prompt") or defaults.prompt,
+            output=None if skip_video else output,
+            voice_id=voice_id,
+            voice2_id=payload.get("voice2_id") or defaults.voice2_id,
+            commentary_json=optional_path("commentary_json"),
+            clips_dir=clips_dir,
+            background_volume=float(payload.get("background_volume", defaults.background_volume)),
+            commentary_volume=float(payload.get("commentary_volume", defaults.commentary_volume)),
+            stability=float(payload.get("stability", defaults.stability)),
+            similarity=float(payload.get("similarity", defaults.similarity)),
+        )
+
+
+def load_manifest(path: Path, defaults: argparse.Namespace) -> List[BatchJob]:
+    jobs: List[BatchJob] = []
+    seen_ids: Set[str] = set()
+    for line_number, line in enumerate(path.read_text().splitlines(), start=1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        try:
+            job = BatchJob.from_dict(json.loads(line), path.parent, defaults)
+        except (json.JSONDecodeError, ValueError) as error:
+            raise ValueError(f"{path}:{line_number}: {error}") from error
+        if job.job_id in seen_ids:
+            raise ValueError(f"{path}:{line_number}: duplicate job id `{job.job_id}`.")
+        seen_ids.add(job.job_id)
+        jobs.append(job)
+    return jobs
+
+
+def load_completed_job_ids(results_path: Path) -> Set[str]:
+    completed: Set[str] = set()
+    if not results_path.exists():
+        return completed
+    for line in results_path.read_text().splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # A crash can leave a truncated final line behind.
+            continue
+        if isinstance(record, dict) and record.get("status") == "succeeded":
+            completed.add(str(record.get("id")))
+    return completed
+
+
+class ResultsWriter:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with self.path.open("a") as handle:
+                handle.write(line)
+                handle.flush()
+                os.fsync(handle.fileno())
+
+
+class BatchRunner:
+    # Each job moves through analysis, synthesis and mixing on separate bounded pools;
+    # several jobs are in flight at once so a slow stage never idles the others.
+
+    def __init__(self, args: argparse.Namespace, gemini_api_key: str, eleven_api_key: str) -> None:
+        self.args = args
+        self.gemini_api_key = gemini_api_key
+        self.eleven_api_key = eleven_api_key
+        self.gemini_client = genai.Client(api_key=gemini_api_key)
+        self.eleven_client = ElevenLabs(api_key=eleven_api_key)
+        self.analysis_pool = ThreadPoolExecutor(max_workers=max(1, args.analysis_workers), thread_name_prefix="analysis")
+        self.tts_pool = ThreadPoolExecutor(max_workers=max(1, args.tts_workers), thread_name_prefix="tts")
+        self.mix_pool = ThreadPoolExecutor(max_workers=max(1, args.mix_workers), thread_name_prefix="mix")
+        self.max_active_jobs = max(1, args.max_active_jobs or args.analysis_workers + args.tts_workers + args.mix_workers)
+
+        self.analysis_cache: Optional[AnalysisCache] = None
+        if args.analysis_cache_dir:
+            self.analysis_cache = AnalysisCache(
+                Path(args.analysis_cache_dir),
+                ttl_seconds=args.analysis_cache_ttl_hours * 3600,
+            )
+        self.tts_cache: Optional[TTSCache] = None
+        if args.tts_cache_dir:
+            self.tts_cache = TTSCache(
+                Path(args.tts_cache_dir),
+                max_bytes=int(args.tts_cache_max_mb * 1024 * 1024),
+                max_age_seconds=args.tts_cache_max_age_days * 86400,
+            )
+
+    def close(self) -> None:
+        self.analysis_pool.shutdown()
+        self.tts_pool.shutdown()
+        self.mix_pool.shutdown()
+
+    @METRICS.traced("batch.job")
+    def run_job(self, job: BatchJob) -> Dict[str, Any]:
+        METRICS.annotate(job_id=job.job_id)
+        started = time.perf_counter()
+        record: Dict[str, Any] = {
+            "id": job.job_id,
+            "video": str(job.video),
+            "output": str(job.output) if job.output else None,
+        }
+        try:
+            record.update(self._run_stages(job))
+            record["status"] = "succeeded"
+        except Exception as error:
+            record["status"] = "failed"
+            record["error"] = f"{type(error).__name__}: {error}"
+        record["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        record["finished_at"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        return record
+
+    def _run_stages(self, job: BatchJob) -> Dict[str, Any]:
+        args = self.args
+        commentary = self.analysis_pool.submit(
+            generate_commentary,
+            job.video,
+            job.prompt,
+            self.gemini_api_key,
+            model=args.gemini_model,
+            fps=args.analysis_fps,
+            cache=self.analysis_cache,
+            bypass_cache=args.refresh_analysis,
+            inline_max_bytes=int(args.inline_max_mb * 1024 * 1024),
+            client=self.gemini_client,
+            proxy=analysis_proxy_from_args(args),
+            structured_output=not args.no_structured_output,
+        ).result()
+        alignment = alignment_policy_from_args(args)
+        if alignment:
+            commentary = align_commentary(
+                job.video, commentary, alignment, scene_path=alignment_scene_path(args, job.video)
+            )
+        write_commentary_json(job.commentary_json, commentary)
+
+        temp_clip_dir: Optional[TemporaryDirectory[str]] = None
+        clips_dir = job.clips_dir
+        if not clips_dir:
+            temp_clip_dir = TemporaryDirectory()
+            clips_dir = Path(temp_clip_dir.name)
+
+        clip_store = clip_store_from_args(args, mixing=job.output is not None)
+        try:
+            synthesizer = ClipSynthesizer(
+                self.eleven_api_key,
+                build_voice_map(job.voice_id, job.voice2_id or job.voice_id),
+                args.model_id,
+                clips_dir,
+                stability=job.stability,
+                similarity_boost=job.similarity,
+                output_format=args.output_format,
+                use_speaker_boost=not args.disable_speaker_boost,
+                requests_per_second=args.tts_rate_limit,
+                max_retries=args.tts_max_retries,
+                cache=self.tts_cache,
+                client=self.eleven_client,
+                clip_store=clip_store,
+                write_clips=job.clips_dir is not None,
+            )
+            schedule = schedule_policy_from_args(args)
+            events, numbers = scheduled_events(commentary.events, schedule if job.output else None)
+            groups = group_events_by_voice(events, synthesizer.voice_map, max(1, args.tts_batch_lines))
+            futures = [
+                self.tts_pool.submit(
+                    synthesizer.synthesize_group,
+                    [(numbers[index], events[index]) for index in group],
+                    len(commentary.events),
+                )
+                for group in groups
+            ]
+            clip_paths = [clip_path for future in futures for clip_path in future.result()]
+
+            if job.output:
+                job.output.parent.mkdir(parents=True, exist_ok=True)
+                self.mix_pool.submit(
+                    mix_commentary_with_video,
+                    job.video,
+                    clip_paths,
+                    events,
+                    job.output,
+                    background_volume=job.background_volume,
+                    commentary_volume=job.commentary_volume,
+                    engine=args.mix_engine,
+                    schedule=schedule,
+                    ducking=ducking_policy_from_args(args),
+                    loudness_target=args.loudness_target,
+                    clip_store=clip_store,
+                ).result()
+        finally:
+            if clip_store:
+                clip_store.close()
+            if temp_clip_dir:
+                temp_clip_dir.cleanup()
+
+        return {"events": len(commentary.events), "scheduled_events": len(events)}
+
+    def run(self, jobs: List[BatchJob], results: ResultsWriter) -> int:
+        failures = 0
+        with ThreadPoolExecutor(max_workers=self.max_active_jobs, thread_name_prefix="job") as job_pool:
+            futures = {job_pool.submit(self.run_job, job): job for job in jobs}
+            # Records are written as jobs finish so a crash never loses a finished job
+            # that happens to sit behind a slower one in the manifest.
+            for future in as_completed(futures):
+                job = futures[future]
+                record = future.result()
+                results.write(record)
+                if record["status"] != "succeeded":
+                    failures += 1
+                    print(f"[{job.job_id}] failed: {record['error']}")
+                else:
+                    print(f"[{job.job_id}] finished in {record['elapsed_seconds']:.1f}s")
+        if self.tts_cache:
+            self.tts_cache.evict()
+        return failures
+
+
+def add_runner_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--analysis-workers", type=int, default=DEFAULT_ANALYSIS_WORKERS, help="Concurrent Gemini analyses.")
+    parser.add_argument("--tts-workers", type=int, default=DEFAULT_TTS_CONCURRENCY, help="Concurrent ElevenLabs requests across all jobs.")
+    parser.add_argument("--mix-workers", type=int, default=DEFAULT_MIX_WORKERS, help="Concurrent mixing and muxing jobs.")
+    parser.add_argument(
+        "--max-active-jobs",
+        type=int,
+        help="Jobs in flight at once (defaults to the sum of the stage workers).",
+    )
+    parser.add_argument("--prompt", type=Path, default=DEFAULT_PROMPT_PATH, help="Default prompt file for jobs without one.")
+    parser.add_argument("--voice-id", type=str, default=os.getenv("ELEVENLABS_VOICE_ID"), help="Default ElevenLabs voice ID.")
+    parser.add_argument("--voice2-id", type=str, default=os.getenv("ELEVENLABS_VOICE2_ID"), help="Default analyst voice ID.")
+    parser.add_argument("--background-volume", type=float, default=0.45, help="Default mix volume for the original audio.")
+    parser.add_argument("--commentary-volume", type=float, default=1.0, help="Default mix volume for commentary.")
+    parser.add_argument("--stability", type=float, default=0.5, help="Default ElevenLabs stability parameter.")
+    parser.add_argument("--similarity", type=float, default=0.65, help="Default ElevenLabs similarity boost parameter.")
+    parser.add_argument("--model-id", type=str, default=os.getenv("ELEVENLABS_MODEL", "eleven_v3"), help="ElevenLabs TTS model ID.")
+    parser.add_argument("--output-format", type=str, default="mp3_44100_128", help="ElevenLabs audio output format.")
+    parser.add_argument("--disable-speaker-boost", action="store_true", help="Disable ElevenLabs speaker boost.")
+    parser.add_argument("--tts-rate-limit", type=float, default=0.0, help="Maximum ElevenLabs requests started per second.")
+    parser.add_argument("--tts-max-retries", type=int, default=DEFAULT_TTS_MAX_RETRIES, help="Retries on HTTP 429.")
+    parser.add_argument(
+        "--clip-store-memory-mb",
+        type=float,
+        default=DEFAULT_CLIP_STORE_MEMORY_MB,
+        help="In-memory clip audio limit for pcm_* output formats.",
+    )
+    parser.add_argument("--clip-store-spill-dir", type=Path, help="Directory for the clip spill file.")
+    parser.add_argument(
+        "--tts-batch-lines",
+        type=int,
+        default=DEFAULT_TTS_BATCH_LINES,
+        help="Consecutive same-voice lines per ElevenLabs request.",
+    )
+    parser.add_argument("--tts-cache-dir", type=Path, default=os.getenv("TTS_CACHE_DIR"), help="Synthesized-clip cache directory.")
+    parser.add_argument("--tts-cache-max-mb", type=float, default=DEFAULT_TTS_CACHE_MAX_MB, help="TTS cache size limit.")
+    parser.add_argument("--tts-cache-max-age-days", type=float, default=DEFAULT_TTS_CACHE_MAX_AGE_DAYS, help="TTS cache age limit.")
+    parser.add_argument("--gemini-model", type=str, default=DEFAULT_GEMINI_MODEL, help="Gemini model to use.")
+    parser.add_argument("--analysis-fps", type=float, default=DEFAULT_ANALYSIS_FPS, help="Frame sampling rate for analysis.")
+    parser.add_argument("--analysis-cache-dir", type=Path, default=os.getenv("ANALYSIS_CACHE_DIR"), help="Commentary cache directory.")
+    parser.add_argument("--analysis-cache-ttl-hours", type=float, default=DEFAULT_ANALYSIS_CACHE_TTL_HOURS, help="Commentary cache TTL.")
+    parser.add_argument("--refresh-analysis", action="store_true", help="Bypass cached commentary.")
+    parser.add_argument("--inline-max-mb", type=float, default=DEFAULT_INLINE_VIDEO_MAX_MB, help="Inline request size limit, after base64 encoding.")
+    parser.add_argument("--no-analysis-proxy", action="store_true", help="Send original videos to Gemini.")
+    parser.add_argument("--proxy-short-side", type=int, default=DEFAULT_PROXY_SHORT_SIDE, help="Analysis proxy short side.")
+    parser.add_argument("--proxy-dir", type=Path, default=os.getenv("ANALYSIS_PROXY_DIR"), help="Analysis proxy directory.")
+    parser.add_argument("--proxy-no-audio", action="store_true", help="Drop audio from analysis proxies.")
+    parser.add_argument("--no-structured-output", action="store_true", help="Do not request a Gemini response schema.")
+    parser.add_argument("--mix-engine", choices=MIX_ENGINES, default=DEFAULT_MIX_ENGINE, help="Audio mixing engine.")
+    parser.add_argument("--schedule", action="store_true", help="Resolve overlapping lines with real clip durations.")
+    parser.add_argument(
+        "--schedule-max-shift",
+        type=float,
+        default=DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS,
+        help="Largest delay applied to a line to avoid an overlap.",
+    )
+    parser.add_argument("--schedule-fade", type=float, default=DEFAULT_FADE_OUT_SECONDS, help="Fade-out for cut lines.")
+    parser.add_argument(
+        "--schedule-drop-analyst",
+        action="store_true",
+        help="With --schedule, drop analyst lines that collide with play-by-play.",
+    )
+    parser.add_argument("--duck", action="store_true", help="Duck the original audio under commentary.")
+    parser.add_argument("--duck-idle-volume", type=float, default=DEFAULT_DUCK_IDLE_VOLUME, help="Background volume between lines.")
+    parser.add_argument("--duck-attack", type=float, default=DEFAULT_DUCK_ATTACK_SECONDS, help="Ducking attack in seconds.")
+    parser.add_argument("--duck-release", type=float, default=DEFAULT_DUCK_RELEASE_SECONDS, help="Ducking release in seconds.")
+    parser.add_argument("--loudness-target", type=float, help="EBU R128 integrated loudness target in LUFS.")
+    parser.add_argument("--align-events", action="store_true", help="Snap event timestamps to nearby onsets and cuts.")
+    parser.add_argument("--align-window", type=float, default=DEFAULT_ALIGN_WINDOW_SECONDS, help="Largest alignment shift in seconds.")
+    parser.add_argument(
+        "--align-min-salience",
+        type=float,
+        default=DEFAULT_ALIGN_MIN_SALIENCE,
+        help="Minimum onset/cut strength (0-1) needed to move an event.",
+    )
+    parser.add_argument("--align-no-scene", action="store_true", help="Align on the audio track only.")
+    parser.add_argument("--metrics-json", type=Path, help="Write per-stage timings, bytes and peak RSS as JSON.")
+    parser.add_argument("--metrics-otlp", type=Path, help="Write recorded spans as OpenTelemetry OTLP/JSON.")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate narrated videos for every job in a JSONL manifest.")
+    parser.add_argument("manifest", type=Path, help="JSONL manifest with one job per line.")
+    parser.add_argument(
+        "--results",
+        type=Path,
+        help="JSONL file receiving one status record per job (defaults to <manifest>.results.jsonl).",
+    )
+    parser.add_argument("--no-resume", action="store_true", help="Re-run jobs that already succeeded in --results.")
+    add_runner_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    load_env_files([PROJECT_ROOT / ".env.local", BASE_DIR / ".env"])
+    args = parse_args()
+
+    gemini_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not gemini_api_key:
+        raise RuntimeError("Set GEMINI_API_KEY or GOOGLE_API_KEY for Gemini access.")
+
+    eleven_api_key = os.getenv("ELEVENLABS_API_KEY")
+    if not eleven_api_key:
+        raise RuntimeError("Set ELEVENLABS_API_KEY for ElevenLabs access.")
+
+    jobs = load_manifest(args.manifest, args)
+    results_path = args.results or args.manifest.with_suffix(".results.jsonl")
+    if not args.no_resume:
+        completed = load_completed_job_ids(results_path)
+        skipped = [job for job in jobs if job.job_id in completed]
+        jobs = [job for job in jobs if job.job_id not in completed]
+        if skipped:
+            print(f"Resuming: skipping {len(skipped)} jobs already recorded as succeeded in {results_path}")
+
+    print(f"Running {len(jobs)} jobs")
+    runner = BatchRunner(args, gemini_api_key, eleven_api_key)
+    try:
+        failures = runner.run(jobs, ResultsWriter(results_path))
+    finally:
+        runner.close()
+        METRICS.write_reports(args.metrics_json, args.metrics_otlp)
+
+    print(f"Finished {len(jobs) - failures}/{len(jobs)} jobs; results in {results_path}")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
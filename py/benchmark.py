@@ -0,0 +1,473 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+import elevenlabs  # type: ignore
+from google import genai
+from google.genai import types
+
+import main
+from main import (
+    BASE_DIR,
+    DEFAULT_PROMPT_PATH,
+    MIX_ENGINES,
+    Commentary,
+    build_voice_map,
+    compute_interrupt_cutoffs,
+    mix_commentary_with_video,
+    peak_rss_bytes,
+    run_ffmpeg,
+    seconds_to_timestamp,
+    synthesize_events_to_disk,
+)
+
+
+DEFAULT_VIDEO_LENGTHS = "5,60,300"
+DEFAULT_EVENTS_PER_MINUTE = 12.0
+DEFAULT_TTS_LATENCY_SECONDS = 0.25
+DEFAULT_GEMINI_LATENCY_SECONDS = 1.0
+DEFAULT_CLIP_SECONDS = 2.0
+STREAM_CHUNK_CHARS = 64
+TTS_CHUNK_BYTES = 4096
+DEFAULT_STARTUP_RUNS = 7
+STARTUP_COMMANDS: Dict[str, List[str]] = {
+    "interpreter": ["-c", "pass"],
+    "help": ["main.py", "--help"],
+    "import_main": ["-c", "import main"],
+    "import_analysis": ["-c", "import analysis"],
+    "import_synthesis": ["-c", "import synthesis"],
+    "import_mixing": ["-c", "import mixing"],
+}
+
+
+def build_commentary_payload(duration: float, event_count: int) -> Dict[str, Any]:
+    events: List[Dict[str, str]] = []
+    spacing = max(duration, 1.0) / max(event_count, 1)
+    for index in range(event_count):
+        event: Dict[str, str] = {
+            "timestamp": seconds_to_timestamp(int(index * spacing)),
+            "commentator": "playByPlay" if index % 2 == 0 else "analyst",
+            "call": f"Benchmark call number {index + 1}, what a play that was!",
+            "context": "Synthetic benchmark event.",
+        }
+        if index % 5 == 4:
+            event["interrupts"] = "playByPlay"
+        events.append(event)
+    return {
+        "matchSummary": f"Synthetic {duration:.0f}s benchmark match.",
+        "commentators": {"playByPlay": "Bench Caller", "analyst": "Bench Analyst"},
+        "events": events,
+    }
+
+
+class FakeResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=text)]))]
+
+
+class FakeModels:
+    def __init__(self, payload: Dict[str, Any], latency: float) -> None:
+        self.payload = payload
+        self.latency = latency
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> FakeResponse:
+        time.sleep(self.latency)
+        return FakeResponse("```json\n" + json.dumps(self.payload, indent=2) + "\n```")
+
+    def generate_content_stream(self, model: str, contents: Any, config: Any = None) -> Iterator[SimpleNamespace]:
+        text = "```json\n" + json.dumps(self.payload, indent=2) + "\n```"
+        chunks = [text[index : index + STREAM_CHUNK_CHARS] for index in range(0, len(text), STREAM_CHUNK_CHARS)]
+        # Spread the same total latency across the stream so pipelining has something to overlap.
+        delay = self.latency / max(len(chunks), 1)
+        for chunk in chunks:
+            time.sleep(delay)
+            yield SimpleNamespace(text=chunk)
+
+
+class FakeFiles:
+    def upload(self, file: Any, config: Any = None) -> Any:
+        return types.File(
+            name="files/benchmark",
+            uri="https://example.invalid/files/benchmark",
+            mime_type=config.mime_type,
+            state=types.FileState.ACTIVE,
+        )
+
+    def get(self, name: str) -> Any:
+        return types.File(
+            name=name,
+            uri="https://example.invalid/files/benchmark",
+            state=types.FileState.ACTIVE,
+        )
+
+    def delete(self, name: str) -> None:
+        return None
+
+
+class FakeGenaiClient:
+    payload: Dict[str, Any] = {}
+    latency = DEFAULT_GEMINI_LATENCY_SECONDS
+
+    def __init__(self, api_key: Optional[str] = None, **_: Any) -> None:
+        self.models = FakeModels(self.payload, self.latency)
+        self.files = FakeFiles()
+
+
+class FakeTextToSpeech:
+    def __init__(self, audio: bytes, latency: float) -> None:
+        self.audio = audio
+        self.latency = latency
+
+    def convert(self, voice_id: str, text: str, **_: Any) -> Iterator[bytes]:
+        def stream() -> Iterator[bytes]:
+            time.sleep(self.latency)
+            for index in range(0, len(self.audio), TTS_CHUNK_BYTES):
+                yield self.audio[index : index + TTS_CHUNK_BYTES]
+
+        return stream()
+
+
+class FakeElevenLabs:
+    audio = b""
+    latency = DEFAULT_TTS_LATENCY_SECONDS
+
+    def __init__(self, api_key: Optional[str] = None, **_: Any) -> None:
+        self.text_to_speech = FakeTextToSpeech(self.audio, self.latency)
+
+
+def install_fakes(payload: Dict[str, Any], clip_audio: bytes, gemini_latency: float, tts_latency: float) -> None:
+    FakeGenaiClient.payload = payload
+    FakeGenaiClient.latency = gemini_latency
+    FakeElevenLabs.audio = clip_audio
+    FakeElevenLabs.latency = tts_latency
+    # The stage modules import the SDKs lazily, so the stand-ins replace the SDK attributes.
+    genai.Client = FakeGenaiClient  # type: ignore[misc]
+    elevenlabs.ElevenLabs = FakeElevenLabs
+
+
+def generate_test_video(path: Path, duration: float) -> None:
+    run_ffmpeg(
+        [
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc=size=640x360:rate=30:duration={duration}",
+            "-f",
+            "lavfi",
+            "-i",
+            f"anoisesrc=color=pink:amplitude=0.2:duration={duration}",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "ultrafast",
+            "-c:a",
+            "aac",
+            "-shortest",
+            str(path),
+        ]
+    )
+
+
+def generate_clip_audio(path: Path, clip_seconds: float) -> bytes:
+    run_ffmpeg(
+        [
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"sine=frequency=440:duration={clip_seconds}",
+            "-ac",
+            "1",
+            "-ar",
+            "44100",
+            "-b:a",
+            "128k",
+            str(path),
+        ]
+    )
+    return path.read_bytes()
+
+
+def time_repeated(func: Callable[[], Any], min_seconds: float = 0.5) -> Dict[str, float]:
+    iterations = 0
+    started = time.perf_counter()
+    while True:
+        func()
+        iterations += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            break
+    return {"iterations": iterations, "seconds": elapsed, "per_iteration_seconds": elapsed / iterations}
+
+
+def bench_parsing(case: Dict[str, Any]) -> Dict[str, Any]:
+    payload = build_commentary_payload(case["video_seconds"], case["events"])
+    commentary = Commentary.from_dict(payload)
+    return {
+        "from_dict": time_repeated(lambda: Commentary.from_dict(payload)),
+        "compute_interrupt_cutoffs": time_repeated(lambda: compute_interrupt_cutoffs(commentary.events)),
+    }
+
+
+def bench_synthesis(case: Dict[str, Any]) -> Dict[str, Any]:
+    payload = build_commentary_payload(case["video_seconds"], case["events"])
+    commentary = Commentary.from_dict(payload)
+    with TemporaryDirectory() as clips_dir:
+        started = time.perf_counter()
+        synthesize_events_to_disk(
+            commentary.events,
+            "benchmark",
+            build_voice_map("voice-a", "voice-b"),
+            "benchmark-model",
+            Path(clips_dir),
+            concurrency=case["tts_concurrency"],
+        )
+        elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "clips_per_second": len(commentary.events) / elapsed}
+
+
+def bench_mix(case: Dict[str, Any]) -> Dict[str, Any]:
+    payload = build_commentary_payload(case["video_seconds"], case["events"])
+    commentary = Commentary.from_dict(payload)
+    clip_audio = Path(case["clip_path"]).read_bytes()
+    with TemporaryDirectory() as work_dir:
+        clip_paths = []
+        for index in range(len(commentary.events)):
+            clip_path = Path(work_dir) / f"event_{index + 1:02d}.mp3"
+            clip_path.write_bytes(clip_audio)
+            clip_paths.append(clip_path)
+        started = time.perf_counter()
+        mix_commentary_with_video(
+            Path(case["video_path"]),
+            clip_paths,
+            commentary.events,
+            Path(work_dir) / "mixed.mp4",
+            engine=case["engine"],
+        )
+        elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "realtime_factor": case["video_seconds"] / elapsed}
+
+
+def bench_pipeline(case: Dict[str, Any]) -> Dict[str, Any]:
+    with TemporaryDirectory() as work_dir:
+        argv = [
+            "--video",
+            case["video_path"],
+            "--prompt",
+            str(DEFAULT_PROMPT_PATH),
+            "--output",
+            str(Path(work_dir) / "narrated.mp4"),
+            "--voice-id",
+            "voice-a",
+            "--voice2-id",
+            "voice-b",
+            "--tts-concurrency",
+            str(case["tts_concurrency"]),
+            "--mix-engine",
+            case["engine"],
+        ]
+        if case.get("pipelined"):
+            argv.append("--pipelined")
+        args = main.parse_args(argv)
+        started = time.perf_counter()
+        with main.METRICS.span("pipeline", root=True):
+            main.run_from_args(args, "benchmark", "benchmark")
+        elapsed = time.perf_counter() - started
+    return {
+        "seconds": elapsed,
+        "realtime_factor": case["video_seconds"] / elapsed,
+        "stages": main.METRICS.stage_summary(),
+    }
+
+
+def bench_startup(case: Dict[str, Any]) -> Dict[str, Any]:
+    commands: Dict[str, Dict[str, float]] = {}
+    for label, command in STARTUP_COMMANDS.items():
+        timings: List[float] = []
+        for _ in range(case["startup_runs"]):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, *command], cwd=BASE_DIR, stdout=subprocess.DEVNULL, check=True)
+            timings.append(time.perf_counter() - started)
+        commands[label] = {"median_seconds": statistics.median(timings), "min_seconds": min(timings)}
+    return {"seconds": commands["help"]["median_seconds"], "commands": commands}
+
+
+BENCHMARKS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "startup": bench_startup,
+    "parsing": bench_parsing,
+    "synthesis": bench_synthesis,
+    "mix": bench_mix,
+    "pipeline": bench_pipeline,
+}
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    payload = build_commentary_payload(case["video_seconds"], case["events"])
+    install_fakes(
+        payload,
+        Path(case["clip_path"]).read_bytes(),
+        case["gemini_latency"],
+        case["tts_latency"],
+    )
+    result = BENCHMARKS[case["benchmark"]](case)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def run_case_isolated(case: Dict[str, Any]) -> Dict[str, Any]:
+    # A fresh interpreter per case keeps peak RSS attributable to that case alone.
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(run_case, (case,))
+
+
+def git_revision() -> Optional[str]:
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    return result.stdout.strip() if result.returncode == 0 else None
+
+
+def print_comparison(results: Sequence[Dict[str, Any]], baseline_path: Path) -> None:
+    baseline = json.loads(baseline_path.read_text())
+    baseline_by_name = {result["name"]: result for result in baseline.get("results", [])}
+    print(f"Comparison against {baseline_path} ({baseline.get('revision') or 'unknown revision'}):")
+    for result in results:
+        previous = baseline_by_name.get(result["name"])
+        seconds = result["result"].get("seconds")
+        if not previous or seconds is None or previous["result"].get("seconds") is None:
+            continue
+        before = previous["result"]["seconds"]
+        change = (seconds - before) / before * 100 if before else 0.0
+        print(f"  {result['name']}: {before:.3f}s -> {seconds:.3f}s ({change:+.1f}%)")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the commentary pipeline offline with local API stand-ins.")
+    parser.add_argument("--output", type=Path, default=BASE_DIR / "benchmark-results.json", help="Where to write results JSON.")
+    parser.add_argument("--compare", type=Path, help="Previous results JSON to compare timings against.")
+    parser.add_argument(
+        "--video-lengths",
+        type=str,
+        default=DEFAULT_VIDEO_LENGTHS,
+        help="Comma-separated lengths in seconds of generated test videos.",
+    )
+    parser.add_argument("--source-video", type=Path, default=BASE_DIR / "video.MOV", help="Real video to include as a case.")
+    parser.add_argument("--events-per-minute", type=float, default=DEFAULT_EVENTS_PER_MINUTE, help="Canned events per minute of video.")
+    parser.add_argument("--tts-latency", type=float, default=DEFAULT_TTS_LATENCY_SECONDS, help="Fake ElevenLabs time to first byte.")
+    parser.add_argument("--gemini-latency", type=float, default=DEFAULT_GEMINI_LATENCY_SECONDS, help="Fake Gemini response time.")
+    parser.add_argument("--clip-seconds", type=float, default=DEFAULT_CLIP_SECONDS, help="Length of the synthetic MP3 clips.")
+    parser.add_argument("--tts-concurrency", type=int, default=main.DEFAULT_TTS_CONCURRENCY, help="TTS concurrency to benchmark.")
+    parser.add_argument("--startup-runs", type=int, default=DEFAULT_STARTUP_RUNS, help="Runs per startup-time command.")
+    parser.add_argument(
+        "--benchmarks",
+        type=str,
+        default=",".join(BENCHMARKS),
+        help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}.",
+    )
+    return parser.parse_args()
+
+
+def main_cli() -> None:
+    args = parse_args()
+    selected = [name.strip() for name in args.benchmarks.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {', '.join(unknown)}")
+
+    results: List[Dict[str, Any]] = []
+    if "startup" in selected:
+        # Each command runs in a fresh interpreter already, so this case needs no isolation.
+        case = {"benchmark": "startup", "startup_runs": args.startup_runs}
+        print("Running startup")
+        result = bench_startup(case)
+        results.append({"name": "startup", "case": case, "result": result})
+        for label, timing in result["commands"].items():
+            print(f"  {label}: {timing['median_seconds']:.3f}s median, {timing['min_seconds']:.3f}s min")
+
+    with TemporaryDirectory() as work_dir:
+        clip_path = Path(work_dir) / "clip.mp3"
+        generate_clip_audio(clip_path, args.clip_seconds)
+
+        videos: List[Dict[str, Any]] = []
+        if args.source_video and args.source_video.exists():
+            videos.append({"label": args.source_video.name, "path": args.source_video})
+        for raw_length in args.video_lengths.split(","):
+            if not raw_length.strip():
+                continue
+            length = float(raw_length)
+            video_path = Path(work_dir) / f"generated_{length:.0f}s.mp4"
+            print(f"Generating {length:.0f}s test video")
+            generate_test_video(video_path, length)
+            videos.append({"label": video_path.name, "path": video_path})
+
+        for video in videos:
+            video_seconds = main.probe_media_duration(video["path"])
+            events = max(2, int(round(video_seconds / 60 * args.events_per_minute)))
+            base_case = {
+                "video_path": str(video["path"]),
+                "video_seconds": video_seconds,
+                "events": events,
+                "clip_path": str(clip_path),
+                "tts_latency": args.tts_latency,
+                "gemini_latency": args.gemini_latency,
+                "tts_concurrency": args.tts_concurrency,
+                "engine": main.DEFAULT_MIX_ENGINE,
+            }
+            cases: List[Dict[str, Any]] = []
+            if "parsing" in selected:
+                cases.append({**base_case, "benchmark": "parsing"})
+            if "synthesis" in selected:
+                cases.append({**base_case, "benchmark": "synthesis"})
+            if "mix" in selected:
+                cases.extend({**base_case, "benchmark": "mix", "engine": engine} for engine in MIX_ENGINES)
+            if "pipeline" in selected:
+                cases.append({**base_case, "benchmark": "pipeline"})
+                cases.append({**base_case, "benchmark": "pipeline", "pipelined": True})
+
+            for case in cases:
+                name = f"{case['benchmark']}[{video['label']}"
+                if case["benchmark"] == "mix":
+                    name += f",{case['engine']}"
+                if case.get("pipelined"):
+                    name += ",pipelined"
+                name += "]"
+                print(f"Running {name} ({events} events)")
+                result = run_case_isolated(case)
+                results.append({"name": name, "case": case, "result": result})
+                if "seconds" in result:
+                    print(f"  {result['seconds']:.3f}s, peak RSS {result['peak_rss_bytes'] / 1e6:.1f} MB")
+
+    report = {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "config": {key: str(value) for key, value in vars(args).items()},
+        "results": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote benchmark results to {args.output}")
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,684 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+# Data model, defaults, metrics and ffmpeg helpers shared by the pipeline stages. Only the
+# standard library is imported here so `--help` and short jobs start quickly.
+
+__all__ = [
+    "BASE_DIR",
+    "PROJECT_ROOT",
+    "DEFAULT_PROMPT_PATH",
+    "DEFAULT_VIDEO_PATH",
+    "DEFAULT_OUTPUT_PATH",
+    "DEFAULT_GEMINI_MODEL",
+    "DEFAULT_ANALYSIS_FPS",
+    "DEFAULT_ANALYSIS_CACHE_TTL_HOURS",
+    "HASH_CHUNK_SIZE",
+    "DEFAULT_INLINE_VIDEO_MAX_MB",
+    "INLINE_REQUEST_OVERHEAD_BYTES",
+    "FILE_UPLOAD_POLL_SECONDS",
+    "FILE_UPLOAD_TIMEOUT_SECONDS",
+    "DEFAULT_SEGMENT_OVERLAP_SECONDS",
+    "DEFAULT_ANALYSIS_CONCURRENCY",
+    "DEFAULT_PROXY_SHORT_SIDE",
+    "DEFAULT_PROXY_CRF",
+    "PROXY_KEYFRAME_SECONDS",
+    "PROXY_AUDIO_SAMPLE_RATE",
+    "PROXY_AUDIO_BITRATE",
+    "TRAILING_COMMA_PATTERN",
+    "DEFAULT_TTS_CONCURRENCY",
+    "DEFAULT_TTS_MAX_RETRIES",
+    "TTS_BACKOFF_BASE_SECONDS",
+    "TTS_BACKOFF_MAX_SECONDS",
+    "DEFAULT_TTS_BATCH_LINES",
+    "TTS_BATCH_MAX_CHARS",
+    "TTS_BATCH_SEPARATOR",
+    "PCM_OUTPUT_FORMAT_PATTERN",
+    "VARIANT_NAME_PATTERN",
+    "DEFAULT_CLIP_STORE_MEMORY_MB",
+    "DEFAULT_MIX_ENGINE",
+    "MIX_ENGINES",
+    "DEFAULT_AUDIO_SAMPLE_RATE",
+    "MIX_CHANNELS",
+    "MIN_CLIP_DURATION",
+    "MIX_CHUNK_SECONDS",
+    "DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS",
+    "DEFAULT_SCHEDULE_GAP_SECONDS",
+    "DEFAULT_FADE_OUT_SECONDS",
+    "MAX_SPEECH_CHARS_PER_SECOND",
+    "DEFAULT_DUCK_ATTACK_SECONDS",
+    "DEFAULT_DUCK_RELEASE_SECONDS",
+    "DEFAULT_DUCK_IDLE_VOLUME",
+    "DUCK_BLOCK_SECONDS",
+    "DUCK_ACTIVITY_THRESHOLD",
+    "DEFAULT_LOUDNESS_TRUE_PEAK",
+    "DEFAULT_LOUDNESS_RANGE",
+    "DEFAULT_FRAGMENT_SECONDS",
+    "DEFAULT_ALIGN_WINDOW_SECONDS",
+    "DEFAULT_ALIGN_MIN_SALIENCE",
+    "DEFAULT_ALIGN_SCENE_WEIGHT",
+    "ALIGN_SAMPLE_RATE",
+    "ALIGN_HOP_SECONDS",
+    "ALIGN_ONSET_LAG_SECONDS",
+    "ALIGN_READ_SECONDS",
+    "ALIGN_SCENE_FPS",
+    "ALIGN_SCENE_WIDTH",
+    "ALIGN_SCENE_CUT_SCORE",
+    "ALIGN_RANGE_PAD_SECONDS",
+    "ALIGN_RANGED_MAX_FRACTION",
+    "DEFAULT_TTS_CACHE_MAX_MB",
+    "DEFAULT_TTS_CACHE_MAX_AGE_DAYS",
+    "CommentaryEvent",
+    "Commentary",
+    "peak_rss_bytes",
+    "Span",
+    "MetricsRecorder",
+    "METRICS",
+    "load_env_files",
+    "timestamp_to_seconds",
+    "hash_file",
+    "seconds_to_timestamp",
+    "run_ffmpeg",
+    "read_media_header",
+    "probe_media_duration",
+    "probe_audio_sample_rate",
+    "normalize_commentator_key",
+    "resolve_voice_id",
+    "build_voice_map",
+    "RunCheckpoint",
+    "write_commentary_json",
+]
+
+
+BASE_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = BASE_DIR.parent
+
+DEFAULT_PROMPT_PATH = BASE_DIR / "prompts/soccer_kids.md"
+DEFAULT_VIDEO_PATH = BASE_DIR / "box.MOV"
+DEFAULT_OUTPUT_PATH = BASE_DIR / "box-commentated.mp4"
+
+DEFAULT_GEMINI_MODEL = "models/gemini-2.5-flash"
+DEFAULT_ANALYSIS_FPS = 5
+DEFAULT_ANALYSIS_CACHE_TTL_HOURS = 24 * 7
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_INLINE_VIDEO_MAX_MB = 20
+INLINE_REQUEST_OVERHEAD_BYTES = 64 * 1024
+FILE_UPLOAD_POLL_SECONDS = 2.0
+FILE_UPLOAD_TIMEOUT_SECONDS = 600.0
+DEFAULT_SEGMENT_OVERLAP_SECONDS = 10.0
+DEFAULT_ANALYSIS_CONCURRENCY = 4
+DEFAULT_PROXY_SHORT_SIDE = 480
+DEFAULT_PROXY_CRF = 30
+PROXY_KEYFRAME_SECONDS = 2
+PROXY_AUDIO_SAMPLE_RATE = 16000
+PROXY_AUDIO_BITRATE = "32k"
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+
+DEFAULT_TTS_CONCURRENCY = 4
+DEFAULT_TTS_MAX_RETRIES = 5
+TTS_BACKOFF_BASE_SECONDS = 1.0
+TTS_BACKOFF_MAX_SECONDS = 30.0
+DEFAULT_TTS_BATCH_LINES = 1
+TTS_BATCH_MAX_CHARS = 1000
+TTS_BATCH_SEPARATOR = "\n\n"
+PCM_OUTPUT_FORMAT_PATTERN = re.compile(r"pcm_(\d+)")
+VARIANT_NAME_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+DEFAULT_CLIP_STORE_MEMORY_MB = 256.0
+
+DEFAULT_MIX_ENGINE = "numpy"
+MIX_ENGINES = ("numpy", "moviepy")
+DEFAULT_AUDIO_SAMPLE_RATE = 44100
+MIX_CHANNELS = 2
+MIN_CLIP_DURATION = 0.1
+MIX_CHUNK_SECONDS = 1.0
+DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS = 1.5
+DEFAULT_SCHEDULE_GAP_SECONDS = 0.1
+DEFAULT_FADE_OUT_SECONDS = 0.15
+# Faster than any realistic delivery, so duration estimates from it are lower bounds.
+MAX_SPEECH_CHARS_PER_SECOND = 25.0
+DEFAULT_DUCK_ATTACK_SECONDS = 0.08
+DEFAULT_DUCK_RELEASE_SECONDS = 0.5
+DEFAULT_DUCK_IDLE_VOLUME = 1.0
+DUCK_BLOCK_SECONDS = 0.01
+DUCK_ACTIVITY_THRESHOLD = 0.01
+DEFAULT_LOUDNESS_TRUE_PEAK = -1.5
+DEFAULT_LOUDNESS_RANGE = 11.0
+DEFAULT_FRAGMENT_SECONDS = 6.0
+
+DEFAULT_ALIGN_WINDOW_SECONDS = 1.5
+DEFAULT_ALIGN_MIN_SALIENCE = 0.35
+DEFAULT_ALIGN_SCENE_WEIGHT = 0.5
+ALIGN_SAMPLE_RATE = 8000
+ALIGN_HOP_SECONDS = 0.02
+ALIGN_ONSET_LAG_SECONDS = 0.1
+ALIGN_READ_SECONDS = 10.0
+ALIGN_SCENE_FPS = 10
+ALIGN_SCENE_WIDTH = 160
+ALIGN_SCENE_CUT_SCORE = 0.3
+ALIGN_RANGE_PAD_SECONDS = 0.25
+ALIGN_RANGED_MAX_FRACTION = 0.5
+
+DEFAULT_TTS_CACHE_MAX_MB = 1024
+DEFAULT_TTS_CACHE_MAX_AGE_DAYS = 30
+
+
+@dataclass
+class CommentaryEvent:
+    timestamp: str
+    commentator: str
+    call: str
+    context: str
+    interrupts: Optional[str] = None
+
+    @property
+    def start_seconds(self) -> float:
+        return timestamp_to_seconds(self.timestamp)
+
+    def to_dict(self) -> Dict[str, str]:
+        data: Dict[str, str] = {
+            "timestamp": self.timestamp,
+            "commentator": self.commentator,
+            "call": self.call,
+            "context": self.context,
+        }
+        if self.interrupts:
+            data["interrupts"] = self.interrupts
+        return data
+
+    @classmethod
+    def from_dict(cls, raw_event: Any) -> Optional["CommentaryEvent"]:
+        if not isinstance(raw_event, dict):
+            return None
+        timestamp = raw_event.get("timestamp")
+        call = raw_event.get("call")
+        context = raw_event.get("context", "")
+        commentator = raw_event.get("commentator") or raw_event.get("speaker")
+        interrupts = raw_event.get("interrupts") or raw_event.get("interrupt")
+        if not isinstance(timestamp, str) or not isinstance(call, str):
+            return None
+        commentator_key = commentator if isinstance(commentator, str) else "playByPlay"
+        commentator_key = commentator_key.strip() or "playByPlay"
+        interrupts_key = interrupts.strip() if isinstance(interrupts, str) else None
+        return cls(
+            timestamp=timestamp.strip(),
+            commentator=commentator_key,
+            call=call.strip(),
+            context=context.strip() if isinstance(context, str) else "",
+            interrupts=interrupts_key,
+        )
+
+
+@dataclass
+class Commentary:
+    match_summary: str
+    commentators: Dict[str, str]
+    events: List[CommentaryEvent]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "matchSummary": self.match_summary,
+            "commentators": self.commentators,
+            "events": [event.to_dict() for event in self.events],
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, Any], allow_empty: bool = False) -> "Commentary":
+        summary = payload.get("matchSummary")
+        if not isinstance(summary, str):
+            raise ValueError("Commentary JSON missing string `matchSummary`.")
+
+        commentators_payload = payload.get("commentators", {})
+        commentators: Dict[str, str] = {}
+        if isinstance(commentators_payload, dict):
+            for key in ("playByPlay", "analyst"):
+                value = commentators_payload.get(key)
+                if isinstance(value, str) and value.strip():
+                    commentators[key] = value.strip()
+
+        if not commentators:
+            commentators = {
+                "playByPlay": "Play-by-Play",
+                "analyst": "Analyst",
+            }
+
+        events_payload = payload.get("events")
+        if not isinstance(events_payload, Sequence):
+            raise ValueError("Commentary JSON missing `events` list.")
+
+        events: List[CommentaryEvent] = []
+        for raw_event in events_payload:
+            event = CommentaryEvent.from_dict(raw_event)
+            if event is not None:
+                events.append(event)
+
+        if not events and not allow_empty:
+            raise ValueError("Commentary JSON produced no valid events.")
+
+        events.sort(key=lambda event: event.start_seconds)
+        return cls(match_summary=summary.strip(), commentators=commentators, events=events)
+
+
+def peak_rss_bytes(who: int = resource.RUSAGE_SELF) -> int:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: Optional[str]
+    start_time: float
+    end_time: float = 0.0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+
+    @property
+    def duration(self) -> float:
+        return self.end_time - self.start_time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "spanId": self.span_id,
+            "parentId": self.parent_id,
+            "startTime": self.start_time,
+            "durationSeconds": round(self.duration, 6),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class MetricsRecorder:
+    def __init__(self, max_spans: int = 0) -> None:
+        # max_spans > 0 keeps only the most recent spans, for long-running processes.
+        self.trace_id = os.urandom(16).hex()
+        self.spans: Deque[Span] = deque(maxlen=max_spans or None)
+        self.root_span_id: Optional[str] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = []
+            self._local.stack = stack
+        return stack
+
+    @contextmanager
+    def span(self, name: str, root: bool = False, **attributes: Any) -> Iterator[Dict[str, Any]]:
+        stack = self._stack()
+        parent_id = stack[-1].span_id if stack else self.root_span_id
+        current = Span(
+            name=name,
+            span_id=os.urandom(8).hex(),
+            parent_id=parent_id,
+            start_time=time.time(),
+            attributes=dict(attributes),
+        )
+        if root:
+            self.root_span_id = current.span_id
+        stack.append(current)
+        started = time.perf_counter()
+        try:
+            yield current.attributes
+        except BaseException as error:
+            current.status = "error"
+            current.attributes["error"] = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            stack.pop()
+            current.end_time = current.start_time + (time.perf_counter() - started)
+            current.attributes["peak_rss_bytes"] = peak_rss_bytes()
+            with self._lock:
+                self.spans.append(current)
+            if root:
+                self.root_span_id = None
+
+    def limit_spans(self, max_spans: int) -> None:
+        with self._lock:
+            self.spans = deque(self.spans, maxlen=max_spans or None)
+
+    def traced(self, name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(func)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def annotate(self, **attributes: Any) -> None:
+        stack = self._stack()
+        if stack:
+            stack[-1].attributes.update(attributes)
+
+    def write_reports(self, json_path: Optional[Path], otlp_path: Optional[Path]) -> None:
+        if json_path:
+            json_path.parent.mkdir(parents=True, exist_ok=True)
+            json_path.write_text(json.dumps(self.report(), indent=2))
+        if otlp_path:
+            otlp_path.parent.mkdir(parents=True, exist_ok=True)
+            otlp_path.write_text(json.dumps(self.otlp_report(), indent=2))
+
+    def stage_summary(self) -> Dict[str, Dict[str, float]]:
+        summary: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            stage = summary.setdefault(
+                span.name,
+                {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0, "bytes": 0, "errors": 0},
+            )
+            stage["count"] += 1
+            stage["total_seconds"] = round(stage["total_seconds"] + span.duration, 6)
+            stage["max_seconds"] = round(max(stage["max_seconds"], span.duration), 6)
+            stage["bytes"] += int(span.attributes.get("bytes", 0))
+            if span.status == "error":
+                stage["errors"] += 1
+        return summary
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_time)
+        return {
+            "traceId": self.trace_id,
+            "peakRssBytes": peak_rss_bytes(),
+            "peakChildRssBytes": peak_rss_bytes(resource.RUSAGE_CHILDREN),
+            "stages": self.stage_summary(),
+            "spans": [span.to_dict() for span in spans],
+        }
+
+    def otlp_report(self, service_name: str = "sports-broadcast") -> Dict[str, Any]:
+        def attribute(key: str, value: Any) -> Dict[str, Any]:
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_time)
+        otlp_spans = []
+        for span in spans:
+            otlp_span: Dict[str, Any] = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(int(span.start_time * 1e9)),
+                "endTimeUnixNano": str(int(span.end_time * 1e9)),
+                "attributes": [attribute(key, value) for key, value in span.attributes.items()],
+                "status": {"code": 2 if span.status == "error" else 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            otlp_spans.append(otlp_span)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [attribute("service.name", service_name)]},
+                    "scopeSpans": [{"scope": {"name": "sports-broadcast"}, "spans": otlp_spans}],
+                }
+            ]
+        }
+
+
+METRICS = MetricsRecorder()
+
+
+def load_env_files(paths: Iterable[Path]) -> None:
+    for path in paths:
+        if not path.exists():
+            continue
+        for line in path.read_text().splitlines():
+            if "=" not in line or line.strip().startswith("#"):
+                continue
+            key, _, value = line.partition("=")
+            key = key.strip()
+            value = value.strip()
+            if key and key not in os.environ:
+                os.environ[key] = value
+
+
+def timestamp_to_seconds(value: str) -> float:
+    parts = value.strip().split(":")
+    if len(parts) != 2:
+        raise ValueError(f"Invalid timestamp format: {value}")
+    minutes = int(parts[0])
+    seconds = float(parts[1])
+    return minutes * 60 + seconds
+
+
+def hash_file(path: Path, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def seconds_to_timestamp(value: float) -> str:
+    value = max(0.0, value)
+    minutes = int(value // 60)
+    seconds = value - minutes * 60
+    if abs(seconds - round(seconds)) < 1e-6:
+        seconds = round(seconds)
+        if seconds == 60:
+            minutes, seconds = minutes + 1, 0
+        return f"{minutes:02d}:{int(seconds):02d}"
+    return f"{minutes:02d}:{seconds:05.2f}"
+
+
+@METRICS.traced("ffmpeg.run")
+def run_ffmpeg(args: Sequence[str]) -> subprocess.CompletedProcess:
+    METRICS.annotate(command=" ".join(args))
+    result = subprocess.run(["ffmpeg", *args], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+    return result
+
+
+@METRICS.traced("ffmpeg.probe")
+def read_media_header(path: Path) -> str:
+    # `ffmpeg -i` without an output exits non-zero but still prints the container header.
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-i", str(path)], capture_output=True, text=True)
+    return result.stderr
+
+
+def probe_media_duration(path: Path) -> float:
+    match = re.search(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)", read_media_header(path))
+    if not match:
+        raise RuntimeError(f"Could not determine duration of {path}.")
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def probe_audio_sample_rate(path: Path) -> Optional[int]:
+    match = re.search(r"Stream #\S+.*?: Audio: .*?(\d+) Hz", read_media_header(path))
+    return int(match.group(1)) if match else None
+
+
+def normalize_commentator_key(value: Optional[str]) -> str:
+    if not value:
+        return ""
+    return (
+        value.strip()
+        .lower()
+        .replace(" ", "")
+        .replace("_", "")
+        .replace("-", "")
+    )
+
+
+def resolve_voice_id(commentator_key: str, voice_map: Dict[str, str]) -> str:
+    normalized = normalize_commentator_key(commentator_key)
+    raw_key = commentator_key.strip() if commentator_key else ""
+    candidate_keys = [
+        raw_key,
+        raw_key.lower(),
+        normalized,
+    ]
+
+    for key in candidate_keys:
+        if not key:
+            continue
+        voice = voice_map.get(key)
+        if voice:
+            return voice
+
+    if normalized.startswith("analyst"):
+        voice = voice_map.get("analyst") or voice_map.get("color")
+        if voice:
+            return voice
+    if normalized.startswith("play"):
+        voice = voice_map.get("playByPlay") or voice_map.get("playbyplay") or voice_map.get("pbp")
+        if voice:
+            return voice
+
+    default_voice = voice_map.get("default")
+    if default_voice:
+        return default_voice
+
+    if voice_map:
+        return next(iter(voice_map.values()))
+
+    raise ValueError("No voice IDs configured for commentary synthesis.")
+
+
+def build_voice_map(primary_voice: str, secondary_voice: Optional[str]) -> Dict[str, str]:
+    voice_map: Dict[str, str] = {}
+
+    def add_voice(key: str, voice: str) -> None:
+        norm_key = normalize_commentator_key(key)
+        voice_map[key] = voice
+        voice_map[norm_key] = voice
+
+    if primary_voice:
+        for key in ("playByPlay", "playbyplay", "pbp", "default"):
+            add_voice(key, primary_voice)
+
+    if secondary_voice:
+        for key in ("analyst", "color", "analystcolor"):
+            add_voice(key, secondary_voice)
+
+    return voice_map
+
+
+class RunCheckpoint:
+    # Records completed stages of a run inside its work directory so a rerun with
+    # --resume only redoes work that is missing or whose parameters changed.
+
+    def __init__(self, work_dir: Path, resume: bool = False) -> None:
+        self.work_dir = work_dir
+        self.path = work_dir / "checkpoint.json"
+        self.commentary_path = work_dir / "commentary.json"
+        self._lock = threading.Lock()
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.data: Dict[str, Any] = {"version": 1, "analysis": None, "clips": {}, "mix": None}
+        if resume and self.path.exists():
+            try:
+                loaded = json.loads(self.path.read_text())
+            except json.JSONDecodeError:
+                loaded = None
+            if isinstance(loaded, dict) and loaded.get("version") == 1:
+                self.data.update(loaded)
+        self._save()
+
+    def _save(self) -> None:
+        temp_path = self.path.with_name(f"{self.path.name}.tmp")
+        temp_path.write_text(json.dumps(self.data, indent=2))
+        os.replace(temp_path, self.path)
+
+    def load_commentary(self, params_key: str) -> Optional[Commentary]:
+        record = self.data.get("analysis")
+        if not record or record.get("params") != params_key or not self.commentary_path.exists():
+            return None
+        if hash_file(self.commentary_path) != record.get("sha256"):
+            return None
+        try:
+            return Commentary.from_dict(json.loads(self.commentary_path.read_text()))
+        except (json.JSONDecodeError, ValueError):
+            return None
+
+    def record_commentary(self, params_key: str, commentary: Commentary) -> None:
+        write_commentary_json(self.commentary_path, commentary)
+        with self._lock:
+            self.data["analysis"] = {"params": params_key, "sha256": hash_file(self.commentary_path)}
+            self._save()
+
+    def clip_is_current(self, clip_path: Path, params_key: str) -> bool:
+        with self._lock:
+            record = self.data["clips"].get(clip_path.name)
+        if not record or record.get("params") != params_key or not clip_path.exists():
+            return False
+        return hash_file(clip_path) == record.get("sha256")
+
+    def record_clip(self, clip_path: Path, params_key: str, audio_bytes: bytes) -> None:
+        with self._lock:
+            self.data["clips"][clip_path.name] = {
+                "params": params_key,
+                "sha256": hashlib.sha256(audio_bytes).hexdigest(),
+            }
+            self._save()
+
+    def mix_key(
+        self,
+        video_path: Path,
+        clip_paths: Sequence[Path],
+        events: Sequence[CommentaryEvent],
+        output_path: Path,
+        settings: Dict[str, Any],
+    ) -> str:
+        with self._lock:
+            clip_hashes = [self.data["clips"].get(path.name, {}).get("sha256") for path in clip_paths]
+        material = json.dumps(
+            {
+                "video": str(video_path.resolve()),
+                "video_mtime": video_path.stat().st_mtime,
+                "video_size": video_path.stat().st_size,
+                "clips": clip_hashes,
+                "events": [event.to_dict() for event in events],
+                "output": str(output_path.resolve()),
+                "settings": settings,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def mix_is_current(self, params_key: str, output_path: Path) -> bool:
+        record = self.data.get("mix")
+        if not record or record.get("params") != params_key or not output_path.exists():
+            return False
+        return hash_file(output_path) == record.get("sha256")
+
+    def record_mix(self, params_key: str, output_path: Path) -> None:
+        with self._lock:
+            self.data["mix"] = {"params": params_key, "sha256": hash_file(output_path)}
+            self._save()
+
+
+def write_commentary_json(path: Optional[Path], commentary: Commentary) -> None:
+    if not path:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(commentary.to_dict(), indent=2))
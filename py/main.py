@@ -1,475 +1,414 @@
+from __future__ import annotations
+
 import argparse
-import json
+import importlib
 import os
-import subprocess
-from dataclasses import dataclass
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Any, Dict, Iterable, List, Optional, Sequence
-
-from elevenlabs import ElevenLabs, VoiceSettings  # type: ignore
-from google import genai
-from google.genai import types
-from moviepy.editor import AudioFileClip, CompositeAudioClip, VideoFileClip  # type: ignore
-
-
-BASE_DIR = Path(__file__).resolve().parent
-PROJECT_ROOT = BASE_DIR.parent
-
-DEFAULT_PROMPT_PATH = BASE_DIR / "prompts/soccer_kids.md"
-DEFAULT_VIDEO_PATH = BASE_DIR / "box.MOV"
-DEFAULT_OUTPUT_PATH = BASE_DIR / "box-commentated.mp4"
-
-
-@dataclass
-class CommentaryEvent:
-    timestamp: str
-    commentator: str
-    call: str
-    context: str
-    interrupts: Optional[str] = None
-
-    @property
-    def start_seconds(self) -> float:
-        return timestamp_to_seconds(self.timestamp)
-
-    def to_dict(self) -> Dict[str, str]:
-        data: Dict[str, str] = {
-            "timestamp": self.timestamp,
-            "commentator": self.commentator,
-            "call": self.call,
-            "context": self.context,
-        }
-        if self.interrupts:
-            data["interrupts"] = self.interrupts
-        return data
-
-
-@dataclass
-class Commentary:
-    match_summary: str
-    commentators: Dict[str, str]
-    events: List[CommentaryEvent]
-
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "matchSummary": self.match_summary,
-            "commentators": self.commentators,
-            "events": [event.to_dict() for event in self.events],
-        }
-
-    @classmethod
-    def from_dict(cls, payload: Dict[str, Any]) -> "Commentary":
-        summary = payload.get("matchSummary")
-        if not isinstance(summary, str):
-            raise ValueError("Commentary JSON missing string `matchSummary`.")
-
-        commentators_payload = payload.get("commentators", {})
-        commentators: Dict[str, str] = {}
-        if isinstance(commentators_payload, dict):
-            for key in ("playByPlay", "analyst"):
-                value = commentators_payload.get(key)
-                if isinstance(value, str) and value.strip():
-                    commentators[key] = value.strip()
-
-        if not commentators:
-            commentators = {
-                "playByPlay": "Play-by-Play",
-                "analyst": "Analyst",
-            }
-
-        events_payload = payload.get("events")
-        if not isinstance(events_payload, Sequence):
-            raise ValueError("Commentary JSON missing `events` list.")
-
-        events: List[CommentaryEvent] = []
-        for raw_event in events_payload:
-            if not isinstance(raw_event, dict):
-                continue
-            timestamp = raw_event.get("timestamp")
-            call = raw_event.get("call")
-            context = raw_event.get("context", "")
-            commentator = raw_event.get("commentator") or raw_event.get("speaker")
-            interrupts = raw_event.get("interrupts") or raw_event.get("interrupt")
-            if isinstance(timestamp, str) and isinstance(call, str):
-                commentator_key = commentator if isinstance(commentator, str) else "playByPlay"
-                commentator_key = commentator_key.strip() or "playByPlay"
-                interrupts_key = interrupts.strip() if isinstance(interrupts, str) else None
-                events.append(
-                    CommentaryEvent(
-                        timestamp=timestamp.strip(),
-                        commentator=commentator_key,
-                        call=call.strip(),
-                        context=context.strip() if isinstance(context, str) else "",
-                        interrupts=interrupts_key,
-                    )
-                )
-
-        if not events:
-            raise ValueError("Commentary JSON produced no valid events.")
-
-        events.sort(key=lambda event: event.start_seconds)
-        return cls(match_summary=summary.strip(), commentators=commentators, events=events)
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from analysis import (
+    AnalysisCache,
+    AnalysisProxy,
+    analysis_cache_extra,
+    generate_commentary,
+    generate_commentary_segmented,
+    stream_commentary,
+    translate_commentary,
+)
+from core import (
+    BASE_DIR,
+    DEFAULT_ALIGN_MIN_SALIENCE,
+    DEFAULT_ALIGN_WINDOW_SECONDS,
+    DEFAULT_ANALYSIS_CACHE_TTL_HOURS,
+    DEFAULT_ANALYSIS_CONCURRENCY,
+    DEFAULT_ANALYSIS_FPS,
+    DEFAULT_AUDIO_SAMPLE_RATE,
+    DEFAULT_CLIP_STORE_MEMORY_MB,
+    DEFAULT_DUCK_ATTACK_SECONDS,
+    DEFAULT_DUCK_IDLE_VOLUME,
+    DEFAULT_DUCK_RELEASE_SECONDS,
+    DEFAULT_FADE_OUT_SECONDS,
+    DEFAULT_FRAGMENT_SECONDS,
+    DEFAULT_GEMINI_MODEL,
+    DEFAULT_INLINE_VIDEO_MAX_MB,
+    DEFAULT_MIX_ENGINE,
+    DEFAULT_OUTPUT_PATH,
+    DEFAULT_PROMPT_PATH,
+    DEFAULT_PROXY_SHORT_SIDE,
+    DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS,
+    DEFAULT_SEGMENT_OVERLAP_SECONDS,
+    DEFAULT_TTS_BATCH_LINES,
+    DEFAULT_TTS_CACHE_MAX_AGE_DAYS,
+    DEFAULT_TTS_CACHE_MAX_MB,
+    DEFAULT_TTS_CONCURRENCY,
+    DEFAULT_TTS_MAX_RETRIES,
+    DEFAULT_VIDEO_PATH,
+    METRICS,
+    MIX_ENGINES,
+    PROJECT_ROOT,
+    VARIANT_NAME_PATTERN,
+    Commentary,
+    CommentaryEvent,
+    RunCheckpoint,
+    build_voice_map,
+    hash_file,
+    load_env_files,
+    normalize_commentator_key,
+    probe_audio_sample_rate,
+    resolve_voice_id,
+    write_commentary_json,
+)
+from synthesis import ClipSynthesizer, TTSCache, pcm_output_sample_rate, synthesize_with_pool
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from alignment import AlignmentPolicy
+    from mixing import ClipStore, DuckingPolicy, SchedulePolicy
+
+# Stage names that batch.py, service.py and benchmark.py import from here besides the
+# ones this module uses itself. The numpy-backed mixing and alignment stages are only
+# imported when a run mixes or aligns, or when one of their names is looked up here.
+from core import peak_rss_bytes, probe_media_duration, run_ffmpeg, seconds_to_timestamp
+from synthesis import group_events_by_voice, synthesize_events_to_disk
+
+__all__ = [
+    "group_events_by_voice",
+    "peak_rss_bytes",
+    "probe_media_duration",
+    "run_ffmpeg",
+    "seconds_to_timestamp",
+    "synthesize_events_to_disk",
+]
+
+LAZY_REEXPORTS = {
+    "align_commentary": "alignment",
+    "compute_interrupt_cutoffs": "mixing",
+    "mix_commentary_with_video": "mixing",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = LAZY_REEXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module_name), name)
+
+
+def scheduled_events(
+    events: Sequence[CommentaryEvent],
+    schedule: Optional[SchedulePolicy],
+) -> Tuple[List[CommentaryEvent], List[int]]:
+    # Returns the events worth synthesizing with their 1-based positions in the commentary,
+    # which name the clip files. Without a schedule (no mix) every event is kept.
+    if not schedule:
+        return list(events), list(range(1, len(events) + 1))
 
+    from mixing import compute_interrupt_targets, schedulable_event_indices, uninterrupted_event_indices
 
-def load_env_files(paths: Iterable[Path]) -> None:
-    for path in paths:
-        if not path.exists():
-            continue
-        for line in path.read_text().splitlines():
-            if "=" not in line or line.strip().startswith("#"):
-                continue
-            key, _, value = line.partition("=")
-            key = key.strip()
-            value = value.strip()
-            if key and key not in os.environ:
-                os.environ[key] = value
+    if schedule.resolve_overlaps:
+        indices = schedulable_event_indices(events, schedule)
+    else:
+        indices = uninterrupted_event_indices(events)
+    # An interrupt whose target was skipped must not fall through to an earlier line by the
+    # same commentator when the mixer recomputes cutoffs over the kept events.
+    kept = set(indices)
+    targets = compute_interrupt_targets(events)
+    kept_events = [
+        replace(events[index], interrupts=None)
+        if targets[index] is not None and targets[index] not in kept
+        else events[index]
+        for index in indices
+    ]
+    return kept_events, [index + 1 for index in indices]
 
 
-def timestamp_to_seconds(value: str) -> float:
-    parts = value.strip().split(":")
-    if len(parts) != 2:
-        raise ValueError(f"Invalid timestamp format: {value}")
-    minutes = int(parts[0])
-    seconds = float(parts[1])
-    return minutes * 60 + seconds
+def event_identity(event: CommentaryEvent) -> Tuple[str, str, str]:
+    return (event.timestamp, normalize_commentator_key(event.commentator), event.call)
 
 
-def generate_commentary(
+def run_pipelined(
     video_path: Path,
     prompt_path: Path,
-    api_key: str,
-    model: str = "models/gemini-2.5-flash",
-) -> Commentary:
-    video_bytes = video_path.read_bytes()
-    prompt_text = prompt_path.read_text()
-
-    mime_type = "video/mp4"
-    suffix = video_path.suffix.lower()
-    if suffix in {".mov", ".qt"}:
-        mime_type = "video/quicktime"
-    elif suffix in {".webm"}:
-        mime_type = "video/webm"
-
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
-        model=model,
-        contents=types.Content(
-            parts=[
-                types.Part(
-                    inline_data=types.Blob(
-                        data=video_bytes,
-                        mime_type=mime_type,
-                    ),
-                    video_metadata=types.VideoMetadata(fps=5),
-                ),
-                types.Part(text=prompt_text),
-            ]
-        ),
-    )
-
-    commentary_payload = extract_commentary_payload(response)
-    return Commentary.from_dict(commentary_payload)
-
-
-def extract_commentary_payload(response: Any) -> Dict[str, Any]:
-    attempted_texts: List[str] = []
-    candidates = getattr(response, "candidates", None) or []
-    for candidate in candidates:
-        content = getattr(candidate, "content", None)
-        parts = getattr(content, "parts", None) if content else None
-        for part in parts or []:
-            text = getattr(part, "text", None)
-            if not isinstance(text, str):
-                continue
-            attempted_texts.append(text)
-            parsed = try_parse_commentary_text(text)
-            if parsed is not None:
-                return parsed
-
-    text = getattr(response, "text", None)
-    if isinstance(text, str):
-        attempted_texts.append(text)
-        parsed = try_parse_commentary_text(text)
-        if parsed is not None:
-            return parsed
-
-    snippet = ""
-    if attempted_texts:
-        sample = attempted_texts[0].strip().replace("\n", " ")
-        snippet = f" First candidate text snippet: {sample[:200]}..."
-    raise ValueError(f"Gemini response did not contain valid JSON commentary.{snippet}")
-
-
-def try_parse_commentary_text(text: str) -> Optional[Dict[str, Any]]:
-    stripped = text.strip()
-    if not stripped:
-        return None
-
-    if stripped.startswith("```"):
-        stripped = strip_code_fence(stripped)
-
-    for candidate in generate_json_candidates(stripped):
-        try:
-            return json.loads(candidate)
-        except json.JSONDecodeError:
-            continue
-    return None
-
-
-def generate_json_candidates(text: str) -> Iterable[str]:
-    yield text
-    start = text.find("{")
-    end = text.rfind("}")
-    if 0 <= start < end:
-        yield text[start : end + 1]
-
-
-def strip_code_fence(text: str) -> str:
-    lines = text.splitlines()
-    if not lines:
-        return text
-
-    start = 0
-    end = len(lines)
-
-    if lines and lines[0].startswith("```"):
-        start = 1
-    if len(lines) > 1 and lines[-1].startswith("```"):
-        end = len(lines) - 1
-
-    return "\n".join(lines[start:end]).strip()
-
-
-def normalize_commentator_key(value: Optional[str]) -> str:
-    if not value:
-        return ""
-    return (
-        value.strip()
-        .lower()
-        .replace(" ", "")
-        .replace("_", "")
-        .replace("-", "")
-    )
-
-
-def resolve_voice_id(commentator_key: str, voice_map: Dict[str, str]) -> str:
-    normalized = normalize_commentator_key(commentator_key)
-    raw_key = commentator_key.strip() if commentator_key else ""
-    candidate_keys = [
-        raw_key,
-        raw_key.lower(),
-        normalized,
-    ]
-
-    for key in candidate_keys:
-        if not key:
-            continue
-        voice = voice_map.get(key)
-        if voice:
-            return voice
-
-    if normalized.startswith("analyst"):
-        voice = voice_map.get("analyst") or voice_map.get("color")
-        if voice:
-            return voice
-    if normalized.startswith("play"):
-        voice = voice_map.get("playByPlay") or voice_map.get("playbyplay") or voice_map.get("pbp")
-        if voice:
-            return voice
-
-    default_voice = voice_map.get("default")
-    if default_voice:
-        return default_voice
-
-    if voice_map:
-        return next(iter(voice_map.values()))
-
-    raise ValueError("No voice IDs configured for commentary synthesis.")
-
-
-def build_voice_map(primary_voice: str, secondary_voice: Optional[str]) -> Dict[str, str]:
-    voice_map: Dict[str, str] = {}
-
-    def add_voice(key: str, voice: str) -> None:
-        norm_key = normalize_commentator_key(key)
-        voice_map[key] = voice
-        voice_map[norm_key] = voice
-
-    if primary_voice:
-        for key in ("playByPlay", "playbyplay", "pbp", "default"):
-            add_voice(key, primary_voice)
-
-    if secondary_voice:
-        for key in ("analyst", "color", "analystcolor"):
-            add_voice(key, secondary_voice)
-
-    return voice_map
-
-
-def compute_interrupt_cutoffs(events: Sequence[CommentaryEvent]) -> List[Optional[float]]:
-    cutoffs: List[Optional[float]] = [None] * len(events)
-    last_index_by_commentator: Dict[str, int] = {}
-
-    for index, event in enumerate(events):
-        commentator_key = normalize_commentator_key(event.commentator)
-        if commentator_key:
-            last_index_by_commentator[commentator_key] = index
+    gemini_api_key: str,
+    synthesizer: ClipSynthesizer,
+    output_path: Optional[Path],
+    tts_concurrency: int = DEFAULT_TTS_CONCURRENCY,
+    model: str = DEFAULT_GEMINI_MODEL,
+    fps: float = DEFAULT_ANALYSIS_FPS,
+    cache: Optional[AnalysisCache] = None,
+    bypass_cache: bool = False,
+    inline_max_bytes: int = DEFAULT_INLINE_VIDEO_MAX_MB * 1024 * 1024,
+    proxy: Optional[AnalysisProxy] = None,
+    structured_output: bool = True,
+    background_volume: float = 0.45,
+    commentary_volume: float = 1.0,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+    loudness_target: Optional[float] = None,
+    fragment_seconds: Optional[float] = None,
+    alignment: Optional[AlignmentPolicy] = None,
+    on_analysis: Optional[Callable[[Commentary], None]] = None,
+    video_sha256: Optional[str] = None,
+) -> Tuple[Commentary, List[Path]]:
+    # Events are synthesized (and decoded for mixing) as soon as Gemini streams them;
+    # mixing then starts on the first chunks while later clips are still being
+    # synthesized, decoding the background track as it goes.
+    from mixing import BackgroundStream, load_clip_pcm, mux_progressive_pcm
+
+    sample_rate = probe_audio_sample_rate(video_path) or DEFAULT_AUDIO_SAMPLE_RATE
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, tts_concurrency)) as tts_pool, BackgroundStream(
+        video_path, sample_rate
+    ) as background:
+        # Streamed lines are only prefetched: their clip numbers (and so file names and
+        # checkpoint keys) come from their index in the final commentary, which can drop
+        # or reorder what was streamed.
+        prefetches: Dict[Tuple[str, str, str], List[Tuple[Future, CommentaryEvent]]] = {}
+
+        def on_event(event: CommentaryEvent) -> None:
+            prefetch = tts_pool.submit(synthesizer.prefetch, event)
+            prefetches.setdefault(event_identity(event), []).append((prefetch, event))
+
+        commentary = stream_commentary(
+            video_path,
+            prompt_path,
+            gemini_api_key,
+            on_event,
+            model=model,
+            fps=fps,
+            cache=cache,
+            bypass_cache=bypass_cache,
+            inline_max_bytes=inline_max_bytes,
+            proxy=proxy,
+            structured_output=structured_output,
+            video_sha256=video_sha256,
+        )
+        print(f"Analysis finished after {time.perf_counter() - started:.2f}s with {len(commentary.events)} events")
+        if on_analysis:
+            on_analysis(commentary)
+
+        total = len(commentary.events)
+
+        def synthesize_and_decode(
+            index: int,
+            event: CommentaryEvent,
+            prefetch: Optional[Future],
+        ) -> Tuple[Path, Optional[np.ndarray]]:
+            # A prefetch was queued before this job, so waiting on it cannot starve the pool.
+            if prefetch is not None:
+                try:
+                    prefetch.result()
+                except Exception as error:
+                    print(f"Prefetching clip {index} failed; synthesizing it again: {error}")
+            clip_path = synthesizer.synthesize(index, event, total)
+            pcm = load_clip_pcm(clip_path, sample_rate, synthesizer.clip_store) if output_path else None
+            return clip_path, pcm
+
+        clip_futures: List[Future] = []
+        for index, event in enumerate(commentary.events, start=1):
+            queued = prefetches.get(event_identity(event))
+            prefetch = queued.pop(0)[0] if queued else None
+            clip_futures.append(tts_pool.submit(synthesize_and_decode, index, event, prefetch))
+        # Streamed lines that did not survive into the final commentary are cancelled, or
+        # their audio is dropped once fetched unless a surviving line shares it.
+        kept_keys = {synthesizer.clip_key(event) for event in commentary.events}
+        for queued in prefetches.values():
+            for prefetch, event in queued:
+                if not prefetch.cancel() and synthesizer.clip_key(event) not in kept_keys:
+                    prefetch.add_done_callback(lambda _, event=event: synthesizer.discard_prefetched(event))
+        # Clips are matched to events above by their original timestamps; alignment only
+        # moves where they land in the mix, and runs while those clips synthesize.
+        if alignment:
+            from alignment import align_commentary
+
+            scene_path = proxy.existing(video_path, fps) if proxy else None
+            commentary = align_commentary(video_path, commentary, alignment, scene_path=scene_path)
+
+        def decoded_clip(future: Future) -> Callable[[], np.ndarray]:
+            return lambda: future.result()[1]
+
+        if output_path:
+            mux_progressive_pcm(
+                video_path,
+                output_path,
+                background,
+                [decoded_clip(future) for future in clip_futures],
+                commentary.events,
+                sample_rate,
+                background_volume,
+                commentary_volume,
+                schedule=schedule,
+                ducking=ducking,
+                loudness_target=loudness_target,
+                fragment_seconds=fragment_seconds,
+            )
+            print(f"Mix finished after {time.perf_counter() - started:.2f}s")
 
-        interrupt_target = normalize_commentator_key(event.interrupts)
-        if interrupt_target:
-            interrupted_index = last_index_by_commentator.get(interrupt_target)
-            if interrupted_index is not None and interrupted_index < index:
-                cutoff_time = event.start_seconds
-                existing = cutoffs[interrupted_index]
-                if existing is None or cutoff_time < existing:
-                    cutoffs[interrupted_index] = cutoff_time
+        clip_paths = [future.result()[0] for future in clip_futures]
+        synthesizer.finish()
+        if not output_path:
+            print(f"Synthesis finished after {time.perf_counter() - started:.2f}s")
 
-    return cutoffs
+    return commentary, clip_paths
 
 
-def synthesize_events_to_disk(
+def synthesize_and_mix_progressive(
+    video_path: Path,
+    output_path: Path,
+    synthesizer: ClipSynthesizer,
     events: Sequence[CommentaryEvent],
-    api_key: str,
-    voice_map: Dict[str, str],
-    model_id: str,
-    output_dir: Path,
-    stability: float = 0.5,
-    similarity_boost: float = 0.65,
-    output_format: str = "mp3_44100_128",
-    use_speaker_boost: bool = True,
+    concurrency: int = DEFAULT_TTS_CONCURRENCY,
+    background_volume: float = 0.45,
+    commentary_volume: float = 1.0,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+    loudness_target: Optional[float] = None,
+    fragment_seconds: Optional[float] = DEFAULT_FRAGMENT_SECONDS,
+    numbers: Optional[Sequence[int]] = None,
 ) -> List[Path]:
-    output_dir.mkdir(parents=True, exist_ok=True)
-    client = ElevenLabs(api_key=api_key)
-    clip_paths: List[Path] = []
+    # Clips are synthesized in timeline order and each output fragment is muxed as soon as
+    # the clips reaching into it are ready, instead of after the last clip.
+    from mixing import BackgroundStream, load_clip_pcm, mux_progressive_pcm
 
+    sample_rate = probe_audio_sample_rate(video_path) or DEFAULT_AUDIO_SAMPLE_RATE
     total = len(events)
-    for index, event in enumerate(events, start=1):
-        print(f"Synthesizing clip {index}/{total} at {event.timestamp}: {event.call}")
-        voice_id = resolve_voice_id(event.commentator, voice_map)
-        stream = client.text_to_speech.convert(
-            voice_id=voice_id,
-            model_id=model_id,
-            output_format=output_format,
-            voice_settings=VoiceSettings(
-                stability=stability,
-                similarity_boost=similarity_boost,
-                style=0.0,
-                use_speaker_boost=use_speaker_boost,
-            ),
-            text=event.call,
+    numbers = list(numbers) if numbers is not None else list(range(1, total + 1))
+    last_number = max(numbers, default=0)
+    started = time.perf_counter()
+
+    def synthesize_and_decode(index: int, event: CommentaryEvent) -> Tuple[Path, np.ndarray]:
+        clip_path = synthesizer.synthesize(index, event, last_number)
+        return clip_path, load_clip_pcm(clip_path, sample_rate, synthesizer.clip_store)
+
+    def decoded_clip(future: Future) -> Callable[[], np.ndarray]:
+        return lambda: future.result()[1]
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as tts_pool, BackgroundStream(
+        video_path, sample_rate
+    ) as background:
+        clip_futures = [
+            tts_pool.submit(synthesize_and_decode, number, event)
+            for number, event in zip(numbers, events)
+        ]
+        mux_progressive_pcm(
+            video_path,
+            output_path,
+            background,
+            [decoded_clip(future) for future in clip_futures],
+            events,
+            sample_rate,
+            background_volume,
+            commentary_volume,
+            schedule=schedule,
+            ducking=ducking,
+            loudness_target=loudness_target,
+            fragment_seconds=fragment_seconds,
         )
+        clip_paths = [future.result()[0] for future in clip_futures]
+    print(f"Synthesized and mixed {total} clips in {time.perf_counter() - started:.2f}s (concurrency {max(1, concurrency)})")
 
-        audio_bytes = bytearray()
-        for chunk in stream:
-            if chunk:
-                audio_bytes.extend(chunk)
-
-        if not audio_bytes:
-            raise RuntimeError(f"ElevenLabs returned no audio for event at {event.timestamp}.")
-
-        commentator_slug = normalize_commentator_key(event.commentator) or "commentator"
-        clip_path = output_dir / f"event_{index:02d}_{commentator_slug}.mp3"
-        clip_path.write_bytes(bytes(audio_bytes))
-        clip_paths.append(clip_path)
-
+    synthesizer.finish()
     return clip_paths
 
 
-def mix_commentary_with_video(
+@dataclass
+class RenderVariant:
+    name: str
+    voice_id: str
+    voice2_id: Optional[str] = None
+    language: Optional[str] = None
+
+    @classmethod
+    def parse(cls, spec: str, default_voice_id: str, default_voice2_id: Optional[str]) -> "RenderVariant":
+        name, _, options = spec.partition(":")
+        name = name.strip()
+        if not VARIANT_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f"Variant `{spec}` needs a name made of letters, digits, `-` or `_`.")
+        values: Dict[str, str] = {}
+        for option in filter(None, (part.strip() for part in options.split(","))):
+            key, separator, value = option.partition("=")
+            if not separator or key.strip() not in ("voice", "voice2", "language") or not value.strip():
+                raise ValueError(f"Variant `{spec}` has an invalid option `{option}`; use voice=, voice2= or language=.")
+            values[key.strip()] = value.strip()
+        voice_id = values.get("voice", default_voice_id)
+        voice2_id = values.get("voice2") or (None if "voice" in values else default_voice2_id)
+        return cls(name=name, voice_id=voice_id, voice2_id=voice2_id, language=values.get("language"))
+
+    def path_for(self, path: Path) -> Path:
+        return path.with_name(f"{path.stem}.{self.name}{path.suffix}")
+
+
+@METRICS.traced("variants")
+def render_variants(
     video_path: Path,
-    clip_paths: Sequence[Path],
-    events: Sequence[CommentaryEvent],
-    output_path: Path,
+    output_path: Optional[Path],
+    renders: Sequence[Tuple[RenderVariant, Commentary, ClipSynthesizer]],
+    concurrency: int = DEFAULT_TTS_CONCURRENCY,
+    batch_lines: int = DEFAULT_TTS_BATCH_LINES,
     background_volume: float = 0.45,
     commentary_volume: float = 1.0,
-) -> None:
-    if len(clip_paths) != len(events):
-        raise ValueError("Number of synthesized clips does not match commentary events.")
-
-    temp_audio_path = output_path.with_suffix(".temp-commentary.wav")
-    cutoffs = compute_interrupt_cutoffs(events)
-    min_duration = 0.1
-
-    with VideoFileClip(str(video_path)) as video:
-        base_audio = video.audio.volumex(background_volume) if video.audio else None
-        overlay_clips: List[AudioFileClip] = []
-        composite_audio: Optional[CompositeAudioClip] = None
-
-        try:
-            for index, (event, clip_path) in enumerate(zip(events, clip_paths)):
-                raw_clip = AudioFileClip(str(clip_path))
-                try:
-                    start_time = event.start_seconds
-                    overlay = raw_clip.volumex(commentary_volume).set_start(start_time)
-                    cutoff_time = cutoffs[index]
-                    if cutoff_time is not None:
-                        allowed_end = min(start_time + raw_clip.duration, cutoff_time)
-                        if allowed_end <= start_time + min_duration:
-                            raw_clip.close()
-                            continue
-                        overlay = overlay.set_end(allowed_end)
-                    overlay_clips.append(overlay)
-                except Exception:
-                    raw_clip.close()
-                    raise
-
-            audio_clips = ([base_audio] if base_audio else []) + overlay_clips
-            if not audio_clips:
-                raise RuntimeError("No audio sources available to mix.")
-
-            composite_audio = CompositeAudioClip(audio_clips)
-            # Determine an appropriate sample rate for export
-            audio_fps = None
-            for clip in audio_clips:
-                if getattr(clip, "fps", None):
-                    audio_fps = int(clip.fps)
-                    break
-            if not audio_fps:
-                audio_fps = 44100
-
-            composite_audio.write_audiofile(
-                str(temp_audio_path),
-                fps=audio_fps,
-                nbytes=2,
-                codec="pcm_s16le",
-                logger=None,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+    loudness_target: Optional[float] = None,
+) -> Dict[str, List[Path]]:
+    # Each variant costs one TTS pass and one mux, which streams the background track
+    # again rather than holding a decoded copy of it; a variant's mux overlaps the next
+    # variant's synthesis.
+    if output_path:
+        from mixing import BackgroundStream, SchedulePolicy, load_clip_pcm, mux_mixed_pcm
+
+        schedule = schedule or SchedulePolicy()
+    sample_rate = probe_audio_sample_rate(video_path) or DEFAULT_AUDIO_SAMPLE_RATE
+    started = time.perf_counter()
+    METRICS.annotate(variants=len(renders))
+    clip_paths_by_variant: Dict[str, List[Path]] = {}
+
+    def mix_variant(variant_output: Path, clips: List[np.ndarray], events: List[CommentaryEvent]) -> None:
+        with BackgroundStream(video_path, sample_rate) as background:
+            mux_mixed_pcm(
+                video_path,
+                variant_output,
+                background,
+                clips,
+                events,
+                sample_rate,
+                background_volume,
+                commentary_volume,
+                schedule=schedule,
+                ducking=ducking,
+                loudness_target=loudness_target,
             )
-        finally:
-            for overlay in overlay_clips:
-                overlay.close()
-            if base_audio:
-                base_audio.close()
-            if composite_audio:
-                composite_audio.close()
-
-    ffmpeg_cmd = [
-        "ffmpeg",
-        "-y",
-        "-i",
-        str(video_path),
-        "-i",
-        str(temp_audio_path),
-        "-map",
-        "0:v:0",
-        "-map",
-        "1:a:0",
-        "-c:v",
-        "copy",
-        "-c:a",
-        "aac",
-        "-shortest",
-        str(output_path),
-    ]
 
-    result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+    with ThreadPoolExecutor(max_workers=1) as mix_pool:
+        mixes: List[Future] = []
+        for variant, commentary, synthesizer in renders:
+            events, numbers = scheduled_events(commentary.events, schedule if output_path else None)
+            if len(events) < len(commentary.events):
+                skipped = len(commentary.events) - len(events)
+                print(f"[{variant.name}] Skipping {skipped} events that would be cut off or cannot be scheduled")
+            print(f"[{variant.name}] Synthesizing {len(events)} clips")
+            clip_paths = synthesize_with_pool(synthesizer, events, concurrency, batch_lines=batch_lines, numbers=numbers)
+            clip_paths_by_variant[variant.name] = clip_paths
+            if not output_path:
+                continue
 
-    temp_audio_path.unlink(missing_ok=True)
+            clips = [load_clip_pcm(clip_path, sample_rate, synthesizer.clip_store) for clip_path in clip_paths]
+            variant_output = variant.path_for(output_path)
+            mixes.append(mix_pool.submit(mix_variant, variant_output, clips, events))
+            print(f"[{variant.name}] Mixing into {variant_output}")
+        for mix in mixes:
+            mix.result()
+    print(f"Rendered {len(renders)} variants in {time.perf_counter() - started:.2f}s")
+    return clip_paths_by_variant
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Generate boxing commentary and overlay it onto a video.")
     parser.add_argument("--video", type=Path, default=DEFAULT_VIDEO_PATH, help="Input video path.")
     parser.add_argument("--prompt", type=Path, default=DEFAULT_PROMPT_PATH, help="Prompt file for Gemini.")
@@ -478,6 +417,12 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--skip-video", action="store_true", help="Generate narration only; requires --clips-dir to retain audio files.")
     parser.add_argument("--background-volume", type=float, default=0.45, help="Mix volume for the original video audio.")
     parser.add_argument("--commentary-volume", type=float, default=1.0, help="Mix volume for synthesized commentary.")
+    parser.add_argument(
+        "--mix-engine",
+        choices=MIX_ENGINES,
+        default=DEFAULT_MIX_ENGINE,
+        help="Audio mixing engine: vectorized NumPy over ffmpeg-decoded PCM, or the legacy MoviePy compositor.",
+    )
     parser.add_argument("--voice-id", type=str, default=os.getenv("ELEVENLABS_VOICE_ID"), help="ElevenLabs voice ID.")
     parser.add_argument(
         "--voice2-id",
@@ -486,13 +431,299 @@ def parse_args() -> argparse.Namespace:
         help="Secondary ElevenLabs voice ID for analyst commentary (defaults to --voice-id).",
     )
     parser.add_argument("--model-id", type=str, default=os.getenv("ELEVENLABS_MODEL", "eleven_v3"), help="ElevenLabs TTS model ID.")
-    parser.add_argument("--gemini-model", type=str, default="models/gemini-2.5-flash", help="Gemini model to use.")
+    parser.add_argument("--gemini-model", type=str, default=DEFAULT_GEMINI_MODEL, help="Gemini model to use.")
+    parser.add_argument("--analysis-fps", type=float, default=DEFAULT_ANALYSIS_FPS, help="Frame sampling rate for Gemini video analysis.")
+    parser.add_argument(
+        "--analysis-cache-dir",
+        type=Path,
+        default=os.getenv("ANALYSIS_CACHE_DIR"),
+        help="Directory for cached Gemini commentary keyed on video, prompt, model and fps (disabled when unset).",
+    )
+    parser.add_argument(
+        "--analysis-cache-ttl-hours",
+        type=float,
+        default=DEFAULT_ANALYSIS_CACHE_TTL_HOURS,
+        help="Discard cached commentary older than this many hours (0 keeps entries forever).",
+    )
+    parser.add_argument(
+        "--refresh-analysis",
+        action="store_true",
+        help="Bypass cached commentary and re-run Gemini analysis, replacing the cached result.",
+    )
+    parser.add_argument("--metrics-json", type=Path, help="Write per-stage timings, bytes and peak RSS as JSON.")
+    parser.add_argument("--metrics-otlp", type=Path, help="Write recorded spans as OpenTelemetry OTLP/JSON.")
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="Stream Gemini output and start synthesis and mixing while analysis is still running.",
+    )
+    parser.add_argument(
+        "--segment-seconds",
+        type=float,
+        default=0.0,
+        help="Analyze videos longer than this in overlapping windows of this length, in parallel (0 disables).",
+    )
+    parser.add_argument(
+        "--segment-overlap",
+        type=float,
+        default=DEFAULT_SEGMENT_OVERLAP_SECONDS,
+        help="Seconds of overlap between consecutive analysis windows.",
+    )
+    parser.add_argument(
+        "--analysis-concurrency",
+        type=int,
+        default=DEFAULT_ANALYSIS_CONCURRENCY,
+        help="Maximum number of analysis windows sent to Gemini at once.",
+    )
+    parser.add_argument(
+        "--inline-max-mb",
+        type=float,
+        default=DEFAULT_INLINE_VIDEO_MAX_MB,
+        help=(
+            "Send videos inline while the base64-encoded request stays under this size; larger ones are "
+            "uploaded via the Gemini Files API (0 always uploads)."
+        ),
+    )
     parser.add_argument("--stability", type=float, default=0.5, help="ElevenLabs stability parameter.")
     parser.add_argument("--similarity", type=float, default=0.65, help="ElevenLabs similarity boost parameter.")
     parser.add_argument("--clips-dir", type=Path, help="Optional directory to store synthesized clips.")
-    parser.add_argument("--output-format", type=str, default="mp3_44100_128", help="ElevenLabs audio output format, e.g. mp3_44100_128.")
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        help="Job directory holding a checkpoint of completed stages, the commentary JSON and clips (default clips dir).",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Reuse stages recorded in --work-dir whose inputs and parameters are unchanged.",
+    )
+    parser.add_argument("--output-format", type=str, default="mp3_44100_128", help="ElevenLabs audio output format, e.g. mp3_44100_128 or pcm_44100.")
     parser.add_argument("--disable-speaker-boost", action="store_true", help="Disable ElevenLabs speaker boost.")
-    return parser.parse_args()
+    parser.add_argument(
+        "--tts-concurrency",
+        type=int,
+        default=DEFAULT_TTS_CONCURRENCY,
+        help="Maximum number of ElevenLabs requests in flight at once.",
+    )
+    parser.add_argument(
+        "--tts-rate-limit",
+        type=float,
+        default=0.0,
+        help="Maximum ElevenLabs requests started per second for this API key (0 disables the limit).",
+    )
+    parser.add_argument(
+        "--tts-max-retries",
+        type=int,
+        default=DEFAULT_TTS_MAX_RETRIES,
+        help="Retries with exponential backoff when ElevenLabs responds with HTTP 429.",
+    )
+    parser.add_argument(
+        "--variant",
+        action="append",
+        default=[],
+        metavar="NAME[:voice=ID,voice2=ID,language=LANG]",
+        help=(
+            "Render OUTPUT.NAME.ext from the same analysis with its own voices and optional translation; "
+            "repeat for more variants."
+        ),
+    )
+    parser.add_argument(
+        "--clip-store-memory-mb",
+        type=float,
+        default=DEFAULT_CLIP_STORE_MEMORY_MB,
+        help="With a pcm_* output format, keep up to this much clip audio in memory before spilling to disk.",
+    )
+    parser.add_argument(
+        "--clip-store-spill-dir",
+        type=Path,
+        help="Directory for the memory-mapped clip spill file (default: system temp directory).",
+    )
+    parser.add_argument(
+        "--tts-batch-lines",
+        type=int,
+        default=DEFAULT_TTS_BATCH_LINES,
+        help="Synthesize up to this many consecutive same-voice lines per request and split them by alignment.",
+    )
+    parser.add_argument(
+        "--tts-cache-dir",
+        type=Path,
+        default=os.getenv("TTS_CACHE_DIR"),
+        help="Directory for the persistent synthesized-clip cache (disabled when unset).",
+    )
+    parser.add_argument(
+        "--tts-cache-max-mb",
+        type=float,
+        default=DEFAULT_TTS_CACHE_MAX_MB,
+        help="Evict least recently used cached clips beyond this total size.",
+    )
+    parser.add_argument(
+        "--tts-cache-max-age-days",
+        type=float,
+        default=DEFAULT_TTS_CACHE_MAX_AGE_DAYS,
+        help="Evict cached clips not used for this many days.",
+    )
+    parser.add_argument(
+        "--schedule",
+        action="store_true",
+        help="Resolve overlapping lines with real clip durations by delaying lines or cutting earlier ones short.",
+    )
+    parser.add_argument(
+        "--schedule-max-shift",
+        type=float,
+        default=DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS,
+        help="Largest delay in seconds applied to a line to avoid talking over the previous one.",
+    )
+    parser.add_argument(
+        "--schedule-fade",
+        type=float,
+        default=DEFAULT_FADE_OUT_SECONDS,
+        help="Fade-out in seconds applied to lines that are cut short.",
+    )
+    parser.add_argument(
+        "--schedule-drop-analyst",
+        action="store_true",
+        help="With --schedule, drop analyst lines that collide with play-by-play instead of truncating.",
+    )
+    parser.add_argument(
+        "--duck",
+        action="store_true",
+        help="Play the original audio at --duck-idle-volume and duck it to --background-volume under commentary.",
+    )
+    parser.add_argument(
+        "--duck-idle-volume",
+        type=float,
+        default=DEFAULT_DUCK_IDLE_VOLUME,
+        help="Mix volume for the original audio while no commentary is playing (with --duck).",
+    )
+    parser.add_argument(
+        "--duck-attack",
+        type=float,
+        default=DEFAULT_DUCK_ATTACK_SECONDS,
+        help="Seconds over which the background is ducked ahead of a line.",
+    )
+    parser.add_argument(
+        "--duck-release",
+        type=float,
+        default=DEFAULT_DUCK_RELEASE_SECONDS,
+        help="Seconds over which the background recovers after a line.",
+    )
+    parser.add_argument(
+        "--loudness-target",
+        type=float,
+        help="Normalize the final mix to this integrated loudness in LUFS (EBU R128), e.g. -16.",
+    )
+    parser.add_argument(
+        "--no-analysis-proxy",
+        action="store_true",
+        help="Send the original video to Gemini instead of a downscaled analysis proxy.",
+    )
+    parser.add_argument(
+        "--proxy-short-side",
+        type=int,
+        default=DEFAULT_PROXY_SHORT_SIDE,
+        help="Shorter side in pixels of the analysis proxy.",
+    )
+    parser.add_argument(
+        "--proxy-dir",
+        type=Path,
+        default=os.getenv("ANALYSIS_PROXY_DIR"),
+        help="Directory for analysis proxies (defaults to hidden files next to each source video).",
+    )
+    parser.add_argument("--proxy-no-audio", action="store_true", help="Drop audio from the analysis proxy.")
+    parser.add_argument(
+        "--no-structured-output",
+        action="store_true",
+        help="Do not request JSON mime type and response schema from Gemini.",
+    )
+    parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help="Mix and mux while clips are synthesized, writing fragmented MP4 (or HLS when --output ends in .m3u8).",
+    )
+    parser.add_argument(
+        "--fragment-seconds",
+        type=float,
+        default=DEFAULT_FRAGMENT_SECONDS,
+        help="Target fragment or HLS segment duration for --progressive output.",
+    )
+    parser.add_argument(
+        "--align-events",
+        action="store_true",
+        help="Snap event timestamps to nearby audio onsets and scene cuts before synthesis.",
+    )
+    parser.add_argument(
+        "--align-window",
+        type=float,
+        default=DEFAULT_ALIGN_WINDOW_SECONDS,
+        help="Largest shift in seconds applied to an event by --align-events.",
+    )
+    parser.add_argument(
+        "--align-min-salience",
+        type=float,
+        default=DEFAULT_ALIGN_MIN_SALIENCE,
+        help="Keep an event's timestamp unless a nearby onset or cut is at least this strong (0-1).",
+    )
+    parser.add_argument(
+        "--align-no-scene",
+        action="store_true",
+        help="Align on the audio track only, skipping the scene-change pass over the video.",
+    )
+    return parser.parse_args(argv)
+
+
+def analysis_proxy_from_args(args: argparse.Namespace) -> Optional[AnalysisProxy]:
+    if args.no_analysis_proxy:
+        return None
+    return AnalysisProxy(
+        short_side=args.proxy_short_side,
+        keep_audio=not args.proxy_no_audio,
+        directory=Path(args.proxy_dir) if args.proxy_dir else None,
+    )
+
+
+def alignment_scene_path(args: argparse.Namespace, video_path: Path) -> Optional[Path]:
+    # The scene pass reads the analysis proxy when one is on disk rather than decoding
+    # the full-resolution original.
+    proxy = analysis_proxy_from_args(args)
+    return proxy.existing(video_path, args.analysis_fps) if proxy else None
+
+
+def alignment_policy_from_args(args: argparse.Namespace) -> Optional[AlignmentPolicy]:
+    if not args.align_events:
+        return None
+    from alignment import AlignmentPolicy
+
+    policy = AlignmentPolicy(window=args.align_window, min_salience=args.align_min_salience)
+    if args.align_no_scene:
+        policy.scene_weight = 0.0
+    return policy
+
+
+def ducking_policy_from_args(args: argparse.Namespace) -> Optional[DuckingPolicy]:
+    if not args.duck:
+        return None
+    from mixing import DuckingPolicy
+
+    return DuckingPolicy(idle_volume=args.duck_idle_volume, attack=args.duck_attack, release=args.duck_release)
+
+
+def clip_store_from_args(args: argparse.Namespace, mixing: bool) -> Optional[ClipStore]:
+    if not mixing or args.mix_engine != "numpy" or not pcm_output_sample_rate(args.output_format):
+        return None
+    from mixing import ClipStore
+
+    return ClipStore(int(args.clip_store_memory_mb * 1024 * 1024), spill_dir=args.clip_store_spill_dir)
+
+
+def schedule_policy_from_args(args: argparse.Namespace) -> SchedulePolicy:
+    from mixing import SchedulePolicy
+
+    return SchedulePolicy(
+        resolve_overlaps=args.schedule,
+        max_shift=args.schedule_max_shift,
+        fade_out=args.schedule_fade,
+        drop_low_priority=args.schedule_drop_analyst,
+    )
 
 
 def main() -> None:
@@ -507,52 +738,319 @@ def main() -> None:
     if not eleven_api_key:
         raise RuntimeError("Set ELEVENLABS_API_KEY for ElevenLabs access.")
 
-    if not args.voice_id:
-        raise RuntimeError("Provide an ElevenLabs voice via --voice-id or ELEVENLABS_VOICE_ID.")
+    try:
+        with METRICS.span("pipeline", root=True, video=str(args.video)):
+            run_from_args(args, gemini_api_key, eleven_api_key)
+    finally:
+        METRICS.write_reports(args.metrics_json, args.metrics_otlp)
 
-    voice2_id = args.voice2_id or args.voice_id
-    voice_map = build_voice_map(args.voice_id, voice2_id)
 
-    commentary = generate_commentary(
+def analyze_from_args(
+    args: argparse.Namespace,
+    gemini_api_key: str,
+    analysis_cache: Optional[AnalysisCache],
+    video_sha256: Optional[str] = None,
+) -> Commentary:
+    if args.segment_seconds > 0:
+        return generate_commentary_segmented(
+            args.video,
+            args.prompt,
+            gemini_api_key,
+            window_seconds=args.segment_seconds,
+            overlap_seconds=args.segment_overlap,
+            concurrency=args.analysis_concurrency,
+            model=args.gemini_model,
+            fps=args.analysis_fps,
+            cache=analysis_cache,
+            bypass_cache=args.refresh_analysis,
+            inline_max_bytes=int(args.inline_max_mb * 1024 * 1024),
+            proxy=analysis_proxy_from_args(args),
+            structured_output=not args.no_structured_output,
+            video_sha256=video_sha256,
+        )
+    return generate_commentary(
         args.video,
         args.prompt,
         gemini_api_key,
         model=args.gemini_model,
+        fps=args.analysis_fps,
+        cache=analysis_cache,
+        bypass_cache=args.refresh_analysis,
+        inline_max_bytes=int(args.inline_max_mb * 1024 * 1024),
+        proxy=analysis_proxy_from_args(args),
+        structured_output=not args.no_structured_output,
+        video_sha256=video_sha256,
     )
 
-    if args.commentary_json:
-        args.commentary_json.parent.mkdir(parents=True, exist_ok=True)
-        args.commentary_json.write_text(json.dumps(commentary.to_dict(), indent=2))
 
-    if args.skip_video and not args.clips_dir:
-        raise RuntimeError("Provide --clips-dir when using --skip-video to retain generated clips.")
+def variant_renders_from_args(
+    args: argparse.Namespace,
+    variants: Sequence[RenderVariant],
+    commentary: Commentary,
+    gemini_api_key: str,
+    eleven_api_key: str,
+    synthesizer: ClipSynthesizer,
+    clips_dir: Path,
+    analysis_cache: Optional[AnalysisCache],
+) -> List[Tuple[RenderVariant, Commentary, ClipSynthesizer]]:
+    languages = sorted({variant.language for variant in variants if variant.language})
+    translations: Dict[Optional[str], Commentary] = {None: commentary}
+    if languages:
+        from google import genai
+
+        client = genai.Client(api_key=gemini_api_key)
+        with ThreadPoolExecutor(max_workers=len(languages)) as executor:
+            futures = {
+                language: executor.submit(
+                    translate_commentary,
+                    commentary,
+                    language,
+                    gemini_api_key,
+                    model=args.gemini_model,
+                    cache=analysis_cache,
+                    client=client,
+                    structured_output=not args.no_structured_output,
+                )
+                for language in languages
+            }
+            translations.update({language: future.result() for language, future in futures.items()})
+
+    renders: List[Tuple[RenderVariant, Commentary, ClipSynthesizer]] = []
+    for variant in variants:
+        variant_commentary = translations[variant.language]
+        if variant.language and args.commentary_json:
+            write_commentary_json(variant.path_for(args.commentary_json), variant_commentary)
+        # Variants share the TTS client, cache and clip store; the run checkpoint keys
+        # clips by file name, so it is left to the single-output path.
+        variant_synthesizer = ClipSynthesizer(
+            eleven_api_key,
+            build_voice_map(variant.voice_id, variant.voice2_id or variant.voice_id),
+            args.model_id,
+            clips_dir / variant.name,
+            stability=args.stability,
+            similarity_boost=args.similarity,
+            output_format=args.output_format,
+            use_speaker_boost=not args.disable_speaker_boost,
+            requests_per_second=args.tts_rate_limit,
+            max_retries=args.tts_max_retries,
+            cache=synthesizer.cache,
+            client=synthesizer.client,
+            clip_store=synthesizer.clip_store,
+            write_clips=bool(args.clips_dir or args.work_dir),
+        )
+        renders.append((variant, variant_commentary, variant_synthesizer))
+    return renders
+
 
-    play_by_play_name = commentary.commentators.get("playByPlay", "Play-by-Play")
-    analyst_name = commentary.commentators.get("analyst", "Analyst")
-    play_voice_id = resolve_voice_id("playByPlay", voice_map)
-    analyst_voice_id = resolve_voice_id("analyst", voice_map)
-    print(f"Play-by-play voice: {play_by_play_name} -> {play_voice_id}")
-    print(f"Analyst voice: {analyst_name} -> {analyst_voice_id}")
+def run_from_args(args: argparse.Namespace, gemini_api_key: str, eleven_api_key: str) -> None:
+    if not args.voice_id:
+        raise RuntimeError("Provide an ElevenLabs voice via --voice-id or ELEVENLABS_VOICE_ID.")
+
+    voice2_id = args.voice2_id or args.voice_id
+    voice_map = build_voice_map(args.voice_id, voice2_id)
+
+    if args.skip_video and not (args.clips_dir or args.work_dir):
+        raise RuntimeError("Provide --clips-dir or --work-dir when using --skip-video to retain generated clips.")
+    if args.resume and not args.work_dir:
+        raise RuntimeError("--resume requires --work-dir.")
+    if args.pipelined and args.segment_seconds > 0:
+        raise RuntimeError("--pipelined cannot be combined with --segment-seconds.")
+    if args.pipelined and args.mix_engine != "numpy":
+        raise RuntimeError("--pipelined requires --mix-engine numpy.")
+    if args.duck and args.mix_engine != "numpy":
+        raise RuntimeError("--duck requires --mix-engine numpy.")
+    if args.progressive and args.mix_engine != "numpy":
+        raise RuntimeError("--progressive requires --mix-engine numpy.")
+    if args.variant and (args.pipelined or args.progressive):
+        raise RuntimeError("--variant cannot be combined with --pipelined or --progressive.")
+    if args.variant and args.mix_engine != "numpy" and not args.skip_video:
+        raise RuntimeError("--variant requires --mix-engine numpy.")
+    variants = [RenderVariant.parse(spec, args.voice_id, args.voice2_id) for spec in args.variant]
+    if len({variant.name for variant in variants}) != len(variants):
+        raise RuntimeError("Variant names must be unique.")
+
+    analysis_cache: Optional[AnalysisCache] = None
+    if args.analysis_cache_dir:
+        analysis_cache = AnalysisCache(
+            Path(args.analysis_cache_dir),
+            ttl_seconds=args.analysis_cache_ttl_hours * 3600,
+        )
+
+    tts_cache: Optional[TTSCache] = None
+    if args.tts_cache_dir:
+        tts_cache = TTSCache(
+            Path(args.tts_cache_dir),
+            max_bytes=int(args.tts_cache_max_mb * 1024 * 1024),
+            max_age_seconds=args.tts_cache_max_age_days * 86400,
+        )
+
+    checkpoint: Optional[RunCheckpoint] = None
+    if args.work_dir:
+        checkpoint = RunCheckpoint(args.work_dir, resume=args.resume)
 
     temp_clip_dir: Optional[TemporaryDirectory[str]] = None
-    clips_dir = args.clips_dir
+    clips_dir = args.clips_dir or (args.work_dir / "clips" if args.work_dir else None)
     if clips_dir:
         clips_dir.mkdir(parents=True, exist_ok=True)
     else:
         temp_clip_dir = TemporaryDirectory()
         clips_dir = Path(temp_clip_dir.name)
 
+    # Narration-only runs never mix, so they skip the numpy-backed mixing module entirely.
+    schedule = None if args.skip_video else schedule_policy_from_args(args)
+    ducking = ducking_policy_from_args(args)
+    alignment = alignment_policy_from_args(args)
+    clip_store = clip_store_from_args(args, mixing=not args.skip_video)
+    synthesizer = ClipSynthesizer(
+        eleven_api_key,
+        voice_map,
+        args.model_id,
+        clips_dir,
+        stability=args.stability,
+        similarity_boost=args.similarity,
+        output_format=args.output_format,
+        use_speaker_boost=not args.disable_speaker_boost,
+        requests_per_second=args.tts_rate_limit,
+        max_retries=args.tts_max_retries,
+        cache=tts_cache,
+        checkpoint=checkpoint,
+        clip_store=clip_store,
+        write_clips=bool(args.clips_dir),
+    )
+
+    # The checkpoint and the analysis cache are both keyed on the source's content; hash it once.
+    video_sha256 = hash_file(args.video) if checkpoint or analysis_cache else None
+    analysis_key: Optional[str] = None
+    commentary: Optional[Commentary] = None
+    if checkpoint:
+        segmentation = None
+        if args.segment_seconds > 0:
+            segmentation = {"window_seconds": args.segment_seconds, "overlap_seconds": args.segment_overlap}
+        analysis_key = AnalysisCache.make_key(
+            args.video,
+            args.prompt.read_text(),
+            args.gemini_model,
+            args.analysis_fps,
+            extra=analysis_cache_extra(analysis_proxy_from_args(args), segmentation),
+            video_sha256=video_sha256,
+        )
+        commentary = checkpoint.load_commentary(analysis_key)
+        if commentary is not None:
+            print(f"Reusing commentary from checkpoint in {args.work_dir}")
+
     try:
-        clip_paths = synthesize_events_to_disk(
-            commentary.events,
-            eleven_api_key,
-            voice_map,
-            args.model_id,
-            clips_dir,
-            stability=args.stability,
-            similarity_boost=args.similarity,
-            output_format=args.output_format,
-            use_speaker_boost=not args.disable_speaker_boost,
+        if args.pipelined and commentary is None:
+
+            def record_analysis(raw_commentary: Commentary) -> None:
+                # The checkpoint keeps the raw analysis; alignment is reapplied on resume.
+                if checkpoint and analysis_key:
+                    checkpoint.record_commentary(analysis_key, raw_commentary)
+
+            commentary, clip_paths = run_pipelined(
+                args.video,
+                args.prompt,
+                gemini_api_key,
+                synthesizer,
+                None if args.skip_video else args.output,
+                tts_concurrency=args.tts_concurrency,
+                model=args.gemini_model,
+                fps=args.analysis_fps,
+                cache=analysis_cache,
+                bypass_cache=args.refresh_analysis,
+                inline_max_bytes=int(args.inline_max_mb * 1024 * 1024),
+                proxy=analysis_proxy_from_args(args),
+                structured_output=not args.no_structured_output,
+                background_volume=args.background_volume,
+                commentary_volume=args.commentary_volume,
+                schedule=schedule,
+                ducking=ducking,
+                loudness_target=args.loudness_target,
+                fragment_seconds=args.fragment_seconds if args.progressive else None,
+                alignment=alignment,
+                on_analysis=record_analysis,
+                video_sha256=video_sha256,
+            )
+            write_commentary_json(args.commentary_json, commentary)
+            if args.skip_video:
+                print(f"Synthesized {len(clip_paths)} clips in {clips_dir}")
+            else:
+                print(f"Created narrated video at {args.output}")
+            return
+
+        if commentary is None:
+            commentary = analyze_from_args(args, gemini_api_key, analysis_cache, video_sha256)
+            if checkpoint and analysis_key:
+                checkpoint.record_commentary(analysis_key, commentary)
+        if alignment:
+            from alignment import align_commentary
+
+            commentary = align_commentary(
+                args.video, commentary, alignment, scene_path=alignment_scene_path(args, args.video)
+            )
+        write_commentary_json(args.commentary_json, commentary)
+
+        if variants:
+            renders = variant_renders_from_args(
+                args,
+                variants,
+                commentary,
+                gemini_api_key,
+                eleven_api_key,
+                synthesizer,
+                clips_dir,
+                analysis_cache,
+            )
+            render_variants(
+                args.video,
+                None if args.skip_video else args.output,
+                renders,
+                concurrency=args.tts_concurrency,
+                batch_lines=args.tts_batch_lines,
+                background_volume=args.background_volume,
+                commentary_volume=args.commentary_volume,
+                schedule=schedule,
+                ducking=ducking,
+                loudness_target=args.loudness_target,
+            )
+            if not args.skip_video:
+                print(f"Created {len(variants)} narrated videos next to {args.output}")
+            return
+
+        play_by_play_name = commentary.commentators.get("playByPlay", "Play-by-Play")
+        analyst_name = commentary.commentators.get("analyst", "Analyst")
+        play_voice_id = resolve_voice_id("playByPlay", voice_map)
+        analyst_voice_id = resolve_voice_id("analyst", voice_map)
+        print(f"Play-by-play voice: {play_by_play_name} -> {play_voice_id}")
+        print(f"Analyst voice: {analyst_name} -> {analyst_voice_id}")
+
+        events, numbers = scheduled_events(commentary.events, schedule)
+        if len(events) < len(commentary.events):
+            print(f"Skipping {len(commentary.events) - len(events)} events that would be cut off or cannot be scheduled")
+
+        if args.progressive and not args.skip_video:
+            synthesize_and_mix_progressive(
+                args.video,
+                args.output,
+                synthesizer,
+                events,
+                concurrency=args.tts_concurrency,
+                background_volume=args.background_volume,
+                commentary_volume=args.commentary_volume,
+                schedule=schedule,
+                ducking=ducking,
+                loudness_target=args.loudness_target,
+                fragment_seconds=args.fragment_seconds,
+                numbers=numbers,
+            )
+            print(f"Created narrated video at {args.output}")
+            return
+
+        clip_paths = synthesize_with_pool(
+            synthesizer,
+            events,
+            args.tts_concurrency,
+            batch_lines=args.tts_batch_lines,
+            numbers=numbers,
         )
 
         if args.skip_video:
@@ -561,16 +1059,42 @@ def main() -> None:
             print(f"Synthesized {len(clip_paths)} clips in {clips_dir}")
             return
 
+        from mixing import mix_commentary_with_video
+
+        mix_key: Optional[str] = None
+        if checkpoint:
+            mix_settings = {
+                "background_volume": args.background_volume,
+                "commentary_volume": args.commentary_volume,
+                "engine": args.mix_engine,
+                "schedule": schedule.to_dict(),
+                "ducking": ducking.to_dict() if ducking else None,
+                "loudness_target": args.loudness_target,
+            }
+            mix_key = checkpoint.mix_key(args.video, clip_paths, events, args.output, mix_settings)
+            if checkpoint.mix_is_current(mix_key, args.output):
+                print(f"Narrated video at {args.output} is up to date with the checkpoint")
+                return
+
         mix_commentary_with_video(
             args.video,
             clip_paths,
-            commentary.events,
+            events,
             args.output,
             background_volume=args.background_volume,
             commentary_volume=args.commentary_volume,
+            engine=args.mix_engine,
+            schedule=schedule,
+            ducking=ducking,
+            loudness_target=args.loudness_target,
+            clip_store=clip_store,
         )
+        if checkpoint and mix_key:
+            checkpoint.record_mix(mix_key, args.output)
         print(f"Created narrated video at {args.output}")
     finally:
+        if clip_store:
+            clip_store.close()
         if temp_clip_dir:
             temp_clip_dir.cleanup()
 
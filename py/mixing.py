@@ -0,0 +1,1064 @@
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from core import (
+    DEFAULT_AUDIO_SAMPLE_RATE,
+    DEFAULT_CLIP_STORE_MEMORY_MB,
+    DEFAULT_DUCK_ATTACK_SECONDS,
+    DEFAULT_DUCK_IDLE_VOLUME,
+    DEFAULT_DUCK_RELEASE_SECONDS,
+    DEFAULT_FADE_OUT_SECONDS,
+    DEFAULT_FRAGMENT_SECONDS,
+    DEFAULT_LOUDNESS_RANGE,
+    DEFAULT_LOUDNESS_TRUE_PEAK,
+    DEFAULT_MIX_ENGINE,
+    DEFAULT_SCHEDULE_GAP_SECONDS,
+    DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS,
+    DUCK_ACTIVITY_THRESHOLD,
+    DUCK_BLOCK_SECONDS,
+    MAX_SPEECH_CHARS_PER_SECOND,
+    METRICS,
+    MIN_CLIP_DURATION,
+    MIX_CHANNELS,
+    MIX_CHUNK_SECONDS,
+    MIX_ENGINES,
+    CommentaryEvent,
+    normalize_commentator_key,
+    probe_audio_sample_rate,
+)
+
+
+# moviepy (and the imageio/ffmpeg discovery behind it) is only imported by the moviepy engine.
+
+__all__ = [
+    "compute_interrupt_targets",
+    "compute_interrupt_cutoffs",
+    "SchedulePolicy",
+    "ClipPlacement",
+    "is_low_priority",
+    "schedule_clips",
+    "estimate_speech_seconds",
+    "drop_unschedulable_events",
+    "schedulable_event_indices",
+    "uninterrupted_event_indices",
+    "ClipStore",
+    "decode_audio_pcm",
+    "BackgroundStream",
+    "load_clip_pcm",
+    "DuckingPolicy",
+    "place_clips",
+    "commentary_activity",
+    "ducking_gain_curve",
+    "PcmMixer",
+    "iter_mixed_pcm",
+    "iter_progressive_mixed_pcm",
+    "pcm_to_s16le",
+    "PcmMuxer",
+    "write_commentary_video_numpy",
+    "load_background_pcm",
+    "mux_mixed_pcm",
+    "mux_progressive_pcm",
+    "write_commentary_video_moviepy",
+    "mix_commentary_with_video",
+]
+
+
+def compute_interrupt_targets(events: Sequence[CommentaryEvent]) -> List[Optional[int]]:
+    # The index of the line each event cuts off: the latest earlier line by the commentator
+    # named in its `interrupts` field.
+    targets: List[Optional[int]] = [None] * len(events)
+    last_index_by_commentator: Dict[str, int] = {}
+
+    for index, event in enumerate(events):
+        commentator_key = normalize_commentator_key(event.commentator)
+        if commentator_key:
+            last_index_by_commentator[commentator_key] = index
+
+        interrupt_target = normalize_commentator_key(event.interrupts)
+        if interrupt_target:
+            interrupted_index = last_index_by_commentator.get(interrupt_target)
+            if interrupted_index is not None and interrupted_index < index:
+                targets[index] = interrupted_index
+
+    return targets
+
+
+def compute_interrupt_cutoffs(events: Sequence[CommentaryEvent]) -> List[Optional[float]]:
+    cutoffs: List[Optional[float]] = [None] * len(events)
+    for event, interrupted_index in zip(events, compute_interrupt_targets(events)):
+        if interrupted_index is None:
+            continue
+        cutoff_time = event.start_seconds
+        existing = cutoffs[interrupted_index]
+        if existing is None or cutoff_time < existing:
+            cutoffs[interrupted_index] = cutoff_time
+    return cutoffs
+
+
+@dataclass
+class SchedulePolicy:
+    resolve_overlaps: bool = False
+    max_shift: float = DEFAULT_SCHEDULE_MAX_SHIFT_SECONDS
+    gap: float = DEFAULT_SCHEDULE_GAP_SECONDS
+    fade_out: float = DEFAULT_FADE_OUT_SECONDS
+    drop_low_priority: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "resolve_overlaps": self.resolve_overlaps,
+            "max_shift": self.max_shift,
+            "gap": self.gap,
+            "fade_out": self.fade_out,
+            "drop_low_priority": self.drop_low_priority,
+        }
+
+
+@dataclass
+class ClipPlacement:
+    start: float
+    end: float
+    fade_out: float = 0.0
+
+
+def is_low_priority(event: CommentaryEvent) -> bool:
+    key = normalize_commentator_key(event.commentator)
+    return key.startswith("analyst") or key.startswith("color")
+
+
+def schedule_clips(
+    events: Sequence[CommentaryEvent],
+    clip_durations: Sequence[float],
+    policy: Optional[SchedulePolicy] = None,
+) -> List[Optional[ClipPlacement]]:
+    policy = policy or SchedulePolicy()
+    cutoffs = compute_interrupt_cutoffs(events)
+    placements: List[Optional[ClipPlacement]] = []
+    for event, duration, cutoff_time in zip(events, clip_durations, cutoffs):
+        start_time = event.start_seconds
+        end_time = start_time + duration
+        fade_out = 0.0
+        if cutoff_time is not None:
+            if cutoff_time <= start_time + MIN_CLIP_DURATION:
+                placements.append(None)
+                continue
+            if cutoff_time < end_time:
+                end_time = cutoff_time
+                fade_out = policy.fade_out if policy.resolve_overlaps else 0.0
+        placements.append(ClipPlacement(start_time, end_time, fade_out))
+
+    if not policy.resolve_overlaps:
+        return placements
+
+    # Walk the clips in time order; each collision with the clip still playing is resolved by
+    # delaying the new line slightly, dropping it if it is a low-priority analyst line talking
+    # over play-by-play, or otherwise cutting the earlier line short with a fade.
+    last_index: Optional[int] = None
+    for index, placement in enumerate(placements):
+        if placement is None:
+            continue
+        previous = placements[last_index] if last_index is not None else None
+        if previous is None:
+            last_index = index
+            continue
+
+        overlap = previous.end + policy.gap - placement.start
+        if overlap <= 0:
+            last_index = index
+            continue
+
+        # An interruption must land on its cue, so it cuts the earlier line instead of waiting.
+        if overlap <= policy.max_shift and not events[index].interrupts:
+            duration = placement.end - placement.start
+            placement.start += overlap
+            placement.end = placement.start + duration
+            cutoff_time = cutoffs[index]
+            if cutoff_time is not None and cutoff_time < placement.end:
+                if cutoff_time <= placement.start + MIN_CLIP_DURATION:
+                    placements[index] = None
+                    continue
+                placement.end = cutoff_time
+                placement.fade_out = policy.fade_out
+            last_index = index
+            continue
+
+        if (
+            policy.drop_low_priority
+            and is_low_priority(events[index])
+            and not is_low_priority(events[last_index or 0])
+        ):
+            placements[index] = None
+            continue
+
+        if placement.start - previous.start > MIN_CLIP_DURATION:
+            previous.end = placement.start
+            previous.fade_out = policy.fade_out
+        else:
+            placements[last_index or 0] = None
+        last_index = index
+
+    return placements
+
+
+def estimate_speech_seconds(text: str, chars_per_second: float = MAX_SPEECH_CHARS_PER_SECOND) -> float:
+    return len(text.strip()) / chars_per_second
+
+
+def schedulable_event_indices(
+    events: Sequence[CommentaryEvent],
+    policy: Optional[SchedulePolicy] = None,
+) -> List[int]:
+    # Estimated durations are lower bounds, so real clips only collide harder; skipping the
+    # other events avoids paying for speech the mixer would discard.
+    placements = schedule_clips(events, [estimate_speech_seconds(event.call) for event in events], policy)
+    return [index for index, placement in enumerate(placements) if placement is not None]
+
+
+def uninterrupted_event_indices(events: Sequence[CommentaryEvent]) -> List[int]:
+    # Lines cut off by an interrupt within MIN_CLIP_DURATION of their start are never placed,
+    # whatever their real duration.
+    cutoffs = compute_interrupt_cutoffs(events)
+    return [
+        index
+        for index, (event, cutoff_time) in enumerate(zip(events, cutoffs))
+        if cutoff_time is None or cutoff_time > event.start_seconds + MIN_CLIP_DURATION
+    ]
+
+
+def drop_unschedulable_events(
+    events: Sequence[CommentaryEvent],
+    policy: Optional[SchedulePolicy] = None,
+) -> Tuple[List[CommentaryEvent], List[CommentaryEvent]]:
+    kept_indices = set(schedulable_event_indices(events, policy))
+    kept = [event for index, event in enumerate(events) if index in kept_indices]
+    dropped = [event for index, event in enumerate(events) if index not in kept_indices]
+    return kept, dropped
+
+
+class ClipStore:
+    # Holds raw 16-bit mono TTS output for the numpy mixer so clips are neither written
+    # nor decoded again. Samples are views over the response bytes; once the in-memory
+    # total passes max_memory_bytes further clips are appended to a spill file and read
+    # back through a memory map.
+
+    def __init__(
+        self,
+        max_memory_bytes: int = int(DEFAULT_CLIP_STORE_MEMORY_MB * 1024 * 1024),
+        spill_dir: Optional[Path] = None,
+    ) -> None:
+        self.max_memory_bytes = max_memory_bytes
+        self.spill_dir = spill_dir
+        self.memory_bytes = 0
+        self.spilled_bytes = 0
+        self._clips: Dict[Path, Tuple[np.ndarray, int]] = {}
+        self._spill_file: Optional[IO[bytes]] = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, clip_path: Path) -> bool:
+        with self._lock:
+            return clip_path in self._clips
+
+    def put(self, clip_path: Path, pcm: bytes, sample_rate: int) -> None:
+        size = len(pcm) - len(pcm) % 2
+        with self._lock:
+            if size == 0 or self.memory_bytes + size <= self.max_memory_bytes:
+                samples = np.frombuffer(pcm, dtype="<i2", count=size // 2)
+                self.memory_bytes += size
+            else:
+                if self._spill_file is None:
+                    if self.spill_dir:
+                        self.spill_dir.mkdir(parents=True, exist_ok=True)
+                    self._spill_file = NamedTemporaryFile(prefix="clips-", suffix=".pcm", dir=self.spill_dir)
+                offset = self.spilled_bytes
+                self._spill_file.write(memoryview(pcm)[:size])
+                self._spill_file.flush()
+                self.spilled_bytes += size
+                samples = np.memmap(self._spill_file.name, dtype="<i2", mode="r", offset=offset, shape=(size // 2,))
+            self._clips[clip_path] = (samples, sample_rate)
+
+    def pcm(self, clip_path: Path, sample_rate: int, channels: int = MIX_CHANNELS) -> np.ndarray:
+        with self._lock:
+            samples, clip_rate = self._clips[clip_path]
+        audio = samples.astype(np.float32) / 32768.0
+        if clip_rate != sample_rate and len(audio):
+            frames = int(round(len(audio) * sample_rate / clip_rate))
+            positions = np.arange(frames, dtype=np.float64) * (clip_rate / sample_rate)
+            audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+        if channels > 1:
+            # Same -3 dB mono upmix that ffmpeg applies when decoding clip files.
+            audio *= np.float32(np.sqrt(0.5))
+        return np.repeat(audio[:, None], channels, axis=1)
+
+    def close(self) -> None:
+        with self._lock:
+            self._clips.clear()
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+
+@METRICS.traced("ffmpeg.decode")
+def decode_audio_pcm(path: Path, sample_rate: int, channels: int = MIX_CHANNELS) -> np.ndarray:
+    result = subprocess.run(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            str(path),
+            "-map",
+            "0:a:0",
+            "-f",
+            "f32le",
+            "-acodec",
+            "pcm_f32le",
+            "-ac",
+            str(channels),
+            "-ar",
+            str(sample_rate),
+            "-",
+        ],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.decode(errors='replace').strip()}")
+    METRICS.annotate(path=str(path), bytes=len(result.stdout))
+    return np.frombuffer(result.stdout, dtype=np.float32).reshape(-1, channels)
+
+
+class BackgroundStream:
+    # Decodes a file's audio track through an ffmpeg pipe on demand. The mixer reads it
+    # front to back, so frames before the last requested range are dropped and memory
+    # stays at a few chunks however long the track is. A file without audio is an
+    # empty stream.
+
+    def __init__(self, path: Path, sample_rate: int, channels: int = MIX_CHANNELS) -> None:
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.block_bytes = max(1, int(MIX_CHUNK_SECONDS * sample_rate)) * channels * 4
+        self.process: Optional[subprocess.Popen] = None
+        self.buffer = np.zeros((0, channels), dtype=np.float32)
+        self.buffer_start = 0
+        self.total_frames: Optional[int] = None
+        self.bytes_read = 0
+        self._pending = b""
+
+    def __enter__(self) -> "BackgroundStream":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        self.close()
+
+    def _start(self) -> None:
+        if probe_audio_sample_rate(self.path) is None:
+            self.total_frames = 0
+            return
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-v",
+                "error",
+                "-i",
+                str(self.path),
+                "-map",
+                "0:a:0",
+                "-f",
+                "f32le",
+                "-acodec",
+                "pcm_f32le",
+                "-ac",
+                str(self.channels),
+                "-ar",
+                str(self.sample_rate),
+                "-",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def _fill(self, end_frame: int) -> None:
+        if self.process is None and self.total_frames is None:
+            self._start()
+        while self.total_frames is None and self.buffer_start + len(self.buffer) < end_frame:
+            assert self.process and self.process.stdout and self.process.stderr
+            data = self.process.stdout.read(self.block_bytes)
+            if not data:
+                stderr = self.process.stderr.read()
+                if self.process.wait() != 0:
+                    raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+                self.total_frames = self.buffer_start + len(self.buffer)
+                break
+            self.bytes_read += len(data)
+            data = self._pending + data
+            frame_bytes = self.channels * 4
+            usable = len(data) - len(data) % frame_bytes
+            self._pending = data[usable:]
+            frames = np.frombuffer(data, dtype=np.float32, count=usable // 4).reshape(-1, self.channels)
+            self.buffer = np.concatenate([self.buffer, frames])
+
+    def available(self, end_frame: int) -> int:
+        # Frames known to exist up to end_frame: end_frame itself unless the track ends first.
+        self._fill(end_frame)
+        return min(end_frame, self.buffer_start + len(self.buffer))
+
+    def segment(self, start_frame: int, end_frame: int) -> np.ndarray:
+        if start_frame < self.buffer_start:
+            raise ValueError("BackgroundStream can only be read forwards.")
+        self._fill(end_frame)
+        self.buffer = self.buffer[start_frame - self.buffer_start :]
+        self.buffer_start = start_frame
+        return self.buffer[: max(0, end_frame - start_frame)]
+
+    def close(self) -> None:
+        if self.process is None:
+            return
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        for pipe in (self.process.stdout, self.process.stderr):
+            if pipe:
+                pipe.close()
+        self.process = None
+
+
+def load_clip_pcm(clip_path: Path, sample_rate: int, clip_store: Optional[ClipStore] = None) -> np.ndarray:
+    if clip_store is not None and clip_path in clip_store:
+        return clip_store.pcm(clip_path, sample_rate)
+    return decode_audio_pcm(clip_path, sample_rate)
+
+
+# A background track is either fully decoded or streamed from ffmpeg as the mix advances.
+Background = Union[np.ndarray, BackgroundStream]
+
+
+@dataclass
+class DuckingPolicy:
+    idle_volume: float = DEFAULT_DUCK_IDLE_VOLUME
+    attack: float = DEFAULT_DUCK_ATTACK_SECONDS
+    release: float = DEFAULT_DUCK_RELEASE_SECONDS
+    threshold: float = DUCK_ACTIVITY_THRESHOLD
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "idle_volume": self.idle_volume,
+            "attack": self.attack,
+            "release": self.release,
+            "threshold": self.threshold,
+        }
+
+
+def place_clips(
+    clips: Sequence[np.ndarray],
+    schedule_placements: Sequence[Optional[ClipPlacement]],
+    sample_rate: int,
+) -> List[Tuple[int, np.ndarray]]:
+    placements: List[Tuple[int, np.ndarray]] = []
+    for clip, placement in zip(clips, schedule_placements):
+        if not placement:
+            continue
+        start_frame = int(round(placement.start * sample_rate))
+        end_frame = int(round(placement.end * sample_rate))
+        length = min(end_frame - start_frame, len(clip))
+        if length <= 0:
+            continue
+        clip = clip[:length]
+        fade_frames = min(length, int(placement.fade_out * sample_rate))
+        if fade_frames > 0:
+            clip = clip.copy()
+            clip[-fade_frames:] *= np.linspace(1.0, 0.0, fade_frames, dtype=np.float32)[:, None]
+        placements.append((start_frame, clip))
+    return placements
+
+
+def commentary_activity(
+    placements: Sequence[Tuple[int, np.ndarray]],
+    first_frame: int,
+    block_count: int,
+    block_frames: int,
+    threshold: float,
+) -> np.ndarray:
+    # Block-wise RMS of the placed clips over a block-aligned window, so leading and
+    # trailing silence in the TTS output does not hold the background down.
+    active = np.zeros(block_count, dtype=bool)
+    window_end = first_frame + block_count * block_frames
+    for start_frame, clip in placements:
+        overlap_start = max(first_frame, start_frame)
+        overlap_end = min(window_end, start_frame + len(clip))
+        if overlap_start >= overlap_end:
+            continue
+        first_block = (overlap_start - first_frame) // block_frames
+        segment_start = first_frame + first_block * block_frames
+        blocks = -(-(overlap_end - segment_start) // block_frames)
+        segment = np.zeros((blocks * block_frames, clip.shape[1]), dtype=np.float32)
+        segment[overlap_start - segment_start : overlap_end - segment_start] = clip[
+            overlap_start - start_frame : overlap_end - start_frame
+        ]
+        rms = np.sqrt(np.mean(np.square(segment.reshape(blocks, -1)), axis=1))
+        active[first_block : first_block + blocks] |= rms > threshold
+    return active
+
+
+def ducking_gain_curve(
+    active: np.ndarray,
+    block_seconds: float,
+    background_volume: float,
+    ducking: DuckingPolicy,
+) -> np.ndarray:
+    # The schedule is known up front, so the attack ramp can start ahead of each line and
+    # the release ramp follows its end; both are linear in the distance to the nearest
+    # active block, computed with running maxima instead of a per-sample filter loop.
+    indices = np.arange(len(active), dtype=np.float64)
+    never = np.float64(len(active) + 1)
+    last_active = np.maximum.accumulate(np.where(active, indices, -never))
+    next_active = np.minimum.accumulate(np.where(active, indices, 2 * never)[::-1])[::-1]
+    since_active = (indices - last_active) * block_seconds
+    until_active = (next_active - indices) * block_seconds
+    release = np.clip(1.0 - since_active / max(ducking.release, block_seconds), 0.0, 1.0)
+    attack = np.clip(1.0 - until_active / max(ducking.attack, block_seconds), 0.0, 1.0)
+    duck = np.maximum(attack, release)
+    return (ducking.idle_volume + (background_volume - ducking.idle_volume) * duck).astype(np.float32)
+
+
+class PcmMixer:
+    # Mixes any frame range on demand from the background and the placed clips, so callers
+    # can emit chunks as soon as the clips that reach into them are available.
+
+    def __init__(
+        self,
+        background: Optional[Background],
+        sample_rate: int,
+        background_volume: float = 0.45,
+        commentary_volume: float = 1.0,
+        ducking: Optional[DuckingPolicy] = None,
+    ) -> None:
+        self.background = background
+        self.sample_rate = sample_rate
+        self.background_volume = background_volume
+        self.commentary_volume = commentary_volume
+        self.ducking = ducking
+        self.block_frames = max(1, int(DUCK_BLOCK_SECONDS * sample_rate))
+        self.placements: List[Tuple[int, np.ndarray]] = []
+
+    def place(self, clips: Sequence[np.ndarray], schedule_placements: Sequence[Optional[ClipPlacement]]) -> None:
+        self.placements = place_clips(clips, schedule_placements, self.sample_rate)
+
+    def end_frame(self, limit: int) -> int:
+        # End of the mix, looking no further than `limit` into a streamed background.
+        background = self.background
+        if isinstance(background, BackgroundStream):
+            end = background.available(limit)
+        else:
+            end = len(background) if background is not None else 0
+        for start_frame, clip in self.placements:
+            end = max(end, start_frame + len(clip))
+        return end
+
+    def background_gain(self, start_frame: int, end_frame: int) -> np.ndarray:
+        assert self.ducking is not None
+        # Only blocks within the attack/release reach of this range can affect its gain.
+        block_frames = self.block_frames
+        margin = int(np.ceil(max(self.ducking.attack, self.ducking.release) * self.sample_rate / block_frames)) + 1
+        first_block = max(0, start_frame // block_frames - margin)
+        block_count = -(-end_frame // block_frames) + margin - first_block
+        active = commentary_activity(
+            self.placements,
+            first_block * block_frames,
+            block_count,
+            block_frames,
+            self.ducking.threshold,
+        )
+        gains = ducking_gain_curve(active, block_frames / self.sample_rate, self.background_volume, self.ducking)
+        frames = np.arange(start_frame, end_frame, dtype=np.float64)
+        positions = (frames + 0.5) / block_frames - 0.5 - first_block
+        return np.interp(positions, np.arange(block_count, dtype=np.float64), gains).astype(np.float32)
+
+    def mix(self, chunk_start: int, chunk_end: int) -> np.ndarray:
+        chunk = np.zeros((chunk_end - chunk_start, MIX_CHANNELS), dtype=np.float32)
+        background = self.background
+        if isinstance(background, BackgroundStream):
+            segment = background.segment(chunk_start, chunk_end)
+        else:
+            segment = background[chunk_start:chunk_end] if background is not None else chunk[:0]
+        if len(segment):
+            if self.ducking is not None:
+                gain = self.background_gain(chunk_start, chunk_start + len(segment))
+                np.multiply(segment, gain[:, None], out=chunk[: len(segment)])
+            else:
+                np.multiply(segment, self.background_volume, out=chunk[: len(segment)])
+
+        for start_frame, clip in self.placements:
+            overlap_start = max(chunk_start, start_frame)
+            overlap_end = min(chunk_end, start_frame + len(clip))
+            if overlap_start >= overlap_end:
+                continue
+            chunk[overlap_start - chunk_start : overlap_end - chunk_start] += (
+                clip[overlap_start - start_frame : overlap_end - start_frame] * self.commentary_volume
+            )
+
+        np.clip(chunk, -1.0, 1.0, out=chunk)
+        return chunk
+
+
+def iter_mixed_pcm(
+    background: Optional[Background],
+    clips: Sequence[np.ndarray],
+    events: Sequence[CommentaryEvent],
+    sample_rate: int,
+    background_volume: float = 0.45,
+    commentary_volume: float = 1.0,
+    chunk_seconds: float = MIX_CHUNK_SECONDS,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+) -> Iterator[np.ndarray]:
+    mixer = PcmMixer(background, sample_rate, background_volume, commentary_volume, ducking)
+    mixer.place(clips, schedule_clips(events, [len(clip) / sample_rate for clip in clips], schedule))
+    chunk_frames = max(1, int(chunk_seconds * sample_rate))
+    chunk_start = 0
+    while True:
+        total_frames = mixer.end_frame(chunk_start + chunk_frames)
+        if chunk_start >= total_frames:
+            if not total_frames:
+                raise RuntimeError("No audio sources available to mix.")
+            return
+        yield mixer.mix(chunk_start, min(chunk_start + chunk_frames, total_frames))
+        chunk_start += chunk_frames
+
+
+def iter_progressive_mixed_pcm(
+    background: Optional[Background],
+    clip_loaders: Sequence[Callable[[], np.ndarray]],
+    events: Sequence[CommentaryEvent],
+    sample_rate: int,
+    background_volume: float = 0.45,
+    commentary_volume: float = 1.0,
+    chunk_seconds: float = MIX_CHUNK_SECONDS,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+) -> Iterator[np.ndarray]:
+    # clip_loaders block until their clip is ready (e.g. Future.result of a synthesis job).
+    # Each chunk waits only for the clips of events starting before its end (plus the fade
+    # and attack lookahead). Scheduling never moves a line earlier, and a later line can only
+    # cut an earlier one from its own start minus the fade, or drop it outright when it starts
+    # within MIN_CLIP_DURATION of it. Placing every event that starts that far past the chunk
+    # therefore reproduces the full schedule for everything already emitted.
+    policy = schedule or SchedulePolicy()
+    lookahead = policy.fade_out + (ducking.attack if ducking else 0.0) + DUCK_BLOCK_SECONDS + MIN_CLIP_DURATION
+    mixer = PcmMixer(background, sample_rate, background_volume, commentary_volume, ducking)
+    chunk_frames = max(1, int(chunk_seconds * sample_rate))
+    clips: List[np.ndarray] = []
+    placed = -1
+    chunk_start = 0
+    while True:
+        needed = len(clips)
+        if chunk_start + chunk_frames > mixer.end_frame(chunk_start + chunk_frames):
+            # The final chunk's length depends on every clip that might run past the end.
+            needed = len(events)
+        horizon = (chunk_start + chunk_frames) / sample_rate + lookahead
+        while needed < len(events) and events[needed].start_seconds < horizon:
+            needed += 1
+        while len(clips) < needed:
+            clips.append(clip_loaders[len(clips)]())
+        if len(clips) != placed:
+            durations = [len(clip) / sample_rate for clip in clips]
+            mixer.place(clips, schedule_clips(events[: len(clips)], durations, policy))
+            placed = len(clips)
+
+        total_frames = mixer.end_frame(chunk_start + chunk_frames)
+        if chunk_start >= total_frames:
+            if not total_frames:
+                raise RuntimeError("No audio sources available to mix.")
+            return
+        yield mixer.mix(chunk_start, min(chunk_start + chunk_frames, total_frames))
+        chunk_start += chunk_frames
+
+
+def pcm_to_s16le(samples: np.ndarray) -> bytes:
+    return (samples * 32767.0).astype("<i2").tobytes()
+
+
+class PcmMuxer:
+    # Streams raw s16le PCM into ffmpeg's stdin and muxes it with the source video track,
+    # so no intermediate audio file is written.
+
+    def __init__(
+        self,
+        video_path: Path,
+        output_path: Path,
+        sample_rate: int,
+        channels: int = MIX_CHANNELS,
+        loudness_target: Optional[float] = None,
+        fragment_seconds: Optional[float] = None,
+    ) -> None:
+        self.video_path = video_path
+        self.output_path = output_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.loudness_target = loudness_target
+        self.fragment_seconds = fragment_seconds
+        self.process: Optional[subprocess.Popen] = None
+        self._stderr = bytearray()
+        self._stderr_thread: Optional[threading.Thread] = None
+        self._closed_early = False
+        self._span = METRICS.span("ffmpeg.mux", output=str(output_path), sample_rate=sample_rate)
+        self._span_attributes: Dict[str, Any] = {}
+        self.bytes_written = 0
+
+    def __enter__(self) -> "PcmMuxer":
+        self._span_attributes = self._span.__enter__()
+        audio_filters: List[str] = []
+        if self.loudness_target is not None:
+            # Single-pass (dynamic) EBU R128 normalization, applied while the mix streams in;
+            # loudnorm resamples internally, so resample back to the mix rate afterwards.
+            audio_filters = [
+                "-af",
+                f"loudnorm=I={self.loudness_target}:TP={DEFAULT_LOUDNESS_TRUE_PEAK}:LRA={DEFAULT_LOUDNESS_RANGE},"
+                f"aresample={self.sample_rate}",
+            ]
+        self.process = subprocess.Popen(
+            [
+                "ffmpeg",
+                "-y",
+                "-v",
+                "error",
+                "-nostats",
+                "-i",
+                str(self.video_path),
+                "-f",
+                "s16le",
+                "-ar",
+                str(self.sample_rate),
+                "-ac",
+                str(self.channels),
+                "-i",
+                "pipe:0",
+                "-map",
+                "0:v:0",
+                "-map",
+                "1:a:0",
+                *audio_filters,
+                "-c:v",
+                "copy",
+                "-c:a",
+                "aac",
+                "-shortest",
+                *self._output_options(),
+                str(self.output_path),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        return self
+
+    def _output_options(self) -> List[str]:
+        # HLS playlists and fragmented MP4 are playable while ffmpeg is still writing them,
+        # so a player can start on the first segment while later audio is being mixed.
+        if self.output_path.suffix.lower() == ".m3u8":
+            return [
+                "-f",
+                "hls",
+                "-hls_time",
+                str(self.fragment_seconds or DEFAULT_FRAGMENT_SECONDS),
+                "-hls_playlist_type",
+                "event",
+                "-hls_flags",
+                "independent_segments+temp_file",
+                "-hls_segment_filename",
+                str(self.output_path.with_name(f"{self.output_path.stem}_%05d.ts")),
+            ]
+        if self.fragment_seconds:
+            return [
+                "-movflags",
+                "+frag_keyframe+empty_moov+default_base_moof",
+                "-frag_duration",
+                str(int(self.fragment_seconds * 1_000_000)),
+            ]
+        return []
+
+    def _drain_stderr(self) -> None:
+        assert self.process and self.process.stderr
+        for line in self.process.stderr:
+            self._stderr.extend(line)
+
+    def write(self, data: bytes) -> None:
+        if self._closed_early or not self.process or not self.process.stdin:
+            return
+        try:
+            self.process.stdin.write(data)
+            self.bytes_written += len(data)
+        except BrokenPipeError:
+            # ffmpeg stops reading once -shortest has reached the end of the video.
+            self._closed_early = True
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        assert self.process
+        try:
+            if self.process.stdin:
+                self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if exc_type is not None:
+            self.process.kill()
+        returncode = self.process.wait()
+        if self._stderr_thread:
+            self._stderr_thread.join()
+
+        if exc_type is not None or returncode != 0:
+            self.output_path.unlink(missing_ok=True)
+            if self.output_path.suffix.lower() == ".m3u8":
+                for segment in self.output_path.parent.glob(f"{self.output_path.stem}_*.ts"):
+                    segment.unlink(missing_ok=True)
+
+        self._span_attributes["bytes"] = self.bytes_written
+        if exc_type is None and returncode != 0:
+            error = RuntimeError(f"ffmpeg failed: {self._stderr.decode(errors='replace').strip()}")
+            try:
+                self._span.__exit__(RuntimeError, error, None)
+            except RuntimeError:
+                pass
+            raise error
+        self._span.__exit__(exc_type, exc, traceback)
+
+
+def write_commentary_video_numpy(
+    video_path: Path,
+    clip_paths: Sequence[Path],
+    events: Sequence[CommentaryEvent],
+    output_path: Path,
+    background_volume: float,
+    commentary_volume: float,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+    loudness_target: Optional[float] = None,
+    clip_store: Optional[ClipStore] = None,
+) -> None:
+    sample_rate = probe_audio_sample_rate(video_path) or DEFAULT_AUDIO_SAMPLE_RATE
+    clips = [load_clip_pcm(clip_path, sample_rate, clip_store) for clip_path in clip_paths]
+    with BackgroundStream(video_path, sample_rate) as background:
+        mux_mixed_pcm(
+            video_path,
+            output_path,
+            background,
+            clips,
+            events,
+            sample_rate,
+            background_volume,
+            commentary_volume,
+            schedule=schedule,
+            ducking=ducking,
+            loudness_target=loudness_target,
+        )
+
+
+def load_background_pcm(video_path: Path, sample_rate: int) -> Optional[np.ndarray]:
+    # Decodes the whole track into memory; the mix paths stream it with BackgroundStream.
+    if probe_audio_sample_rate(video_path) is None:
+        return None
+    return decode_audio_pcm(video_path, sample_rate)
+
+
+@METRICS.traced("mix.pcm")
+def mux_mixed_pcm(
+    video_path: Path,
+    output_path: Path,
+    background: Optional[Background],
+    clips: Sequence[np.ndarray],
+    events: Sequence[CommentaryEvent],
+    sample_rate: int,
+    background_volume: float,
+    commentary_volume: float,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+    loudness_target: Optional[float] = None,
+    fragment_seconds: Optional[float] = None,
+) -> None:
+    chunks = iter_mixed_pcm(
+        background,
+        clips,
+        events,
+        sample_rate,
+        background_volume=background_volume,
+        commentary_volume=commentary_volume,
+        schedule=schedule,
+        ducking=ducking,
+    )
+    with PcmMuxer(
+        video_path,
+        output_path,
+        sample_rate,
+        loudness_target=loudness_target,
+        fragment_seconds=fragment_seconds,
+    ) as muxer:
+        for chunk in chunks:
+            muxer.write(pcm_to_s16le(chunk))
+
+
+@METRICS.traced("mix.progressive")
+def mux_progressive_pcm(
+    video_path: Path,
+    output_path: Path,
+    background: Optional[Background],
+    clip_loaders: Sequence[Callable[[], np.ndarray]],
+    events: Sequence[CommentaryEvent],
+    sample_rate: int,
+    background_volume: float,
+    commentary_volume: float,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+    loudness_target: Optional[float] = None,
+    fragment_seconds: Optional[float] = DEFAULT_FRAGMENT_SECONDS,
+) -> None:
+    chunks = iter_progressive_mixed_pcm(
+        background,
+        clip_loaders,
+        events,
+        sample_rate,
+        background_volume=background_volume,
+        commentary_volume=commentary_volume,
+        schedule=schedule,
+        ducking=ducking,
+    )
+    started = time.perf_counter()
+    with PcmMuxer(
+        video_path,
+        output_path,
+        sample_rate,
+        loudness_target=loudness_target,
+        fragment_seconds=fragment_seconds,
+    ) as muxer:
+        for index, chunk in enumerate(chunks):
+            if index == 0:
+                METRICS.annotate(first_chunk_seconds=round(time.perf_counter() - started, 3))
+            muxer.write(pcm_to_s16le(chunk))
+
+
+def write_commentary_video_moviepy(
+    video_path: Path,
+    clip_paths: Sequence[Path],
+    events: Sequence[CommentaryEvent],
+    output_path: Path,
+    background_volume: float,
+    commentary_volume: float,
+    schedule: Optional[SchedulePolicy] = None,
+    loudness_target: Optional[float] = None,
+) -> None:
+    from moviepy.audio.fx.all import audio_fadeout  # type: ignore
+    from moviepy.editor import AudioFileClip, CompositeAudioClip, VideoFileClip  # type: ignore
+
+    with VideoFileClip(str(video_path)) as video:
+        base_audio = video.audio.volumex(background_volume) if video.audio else None
+        raw_clips: List[AudioFileClip] = []
+        overlay_clips: List[AudioFileClip] = []
+        composite_audio: Optional[CompositeAudioClip] = None
+
+        try:
+            for clip_path in clip_paths:
+                raw_clips.append(AudioFileClip(str(clip_path)))
+            placements = schedule_clips(events, [raw_clip.duration for raw_clip in raw_clips], schedule)
+
+            for raw_clip, placement in zip(raw_clips, placements):
+                if placement is None:
+                    continue
+                overlay = raw_clip.volumex(commentary_volume).set_start(placement.start)
+                if placement.end < placement.start + raw_clip.duration:
+                    overlay = overlay.set_end(placement.end)
+                if placement.fade_out > 0:
+                    overlay = overlay.fx(audio_fadeout, placement.fade_out)
+                overlay_clips.append(overlay)
+
+            audio_clips = ([base_audio] if base_audio else []) + overlay_clips
+            if not audio_clips:
+                raise RuntimeError("No audio sources available to mix.")
+
+            composite_audio = CompositeAudioClip(audio_clips)
+            # Determine an appropriate sample rate for export
+            audio_fps = None
+            for clip in audio_clips:
+                if getattr(clip, "fps", None):
+                    audio_fps = int(clip.fps)
+                    break
+            if not audio_fps:
+                audio_fps = DEFAULT_AUDIO_SAMPLE_RATE
+
+            with PcmMuxer(
+                video_path,
+                output_path,
+                audio_fps,
+                channels=composite_audio.nchannels,
+                loudness_target=loudness_target,
+            ) as muxer:
+                for chunk in composite_audio.iter_chunks(
+                    chunk_duration=MIX_CHUNK_SECONDS,
+                    fps=audio_fps,
+                    quantize=True,
+                    nbytes=2,
+                ):
+                    muxer.write(chunk.astype("<i2").tobytes())
+        finally:
+            for overlay in overlay_clips:
+                overlay.close()
+            for raw_clip in raw_clips:
+                raw_clip.close()
+            if base_audio:
+                base_audio.close()
+            if composite_audio:
+                composite_audio.close()
+
+
+@METRICS.traced("mix")
+def mix_commentary_with_video(
+    video_path: Path,
+    clip_paths: Sequence[Path],
+    events: Sequence[CommentaryEvent],
+    output_path: Path,
+    background_volume: float = 0.45,
+    commentary_volume: float = 1.0,
+    engine: str = DEFAULT_MIX_ENGINE,
+    schedule: Optional[SchedulePolicy] = None,
+    ducking: Optional[DuckingPolicy] = None,
+    loudness_target: Optional[float] = None,
+    clip_store: Optional[ClipStore] = None,
+) -> None:
+    if len(clip_paths) != len(events):
+        raise ValueError("Number of synthesized clips does not match commentary events.")
+    if engine not in MIX_ENGINES:
+        raise ValueError(f"Unknown mix engine `{engine}`; expected one of {', '.join(MIX_ENGINES)}.")
+    if ducking is not None and engine != "numpy":
+        raise ValueError("Background ducking requires the numpy mix engine.")
+    if clip_store is not None and engine != "numpy":
+        raise ValueError("The in-memory clip store requires the numpy mix engine.")
+
+    METRICS.annotate(engine=engine, clips=len(clip_paths), ducking=ducking is not None, loudness_target=loudness_target)
+    if engine == "numpy":
+        write_commentary_video_numpy(
+            video_path,
+            clip_paths,
+            events,
+            output_path,
+            background_volume,
+            commentary_volume,
+            schedule=schedule,
+            ducking=ducking,
+            loudness_target=loudness_target,
+            clip_store=clip_store,
+        )
+    else:
+        write_commentary_video_moviepy(
+            video_path,
+            clip_paths,
+            events,
+            output_path,
+            background_volume,
+            commentary_volume,
+            schedule=schedule,
+            loudness_target=loudness_target,
+        )
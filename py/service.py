@@ -0,0 +1,494 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from urllib.parse import parse_qs, urlsplit
+
+from batch import BatchJob, BatchRunner, add_runner_arguments
+from main import BASE_DIR, METRICS, PROJECT_ROOT, analysis_proxy_from_args, load_env_files
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_DATA_DIR = BASE_DIR / "service-data"
+DEFAULT_MAX_QUEUED_JOBS = 32
+DEFAULT_MAX_UPLOAD_MB = 2048
+DEFAULT_RETRY_AFTER_SECONDS = 30
+DEFAULT_MAX_METRIC_SPANS = 20000
+IO_CHUNK_SIZE = 1024 * 1024
+MAX_HEADER_COUNT = 100
+
+T = TypeVar("T")
+
+# Per-job overrides accepted as query parameters on submit; everything else comes from the
+# service's command-line defaults.
+JOB_OVERRIDE_FIELDS = (
+    "voice_id",
+    "voice2_id",
+    "background_volume",
+    "commentary_volume",
+    "stability",
+    "similarity",
+)
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class JobStore:
+    # Jobs live in SQLite so queued work survives restarts; a single connection is shared
+    # between the event loop and the job threads behind a lock.
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def requeue_interrupted(self) -> int:
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'"
+            )
+        return cursor.rowcount
+
+    def drop_reservations(self) -> List[Dict[str, Any]]:
+        # Uploads cut off by a shutdown never completed, so their slots are released.
+        with self._lock:
+            rows = self._connection.execute("SELECT payload FROM jobs WHERE status = 'uploading'").fetchall()
+            self._connection.execute("DELETE FROM jobs WHERE status = 'uploading'")
+        return [json.loads(row["payload"]) for row in rows]
+
+    def reserve(self, job_id: str, payload: Dict[str, Any], max_queued: int) -> bool:
+        # A job counts against the queue from the moment its upload starts, and the count and
+        # the insert are one statement, so concurrent submissions cannot overfill the queue.
+        with self._lock:
+            cursor = self._connection.execute(
+                """
+                INSERT INTO jobs (id, status, payload, created_at)
+                SELECT ?, 'uploading', ?, ?
+                WHERE (SELECT COUNT(*) FROM jobs WHERE status IN ('uploading', 'queued')) < ?
+                """,
+                (job_id, json.dumps(payload), time.time(), max_queued),
+            )
+        return cursor.rowcount == 1
+
+    def enqueue(self, job_id: str) -> None:
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET status = 'queued' WHERE id = ? AND status = 'uploading'", (job_id,))
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def claim_next(self) -> Optional[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+        return row["id"], json.loads(row["payload"])
+
+    def finish(self, job_id: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (record["status"], json.dumps(record), record.get("error"), time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["count"] for row in rows}
+
+
+class JobService:
+    # Uploads are accepted on the event loop and queued in SQLite; a dispatcher hands queued
+    # jobs to a shared BatchRunner so every job reuses the same API clients and stage pools.
+
+    def __init__(self, args: argparse.Namespace, store: JobStore, runner: BatchRunner) -> None:
+        self.args = args
+        self.store = store
+        self.runner = runner
+        self.uploads_dir = args.data_dir / "uploads"
+        self.outputs_dir = args.data_dir / "outputs"
+        self.uploads_dir.mkdir(parents=True, exist_ok=True)
+        self.outputs_dir.mkdir(parents=True, exist_ok=True)
+        self.job_pool = ThreadPoolExecutor(max_workers=runner.max_active_jobs, thread_name_prefix="job")
+        self.active_jobs = 0
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def close(self) -> None:
+        self.job_pool.shutdown()
+
+    async def run_store(self, method: Callable[..., T], *args: Any) -> T:
+        # SQLite calls wait on disk and on the store lock shared with job threads, so they
+        # run on the default executor rather than blocking every connection on the loop.
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def dispatch(self) -> None:
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            while self.active_jobs < self.runner.max_active_jobs:
+                claimed = await self.run_store(self.store.claim_next)
+                if claimed is None:
+                    break
+                self.active_jobs += 1
+                future = loop.run_in_executor(self.job_pool, self.run_job, *claimed)
+                future.add_done_callback(self._job_done)
+            await self._wakeup.wait()
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _job_done(self, _: "asyncio.Future[None]") -> None:
+        self.active_jobs -= 1
+        self.wake()
+
+    def run_job(self, job_id: str, payload: Dict[str, Any]) -> None:
+        try:
+            job = BatchJob.from_dict(payload, self.args.data_dir, self.args)
+            record = self.runner.run_job(job)
+        except Exception as error:
+            record = {"id": job_id, "status": "failed", "error": f"{type(error).__name__}: {error}"}
+        self.store.finish(job_id, record)
+        self.remove_upload(Path(payload["video"]))
+        if record["status"] == "succeeded":
+            print(f"[{job_id}] finished in {record['elapsed_seconds']:.1f}s")
+        else:
+            print(f"[{job_id}] failed: {record['error']}")
+
+    def remove_upload(self, upload_path: Path) -> None:
+        # The analysis proxy is derived from the upload and is never reused once the job is done.
+        proxy = analysis_proxy_from_args(self.args)
+        if proxy:
+            proxy.path_for(upload_path, self.args.analysis_fps).unlink(missing_ok=True)
+        upload_path.unlink(missing_ok=True)
+
+    def job_status(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        status: Dict[str, Any] = {
+            "id": job["id"],
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "status_url": f"/jobs/{job['id']}",
+        }
+        if job["status"] == "succeeded":
+            status["download_url"] = f"/jobs/{job['id']}/video"
+            status["elapsed_seconds"] = job["result"].get("elapsed_seconds")
+        if job["error"]:
+            status["error"] = job["error"]
+        return status
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                await self.handle_request(reader, writer)
+            except HttpError as error:
+                await write_json(writer, error.status, {"error": error.message}, error.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        method, target, headers = await read_request_head(reader)
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+
+        if method == "GET" and parts == ["healthz"]:
+            counts = await self.run_store(self.store.counts)
+            await write_json(writer, HTTPStatus.OK, {"jobs": counts, "active_jobs": self.active_jobs})
+        elif method == "POST" and parts == ["jobs"]:
+            await self.submit(reader, writer, headers, parse_qs(url.query))
+        elif method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+            job = await self.require_job(parts[1])
+            await write_json(writer, HTTPStatus.OK, self.job_status(job))
+        elif method == "GET" and len(parts) == 3 and parts[0] == "jobs" and parts[2] == "video":
+            await self.download(writer, await self.require_job(parts[1]))
+        elif parts[:1] in (["jobs"], ["healthz"]):
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not supported for {url.path}.")
+        else:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"No route for {url.path}.")
+
+    async def require_job(self, job_id: str) -> Dict[str, Any]:
+        job = await self.run_store(self.store.get, job_id)
+        if job is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"Unknown job `{job_id}`.")
+        return job
+
+    async def submit(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        headers: Dict[str, str],
+        query: Dict[str, List[str]],
+    ) -> None:
+        if "content-length" not in headers:
+            raise HttpError(HTTPStatus.LENGTH_REQUIRED, "Send the video as the request body with Content-Length.")
+        try:
+            content_length = int(headers["content-length"])
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Content-Length must be an integer.")
+        if content_length <= 0:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Request body is empty; send the video as the request body.")
+        if content_length > self.args.max_upload_mb * 1024 * 1024:
+            raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Uploads are limited to {self.args.max_upload_mb} MB.")
+
+        job_id = uuid.uuid4().hex
+        suffix = Path(query.get("filename", [""])[0]).suffix.lower() or ".mp4"
+        upload_path = self.uploads_dir / f"{job_id}{suffix}"
+        payload: Dict[str, Any] = {
+            "id": job_id,
+            "video": str(upload_path),
+            "output": str(self.outputs_dir / f"{job_id}.mp4"),
+        }
+        for field_name in JOB_OVERRIDE_FIELDS:
+            if field_name in query:
+                payload[field_name] = query[field_name][0]
+
+        try:
+            BatchJob.from_dict(payload, self.args.data_dir, self.args)
+        except ValueError as error:
+            raise HttpError(HTTPStatus.BAD_REQUEST, str(error))
+
+        # Reserve a queue slot before reading the body so a full queue costs the client no
+        # upload time.
+        if not await self.run_store(self.store.reserve, job_id, payload, self.args.max_queued_jobs):
+            raise HttpError(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                "Job queue is full; retry later.",
+                {"Retry-After": str(DEFAULT_RETRY_AFTER_SECONDS)},
+            )
+        try:
+            await read_body_to_file(reader, content_length, upload_path)
+        except BaseException:
+            upload_path.unlink(missing_ok=True)
+            await self.run_store(self.store.delete, job_id)
+            raise
+
+        await self.run_store(self.store.enqueue, job_id)
+        self.wake()
+        job = await self.require_job(job_id)
+        await write_json(writer, HTTPStatus.ACCEPTED, self.job_status(job), {"Location": f"/jobs/{job_id}"})
+
+    async def download(self, writer: asyncio.StreamWriter, job: Dict[str, Any]) -> None:
+        if job["status"] != "succeeded":
+            raise HttpError(HTTPStatus.CONFLICT, f"Job `{job['id']}` is {job['status']}; no video to download.")
+        output_path = Path(job["payload"]["output"])
+        if not output_path.exists():
+            raise HttpError(HTTPStatus.GONE, f"Output for job `{job['id']}` is no longer available.")
+
+        write_head(
+            writer,
+            HTTPStatus.OK,
+            {
+                "Content-Type": "video/mp4",
+                "Content-Length": str(output_path.stat().st_size),
+                "Content-Disposition": f'attachment; filename="{job["id"]}.mp4"',
+            },
+        )
+        loop = asyncio.get_running_loop()
+        with output_path.open("rb") as handle:
+            while True:
+                chunk = await loop.run_in_executor(None, handle.read, IO_CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+
+async def read_line(reader: asyncio.StreamReader, status: HTTPStatus) -> str:
+    # readline raises ValueError once a line outgrows the stream's buffer limit.
+    try:
+        line = await reader.readline()
+    except (asyncio.LimitOverrunError, ValueError):
+        raise HttpError(status, "Request line or header is too long.")
+    return line.decode("latin-1").strip()
+
+
+async def read_request_head(reader: asyncio.StreamReader) -> Tuple[str, str, Dict[str, str]]:
+    request_line = await read_line(reader, HTTPStatus.REQUEST_URI_TOO_LONG)
+    pieces = request_line.split()
+    if len(pieces) != 3 or not pieces[2].startswith("HTTP/1."):
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+
+    headers: Dict[str, str] = {}
+    for _ in range(MAX_HEADER_COUNT):
+        line = await read_line(reader, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many request headers.")
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        raise HttpError(HTTPStatus.LENGTH_REQUIRED, "Chunked uploads are not supported; send Content-Length.")
+    if headers.get("expect", "").lower() == "100-continue":
+        raise HttpError(HTTPStatus.EXPECTATION_FAILED, "Expect: 100-continue is not supported.")
+    return pieces[0].upper(), pieces[1], headers
+
+
+async def read_body_to_file(reader: asyncio.StreamReader, content_length: int, path: Path) -> None:
+    loop = asyncio.get_running_loop()
+    remaining = content_length
+    with path.open("wb") as handle:
+        while remaining:
+            chunk = await reader.read(min(remaining, IO_CHUNK_SIZE))
+            if not chunk:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Request body ended before Content-Length bytes.")
+            await loop.run_in_executor(None, handle.write, chunk)
+            remaining -= len(chunk)
+
+
+def write_head(writer: asyncio.StreamWriter, status: HTTPStatus, headers: Dict[str, str]) -> None:
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}", "Connection: close"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+
+async def write_json(
+    writer: asyncio.StreamWriter,
+    status: HTTPStatus,
+    payload: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None,
+) -> None:
+    body = json.dumps(payload).encode()
+    write_head(
+        writer,
+        status,
+        {"Content-Type": "application/json", "Content-Length": str(len(body)), **(headers or {})},
+    )
+    writer.write(body)
+    await writer.drain()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve the commentary pipeline over HTTP with a persistent job queue.")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST, help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument(
+        "--data-dir",
+        type=Path,
+        default=DEFAULT_DATA_DIR,
+        help="Directory holding the SQLite job queue, pending uploads and rendered videos.",
+    )
+    parser.add_argument(
+        "--max-queued-jobs",
+        type=int,
+        default=DEFAULT_MAX_QUEUED_JOBS,
+        help="Reject new uploads with HTTP 503 while this many jobs are waiting.",
+    )
+    parser.add_argument("--max-upload-mb", type=float, default=DEFAULT_MAX_UPLOAD_MB, help="Largest accepted upload.")
+    parser.add_argument(
+        "--max-metric-spans",
+        type=int,
+        default=DEFAULT_MAX_METRIC_SPANS,
+        help="Keep only this many of the most recent metric spans in memory (0 keeps all).",
+    )
+    add_runner_arguments(parser)
+    args = parser.parse_args()
+    args.data_dir = args.data_dir.resolve()
+    return args
+
+
+async def serve(service: JobService, host: str, port: int) -> None:
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    dispatcher = asyncio.create_task(service.dispatch())
+    print(f"Listening on http://{host}:{port} (data in {service.args.data_dir})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        dispatcher.cancel()
+
+
+def main() -> None:
+    load_env_files([PROJECT_ROOT / ".env.local", BASE_DIR / ".env"])
+    args = parse_args()
+
+    gemini_api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+    if not gemini_api_key:
+        raise RuntimeError("Set GEMINI_API_KEY or GOOGLE_API_KEY for Gemini access.")
+
+    eleven_api_key = os.getenv("ELEVENLABS_API_KEY")
+    if not eleven_api_key:
+        raise RuntimeError("Set ELEVENLABS_API_KEY for ElevenLabs access.")
+
+    # The service runs indefinitely, so its metrics report covers only the most recent spans.
+    METRICS.limit_spans(args.max_metric_spans)
+    store = JobStore(args.data_dir / "jobs.sqlite3")
+    for payload in store.drop_reservations():
+        Path(payload["video"]).unlink(missing_ok=True)
+    requeued = store.requeue_interrupted()
+    if requeued:
+        print(f"Requeued {requeued} jobs interrupted by the previous shutdown")
+
+    runner = BatchRunner(args, gemini_api_key, eleven_api_key)
+    service = JobService(args, store, runner)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        runner.close()
+        store.close()
+        METRICS.write_reports(args.metrics_json, args.metrics_otlp)
+
+
+if __name__ == "__main__":
+    main()
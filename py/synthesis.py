@@ -0,0 +1,655 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from core import (
+    DEFAULT_TTS_BATCH_LINES,
+    DEFAULT_TTS_CACHE_MAX_AGE_DAYS,
+    DEFAULT_TTS_CACHE_MAX_MB,
+    DEFAULT_TTS_CONCURRENCY,
+    DEFAULT_TTS_MAX_RETRIES,
+    METRICS,
+    PCM_OUTPUT_FORMAT_PATTERN,
+    TTS_BACKOFF_BASE_SECONDS,
+    TTS_BACKOFF_MAX_SECONDS,
+    TTS_BATCH_MAX_CHARS,
+    TTS_BATCH_SEPARATOR,
+    CommentaryEvent,
+    RunCheckpoint,
+    normalize_commentator_key,
+    resolve_voice_id,
+    run_ffmpeg,
+)
+
+if TYPE_CHECKING:
+    from elevenlabs import ElevenLabs, VoiceSettings  # type: ignore
+
+    from mixing import ClipStore
+
+
+# The ElevenLabs SDK is imported when a synthesizer is created, not at module load.
+
+__all__ = [
+    "RateLimiter",
+    "get_rate_limiter",
+    "retry_after_seconds",
+    "call_with_tts_retries",
+    "synthesize_event_clip",
+    "synthesize_aligned_text",
+    "group_events_by_voice",
+    "split_alignment",
+    "cut_audio_segments",
+    "slice_pcm_segments",
+    "pcm_output_sample_rate",
+    "pcm_to_wav_bytes",
+    "TTSCache",
+    "ClipSynthesizer",
+    "synthesize_events_to_disk",
+    "synthesize_with_pool",
+]
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second: float) -> None:
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiters: Dict[Tuple[str, float], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key: str, requests_per_second: float) -> RateLimiter:
+    # Limiters are shared per API key so concurrent synthesis runs draw from the same budget.
+    key = (api_key, requests_per_second)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_second)
+            _rate_limiters[key] = limiter
+        return limiter
+
+
+def retry_after_seconds(error: Exception, attempt: int) -> float:
+    headers = getattr(error, "headers", None) or {}
+    retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), TTS_BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return min(TTS_BACKOFF_BASE_SECONDS * (2 ** attempt), TTS_BACKOFF_MAX_SECONDS)
+
+
+def call_with_tts_retries(
+    request: Callable[[int], Any],
+    description: str,
+    rate_limiter: RateLimiter,
+    max_retries: int = DEFAULT_TTS_MAX_RETRIES,
+) -> Any:
+    attempt = 0
+    while True:
+        rate_limiter.acquire()
+        try:
+            return request(attempt)
+        except Exception as error:
+            if getattr(error, "status_code", None) != 429 or attempt >= max_retries:
+                raise
+            delay = retry_after_seconds(error, attempt)
+            attempt += 1
+            print(f"Rate limited on {description}; retry {attempt}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def synthesize_event_clip(
+    client: ElevenLabs,
+    event: CommentaryEvent,
+    voice_id: str,
+    model_id: str,
+    voice_settings: VoiceSettings,
+    output_format: str,
+    rate_limiter: RateLimiter,
+    max_retries: int = DEFAULT_TTS_MAX_RETRIES,
+) -> bytes:
+    def request(attempt: int) -> bytes:
+        with METRICS.span("tts.request", attempt=attempt, chars=len(event.call)) as span:
+            started = time.perf_counter()
+            stream = client.text_to_speech.convert(
+                voice_id=voice_id,
+                model_id=model_id,
+                output_format=output_format,
+                voice_settings=voice_settings,
+                text=event.call,
+            )
+
+            chunks: List[bytes] = []
+            for chunk in stream:
+                if chunk:
+                    if not chunks:
+                        span["ttfb_seconds"] = round(time.perf_counter() - started, 6)
+                    chunks.append(chunk)
+            audio_bytes = b"".join(chunks)
+            span["bytes"] = len(audio_bytes)
+        return audio_bytes
+
+    audio_bytes = call_with_tts_retries(request, f"clip at {event.timestamp}", rate_limiter, max_retries)
+    if not audio_bytes:
+        raise RuntimeError(f"ElevenLabs returned no audio for event at {event.timestamp}.")
+    return audio_bytes
+
+
+def synthesize_aligned_text(
+    client: ElevenLabs,
+    text: str,
+    voice_id: str,
+    model_id: str,
+    voice_settings: VoiceSettings,
+    output_format: str,
+    rate_limiter: RateLimiter,
+    max_retries: int = DEFAULT_TTS_MAX_RETRIES,
+) -> Tuple[bytes, Any]:
+    def request(attempt: int) -> Any:
+        with METRICS.span("tts.request", attempt=attempt, chars=len(text), aligned=True) as span:
+            response = client.text_to_speech.convert_with_timestamps(
+                voice_id=voice_id,
+                model_id=model_id,
+                output_format=output_format,
+                voice_settings=voice_settings,
+                text=text,
+            )
+            span["bytes"] = len(response.audio_base_64 or "") * 3 // 4
+        return response
+
+    response = call_with_tts_retries(request, f"batched request of {len(text)} chars", rate_limiter, max_retries)
+    return base64.b64decode(response.audio_base_64 or ""), response.alignment
+
+
+def group_events_by_voice(
+    events: Sequence[CommentaryEvent],
+    voice_map: Dict[str, str],
+    max_lines: int,
+    max_chars: int = TTS_BATCH_MAX_CHARS,
+) -> List[List[int]]:
+    groups: List[List[int]] = []
+    group_voice: Optional[str] = None
+    group_chars = 0
+    for index, event in enumerate(events):
+        voice_id = resolve_voice_id(event.commentator, voice_map)
+        if (
+            groups
+            and voice_id == group_voice
+            and len(groups[-1]) < max_lines
+            and group_chars + len(event.call) <= max_chars
+        ):
+            groups[-1].append(index)
+            group_chars += len(event.call)
+            continue
+        groups.append([index])
+        group_voice = voice_id
+        group_chars = len(event.call)
+    return groups
+
+
+def split_alignment(alignment: Any, lines: Sequence[str]) -> Optional[List[Tuple[float, Optional[float]]]]:
+    # Locates each line in the aligned characters (whitespace between lines may be
+    # normalized by the service) and cuts halfway through the pause between lines.
+    characters = getattr(alignment, "characters", None)
+    starts = getattr(alignment, "character_start_times_seconds", None)
+    ends = getattr(alignment, "character_end_times_seconds", None)
+    if not characters or not starts or not ends or not (len(characters) == len(starts) == len(ends)):
+        return None
+
+    aligned_text = "".join(characters)
+    spans: List[Tuple[int, int]] = []
+    cursor = 0
+    for line in lines:
+        position = aligned_text.find(line, cursor)
+        if position < 0 or not line:
+            return None
+        spans.append((position, position + len(line) - 1))
+        cursor = position + len(line)
+
+    cuts: List[float] = [0.0]
+    for (_, previous_last), (next_first, _) in zip(spans, spans[1:]):
+        cuts.append((ends[previous_last] + starts[next_first]) / 2)
+    if any(later <= earlier for earlier, later in zip(cuts, cuts[1:])):
+        return None
+    return [(start, end) for start, end in zip(cuts, [*cuts[1:], None])]
+
+
+def cut_audio_segments(audio_bytes: bytes, segments: Sequence[Tuple[float, Optional[float]]]) -> List[bytes]:
+    with TemporaryDirectory() as temp_dir:
+        source_path = Path(temp_dir) / "batch.mp3"
+        source_path.write_bytes(audio_bytes)
+        pieces: List[bytes] = []
+        for index, (start, end) in enumerate(segments):
+            piece_path = Path(temp_dir) / f"piece_{index:03d}.mp3"
+            duration_args = ["-to", f"{end:.3f}"] if end is not None else []
+            run_ffmpeg(["-y", "-ss", f"{start:.3f}", *duration_args, "-i", str(source_path), "-c", "copy", str(piece_path)])
+            pieces.append(piece_path.read_bytes())
+    return pieces
+
+
+def slice_pcm_segments(
+    pcm: bytes,
+    segments: Sequence[Tuple[float, Optional[float]]],
+    sample_rate: int,
+) -> List[bytes]:
+    view = memoryview(pcm)
+    total_frames = len(pcm) // 2
+    pieces: List[bytes] = []
+    for start, end in segments:
+        first = min(total_frames, int(round(start * sample_rate)))
+        last = total_frames if end is None else min(total_frames, int(round(end * sample_rate)))
+        pieces.append(bytes(view[first * 2 : last * 2]))
+    return pieces
+
+
+def pcm_output_sample_rate(output_format: str) -> Optional[int]:
+    match = PCM_OUTPUT_FORMAT_PATTERN.fullmatch(output_format)
+    return int(match.group(1)) if match else None
+
+
+def pcm_to_wav_bytes(pcm: bytes, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class TTSCache:
+    def __init__(
+        self,
+        directory: Path,
+        max_bytes: int = DEFAULT_TTS_CACHE_MAX_MB * 1024 * 1024,
+        max_age_seconds: float = DEFAULT_TTS_CACHE_MAX_AGE_DAYS * 86400,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        text: str,
+        voice_id: str,
+        model_id: str,
+        stability: float,
+        similarity_boost: float,
+        use_speaker_boost: bool,
+        output_format: str,
+    ) -> str:
+        material = json.dumps(
+            {
+                "text": text,
+                "voice_id": voice_id,
+                "model_id": model_id,
+                "stability": stability,
+                "similarity_boost": similarity_boost,
+                "use_speaker_boost": use_speaker_boost,
+                "output_format": output_format,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self.path_for(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+        if not data or self._is_expired(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        # Touch the entry so eviction treats it as recently used.
+        os.utime(path)
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def contains(self, key: str) -> bool:
+        path = self.path_for(key)
+        return path.exists() and not self._is_expired(path)
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+
+    def _is_expired(self, path: Path) -> bool:
+        if self.max_age_seconds <= 0:
+            return False
+        try:
+            return time.time() - path.stat().st_mtime > self.max_age_seconds
+        except FileNotFoundError:
+            return True
+
+    def evict(self) -> int:
+        entries: List[Tuple[float, int, Path]] = []
+        removed = 0
+        now = time.time()
+        for path in self.directory.glob("*/*.bin"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if self.max_age_seconds > 0 and now - stat.st_mtime > self.max_age_seconds:
+                path.unlink(missing_ok=True)
+                removed += 1
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        if self.max_bytes > 0 and total_bytes > self.max_bytes:
+            entries.sort(key=lambda entry: entry[0])
+            for _, size, path in entries:
+                if total_bytes <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total_bytes -= size
+                removed += 1
+
+        with self._lock:
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class ClipSynthesizer:
+    def __init__(
+        self,
+        api_key: str,
+        voice_map: Dict[str, str],
+        model_id: str,
+        output_dir: Path,
+        stability: float = 0.5,
+        similarity_boost: float = 0.65,
+        output_format: str = "mp3_44100_128",
+        use_speaker_boost: bool = True,
+        requests_per_second: float = 0.0,
+        max_retries: int = DEFAULT_TTS_MAX_RETRIES,
+        cache: Optional[TTSCache] = None,
+        client: Optional[ElevenLabs] = None,
+        checkpoint: Optional[RunCheckpoint] = None,
+        clip_store: Optional[ClipStore] = None,
+        write_clips: bool = True,
+    ) -> None:
+        from elevenlabs import ElevenLabs, VoiceSettings  # type: ignore
+
+        self.pcm_sample_rate = pcm_output_sample_rate(output_format)
+        if clip_store is not None and not self.pcm_sample_rate:
+            raise ValueError("The in-memory clip store requires a pcm_* output format.")
+        self.voice_map = voice_map
+        self.model_id = model_id
+        self.output_dir = output_dir
+        self.stability = stability
+        self.similarity_boost = similarity_boost
+        self.output_format = output_format
+        self.use_speaker_boost = use_speaker_boost
+        self.max_retries = max_retries
+        self.cache = cache
+        self.checkpoint = checkpoint
+        self.clip_store = clip_store
+        self.write_clips = write_clips or clip_store is None or checkpoint is not None
+        self.client = client or ElevenLabs(api_key=api_key)
+        self.rate_limiter = get_rate_limiter(api_key, requests_per_second)
+        self.voice_settings = VoiceSettings(
+            stability=stability,
+            similarity_boost=similarity_boost,
+            style=0.0,
+            use_speaker_boost=use_speaker_boost,
+        )
+        # Audio fetched ahead of synthesize() (batched requests, prefetched lines), keyed by
+        # clip key with the source it came from.
+        self._prefetched_audio: Dict[str, Tuple[str, bytes]] = {}
+        self._prefetched_lock = threading.Lock()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+    def clip_key(self, event: CommentaryEvent) -> str:
+        return TTSCache.make_key(
+            event.call,
+            resolve_voice_id(event.commentator, self.voice_map),
+            self.model_id,
+            self.stability,
+            self.similarity_boost,
+            self.use_speaker_boost,
+            self.output_format,
+        )
+
+    def clip_path(self, index: int, event: CommentaryEvent) -> Path:
+        commentator_slug = normalize_commentator_key(event.commentator) or "commentator"
+        suffix = "wav" if self.pcm_sample_rate else "mp3"
+        return self.output_dir / f"event_{index:02d}_{commentator_slug}.{suffix}"
+
+    @METRICS.traced("tts.clip")
+    def synthesize(self, index: int, event: CommentaryEvent, total: Optional[int] = None) -> Path:
+        voice_id = resolve_voice_id(event.commentator, self.voice_map)
+        started = time.perf_counter()
+        clip_key = self.clip_key(event)
+        clip_path = self.clip_path(index, event)
+        position = f"{index}/{total}" if total else str(index)
+
+        if self.checkpoint and self.checkpoint.clip_is_current(clip_path, clip_key):
+            METRICS.annotate(index=index, source="checkpoint")
+            print(f"Reusing clip {position} at {event.timestamp} from checkpoint: {event.call}")
+            return clip_path
+
+        audio_bytes = self.cache.get(clip_key) if self.cache else None
+        source = "cache"
+        if audio_bytes is None:
+            with self._prefetched_lock:
+                source, audio_bytes = self._prefetched_audio.pop(clip_key, ("", None))
+            if audio_bytes is None:
+                source = "ElevenLabs"
+                audio_bytes = synthesize_event_clip(
+                    self.client,
+                    event,
+                    voice_id,
+                    self.model_id,
+                    self.voice_settings,
+                    self.output_format,
+                    self.rate_limiter,
+                    max_retries=self.max_retries,
+                )
+            if self.cache:
+                self.cache.put(clip_key, audio_bytes)
+        latency = time.perf_counter() - started
+        METRICS.annotate(index=index, source=source, bytes=len(audio_bytes))
+
+        if self.clip_store is not None and self.pcm_sample_rate:
+            self.clip_store.put(clip_path, audio_bytes, self.pcm_sample_rate)
+        if self.write_clips:
+            clip_bytes = pcm_to_wav_bytes(audio_bytes, self.pcm_sample_rate) if self.pcm_sample_rate else audio_bytes
+            clip_path.write_bytes(clip_bytes)
+            if self.checkpoint:
+                self.checkpoint.record_clip(clip_path, clip_key, clip_bytes)
+        print(f"Synthesized clip {position} at {event.timestamp} in {latency:.2f}s ({source}): {event.call}")
+        return clip_path
+
+    def synthesize_group(
+        self,
+        items: Sequence[Tuple[int, CommentaryEvent]],
+        total: Optional[int] = None,
+    ) -> List[Path]:
+        # Lines still missing from the checkpoint and cache are sent as one request for
+        # their shared voice, then cut apart using the character alignment; any problem
+        # with the batch falls back to one request per line.
+        pending = [
+            event
+            for index, event in items
+            if not (self.checkpoint and self.checkpoint.clip_is_current(self.clip_path(index, event), self.clip_key(event)))
+            and not (self.cache and self.cache.contains(self.clip_key(event)))
+        ]
+        if len(pending) > 1 and (self.output_format.startswith("mp3") or self.pcm_sample_rate):
+            try:
+                self._prefetch_batch(pending)
+            except Exception as error:
+                print(f"Batched synthesis of {len(pending)} lines failed; synthesizing them one by one: {error}")
+        return [self.synthesize(index, event, total) for index, event in items]
+
+    @METRICS.traced("tts.batch")
+    def _prefetch_batch(self, events: Sequence[CommentaryEvent]) -> None:
+        lines = [event.call for event in events]
+        METRICS.annotate(lines=len(lines))
+        audio_bytes, alignment = synthesize_aligned_text(
+            self.client,
+            TTS_BATCH_SEPARATOR.join(lines),
+            resolve_voice_id(events[0].commentator, self.voice_map),
+            self.model_id,
+            self.voice_settings,
+            self.output_format,
+            self.rate_limiter,
+            max_retries=self.max_retries,
+        )
+        segments = split_alignment(alignment, lines)
+        if not audio_bytes or segments is None:
+            raise RuntimeError("ElevenLabs returned no usable alignment.")
+        if self.pcm_sample_rate:
+            pieces = slice_pcm_segments(audio_bytes, segments, self.pcm_sample_rate)
+        else:
+            pieces = cut_audio_segments(audio_bytes, segments)
+        with self._prefetched_lock:
+            for event, piece in zip(events, pieces):
+                self._prefetched_audio[self.clip_key(event)] = ("ElevenLabs batch", piece)
+
+    @METRICS.traced("tts.prefetch")
+    def prefetch(self, event: CommentaryEvent) -> None:
+        # Fetches a line's audio before its clip number is known; synthesize() then writes
+        # it under its final number without another request.
+        clip_key = self.clip_key(event)
+        if self.cache and self.cache.contains(clip_key):
+            return
+        audio_bytes = synthesize_event_clip(
+            self.client,
+            event,
+            resolve_voice_id(event.commentator, self.voice_map),
+            self.model_id,
+            self.voice_settings,
+            self.output_format,
+            self.rate_limiter,
+            max_retries=self.max_retries,
+        )
+        with self._prefetched_lock:
+            self._prefetched_audio[clip_key] = ("ElevenLabs", audio_bytes)
+
+    def discard_prefetched(self, event: CommentaryEvent) -> None:
+        with self._prefetched_lock:
+            self._prefetched_audio.pop(self.clip_key(event), None)
+
+    def finish(self) -> None:
+        if not self.cache:
+            return
+        self.cache.evict()
+        stats = self.cache.stats()
+        print(
+            f"TTS cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['evictions']} evicted from {self.cache.directory}"
+        )
+
+
+def synthesize_events_to_disk(
+    events: Sequence[CommentaryEvent],
+    api_key: str,
+    voice_map: Dict[str, str],
+    model_id: str,
+    output_dir: Path,
+    stability: float = 0.5,
+    similarity_boost: float = 0.65,
+    output_format: str = "mp3_44100_128",
+    use_speaker_boost: bool = True,
+    concurrency: int = DEFAULT_TTS_CONCURRENCY,
+    requests_per_second: float = 0.0,
+    max_retries: int = DEFAULT_TTS_MAX_RETRIES,
+    cache: Optional[TTSCache] = None,
+) -> List[Path]:
+    synthesizer = ClipSynthesizer(
+        api_key,
+        voice_map,
+        model_id,
+        output_dir,
+        stability=stability,
+        similarity_boost=similarity_boost,
+        output_format=output_format,
+        use_speaker_boost=use_speaker_boost,
+        requests_per_second=requests_per_second,
+        max_retries=max_retries,
+        cache=cache,
+    )
+    return synthesize_with_pool(synthesizer, events, concurrency)
+
+
+def synthesize_with_pool(
+    synthesizer: ClipSynthesizer,
+    events: Sequence[CommentaryEvent],
+    concurrency: int = DEFAULT_TTS_CONCURRENCY,
+    batch_lines: int = DEFAULT_TTS_BATCH_LINES,
+    numbers: Optional[Sequence[int]] = None,
+) -> List[Path]:
+    # numbers are the clip file numbers, i.e. each event's position in the full commentary,
+    # so clip names stay stable when some events are skipped.
+    total = len(events)
+    numbers = list(numbers) if numbers is not None else list(range(1, total + 1))
+    last_number = max(numbers, default=0)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        if batch_lines > 1:
+            groups = group_events_by_voice(events, synthesizer.voice_map, batch_lines)
+            group_futures = [
+                executor.submit(
+                    synthesizer.synthesize_group,
+                    [(numbers[index], events[index]) for index in group],
+                    last_number,
+                )
+                for group in groups
+            ]
+            clip_paths = [clip_path for future in group_futures for clip_path in future.result()]
+        else:
+            futures = [
+                executor.submit(synthesizer.synthesize, number, event, last_number)
+                for number, event in zip(numbers, events)
+            ]
+            clip_paths = [future.result() for future in futures]
+    print(f"Synthesized {total} clips in {time.perf_counter() - started:.2f}s (concurrency {max(1, concurrency)})")
+
+    synthesizer.finish()
+    return clip_paths
@@ -0,0 +1,60 @@
+import numpy as np
+
+from alignment import AlignmentPolicy, event_ranges, snap_commentary, snap_event_times
+from core import ALIGN_HOP_SECONDS, Commentary, CommentaryEvent
+
+
+def salience_with_peaks(peaks, seconds=60.0):
+    salience = np.zeros(int(seconds / ALIGN_HOP_SECONDS), dtype=np.float32)
+    for time, value in peaks.items():
+        salience[int(round(time / ALIGN_HOP_SECONDS))] = value
+    return salience
+
+
+def test_snaps_to_nearby_peak():
+    salience = salience_with_peaks({10.5: 1.0})
+    assert snap_event_times([10.0], salience, AlignmentPolicy()) == [10.5]
+
+
+def test_keeps_time_without_strong_peak():
+    salience = salience_with_peaks({10.5: 0.1})
+    assert snap_event_times([10.0], salience, AlignmentPolicy()) == [10.0]
+
+
+def test_two_events_never_share_a_peak():
+    salience = salience_with_peaks({10.5: 1.0})
+    snapped = snap_event_times([10.0, 11.0, 30.0], salience, AlignmentPolicy())
+    assert snapped[0] == 10.5
+    assert snapped[1] > snapped[0]
+    assert snapped[2] == 30.0
+
+
+def test_waits_for_previous_line_to_finish():
+    salience = salience_with_peaks({10.0: 1.0, 11.0: 1.0, 12.5: 0.9})
+    snapped = snap_event_times([10.0, 11.5], salience, AlignmentPolicy(), durations=[2.0, 1.0])
+    assert snapped == [10.0, 12.5]
+
+
+def test_never_reorders_events():
+    salience = salience_with_peaks({10.9: 1.0})
+    snapped = snap_event_times([10.0, 11.0], salience, AlignmentPolicy())
+    assert snapped[0] < snapped[1]
+    assert snapped[0] < 11.0
+
+
+def test_snap_commentary_rewrites_only_moved_timestamps():
+    commentary = Commentary(
+        "summary",
+        {},
+        [
+            CommentaryEvent("00:10", "playByPlay", "Jab!", ""),
+            CommentaryEvent("00:30", "analyst", "Nice.", ""),
+        ],
+    )
+    snapped = snap_commentary(commentary, salience_with_peaks({10.5: 1.0}), AlignmentPolicy())
+    assert [event.timestamp for event in snapped.events] == ["00:10.50", "00:30"]
+
+
+def test_event_ranges_merge_nearby_windows_and_clip_to_duration():
+    ranges = event_ranges([30.0, 1.0, 2.0, 59.5], window=1.5, duration=60.0, pad=0.25)
+    assert ranges == [(0.0, 3.75), (28.25, 31.75), (57.75, 60.0)]
@@ -0,0 +1,199 @@
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import analysis
+import core
+from analysis import (
+    COMMENTARY_RESPONSE_SCHEMA,
+    AnalysisCache,
+    AnalysisProxy,
+    IncrementalEventParser,
+    build_video_part,
+    generate_commentary,
+    generate_commentary_segmented,
+    recover_commentary_payload,
+)
+from core import INLINE_REQUEST_OVERHEAD_BYTES, Commentary
+
+EVENTS = [
+    {"timestamp": "00:02", "commentator": "playByPlay", "call": "Kick off!", "context": ""},
+    {"timestamp": "00:09", "commentator": "analyst", "call": "Nice {shape} \"here\".", "context": ""},
+    {"timestamp": "00:15", "commentator": "playByPlay", "call": "Shot!", "context": ""},
+]
+PAYLOAD = {"matchSummary": "A friendly.", "commentators": {"playByPlay": "Ann", "analyst": "Bo"}, "events": EVENTS}
+PROMPTS = Path(__file__).resolve().parents[1] / "prompts"
+
+
+def test_schema_requires_what_commentary_needs():
+    assert {"matchSummary", "events"} <= set(COMMENTARY_RESPONSE_SCHEMA["required"])
+    event_schema = COMMENTARY_RESPONSE_SCHEMA["properties"]["events"]["items"]
+    assert set(event_schema["required"]) == {"timestamp", "call"}
+    assert set(event_schema["property_ordering"]) == set(event_schema["properties"])
+
+
+class StructuredModels:
+    def __init__(self, *payloads):
+        self.payloads = list(payloads)
+        self.configs = []
+
+    def generate_content(self, model, contents, config=None):
+        self.configs.append(config)
+        return SimpleNamespace(candidates=[], text=json.dumps(self.payloads.pop(0)))
+
+
+def test_single_voice_prompt_resolves_to_play_by_play(tmp_path):
+    video_path = tmp_path / "clip.mp4"
+    video_path.write_bytes(b"\0" * 64)
+    events = [{"timestamp": "00:01", "call": "Ace!", "context": ""}, {"timestamp": "00:06", "call": "Long rally."}]
+    models = StructuredModels({"matchSummary": "A tennis point.", "events": events})
+
+    commentary = generate_commentary(video_path, PROMPTS / "tennis.md", "key", client=SimpleNamespace(models=models))
+    assert models.configs[0].response_schema == COMMENTARY_RESPONSE_SCHEMA
+    assert [event.commentator for event in commentary.events] == ["playByPlay", "playByPlay"]
+
+
+def test_parser_emits_events_as_chunks_arrive():
+    text = json.dumps(PAYLOAD)
+    parser = IncrementalEventParser()
+    found = []
+    for start in range(0, len(text), 7):
+        found.extend(parser.feed(text[start : start + 7]))
+    assert found == EVENTS
+    assert parser.finish() == 0
+    assert parser.fields["matchSummary"] == "A friendly."
+    assert parser.fields["commentators"] == PAYLOAD["commentators"]
+
+
+def test_parser_splits_escapes_and_keys_across_chunks():
+    text = json.dumps(PAYLOAD)
+    escape = text.index('\\"here')
+    # Cut inside the `events` key, and between a backslash and the quote it escapes.
+    cuts = [0, text.index('"events"') + 4, escape + 1, len(text)]
+    parser = IncrementalEventParser()
+    found = []
+    for start, end in zip(cuts, cuts[1:]):
+        found.append(parser.feed(text[start:end]))
+    assert found == [[], [EVENTS[0]], EVENTS[1:]]
+    assert parser.finish() == 0
+
+
+def test_recovers_events_before_truncation():
+    text = json.dumps(PAYLOAD)
+    cut = text.index('"Shot!"')
+    payload, dropped = recover_commentary_payload(text[:cut])
+    assert payload["events"] == EVENTS[:2]
+    assert payload["matchSummary"] == "A friendly."
+    assert dropped == 1
+
+
+def test_recovers_trailing_commas_and_trailing_prose():
+    text = json.dumps(PAYLOAD)
+    text = text.replace('"context": ""}', '"context": "",}').replace("}]", "},]")
+    payload, dropped = recover_commentary_payload(f"Here you go:\n{text}\nHope this helps!")
+    assert payload["events"] == EVENTS
+    assert dropped == 0
+    assert Commentary.from_dict(payload).match_summary == "A friendly."
+
+
+def test_recovers_bare_event_array():
+    payload, dropped = recover_commentary_payload(json.dumps(EVENTS))
+    assert payload == {"events": EVENTS}
+    assert dropped == 0
+
+
+def test_returns_none_without_events():
+    assert recover_commentary_payload('{"matchSummary": "x", "events": [') is None
+
+
+def test_inline_limit_counts_base64_and_prompt(tmp_path):
+    video_path = tmp_path / "clip.mp4"
+    video_path.write_bytes(b"\0" * 3000)
+    limit = 4000 + INLINE_REQUEST_OVERHEAD_BYTES + 100
+
+    part, uploaded_name = build_video_part(None, video_path, 5, limit, prompt_text="p" * 100)
+    assert uploaded_name is None and part.inline_data is not None
+
+    class Files:
+        def upload(self, file, config=None):
+            raise RuntimeError("uploaded")
+
+    client = type("Client", (), {"files": Files()})()
+    with pytest.raises(RuntimeError, match="uploaded"):
+        build_video_part(client, video_path, 5, limit - 1, prompt_text="p" * 100)
+
+
+def test_quiet_window_does_not_fail_segmented_analysis(tmp_path, monkeypatch):
+    video_path = tmp_path / "match.mp4"
+    video_path.write_bytes(b"\0" * 64)
+    monkeypatch.setattr(analysis, "probe_media_duration", lambda path: 70.0)
+    monkeypatch.setattr(analysis, "cut_video_window", lambda source, start, end, path: path.write_bytes(b"\0" * 64))
+    models = StructuredModels(
+        {"matchSummary": "Kick off.", "events": [{"timestamp": "00:05", "call": "Kick off!"}]},
+        {"matchSummary": "Nothing happens.", "events": []},
+        {"matchSummary": "Late winner.", "events": [{"timestamp": "00:25", "call": "Winner!"}]},
+    )
+
+    commentary = generate_commentary_segmented(
+        video_path, PROMPTS / "tennis.md", "key", 30, 10, concurrency=1, client=SimpleNamespace(models=models)
+    )
+    assert commentary.match_summary == "Kick off."
+    assert [(event.timestamp, event.call) for event in commentary.events] == [("00:05", "Kick off!"), ("01:05", "Winner!")]
+
+
+def test_analysis_cache_keys_on_video_content(tmp_path):
+    video_path = tmp_path / "match.mp4"
+    video_path.write_bytes(b"\0" * 64)
+    copy_path = tmp_path / "renamed.mp4"
+    copy_path.write_bytes(video_path.read_bytes())
+    cache = AnalysisCache(tmp_path / "analysis")
+    models = StructuredModels(PAYLOAD)
+    client = SimpleNamespace(models=models)
+
+    first = generate_commentary(video_path, PROMPTS / "tennis.md", "key", cache=cache, client=client)
+    second = generate_commentary(copy_path, PROMPTS / "tennis.md", "key", cache=cache, client=client)
+    assert len(models.configs) == 1
+    assert second == first
+
+    tennis_key = AnalysisCache.make_key(video_path, (PROMPTS / "tennis.md").read_text(), "model", 5)
+    boxing_key = AnalysisCache.make_key(video_path, (PROMPTS / "boxing.md").read_text(), "model", 5)
+    assert tennis_key != boxing_key
+    assert cache.get(boxing_key) is None
+
+
+def test_proxy_is_reused_only_while_newer_than_its_source(tmp_path, monkeypatch):
+    video_path = tmp_path / "match.mp4"
+    video_path.write_bytes(b"\0" * 64)
+    proxy = AnalysisProxy(directory=tmp_path / "proxies")
+    proxy_path = proxy.path_for(video_path, 5)
+    assert proxy_path != proxy.path_for(video_path, 2)
+    assert proxy_path != AnalysisProxy(directory=tmp_path / "proxies", keep_audio=False).path_for(video_path, 5)
+    assert proxy.existing(video_path, 5) is None
+
+    proxy_path.parent.mkdir()
+    proxy_path.write_bytes(b"\0" * 16)
+    monkeypatch.setattr(analysis, "run_ffmpeg", lambda args: pytest.fail("a fresh proxy must not be re-encoded"))
+    assert proxy.prepare(video_path, 5) == proxy_path
+
+    stale = video_path.stat().st_mtime - 60
+    os.utime(proxy_path, (stale, stale))
+    assert proxy.existing(video_path, 5) is None
+
+
+def test_precomputed_video_digest_skips_rehashing(tmp_path, monkeypatch):
+    video_path = tmp_path / "match.mp4"
+    video_path.write_bytes(b"\0" * 64)
+    cache = AnalysisCache(tmp_path / "analysis")
+    digest = core.hash_file(video_path)
+    key = AnalysisCache.make_key(video_path, "prompt", "model", 5)
+    cache.put(key, Commentary.from_dict(PAYLOAD))
+
+    monkeypatch.setattr(analysis, "hash_file", lambda path: pytest.fail("the run already hashed the video"))
+    assert AnalysisCache.make_key(video_path, "prompt", "model", 5, video_sha256=digest) == key
+    prompt_path = tmp_path / "prompt.md"
+    prompt_path.write_text("prompt")
+    commentary = generate_commentary(video_path, prompt_path, "key", model="model", cache=cache, video_sha256=digest)
+    assert commentary.match_summary == "A friendly."
@@ -0,0 +1,16 @@
+from batch import ResultsWriter, load_completed_job_ids
+
+
+def test_resume_skips_only_jobs_recorded_as_succeeded(tmp_path):
+    results_path = tmp_path / "runs" / "manifest.results.jsonl"
+    assert load_completed_job_ids(results_path) == set()
+
+    results = ResultsWriter(results_path)
+    results.write({"id": "a", "status": "succeeded"})
+    results.write({"id": "b", "status": "failed", "error": "RuntimeError: boom"})
+    results.write({"id": 7, "status": "succeeded"})
+    with results_path.open("a") as handle:
+        # A crash mid-write leaves a truncated final record.
+        handle.write('{"id": "c", "status": "succ')
+
+    assert load_completed_job_ids(results_path) == {"a", "7"}
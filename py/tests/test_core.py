@@ -0,0 +1,25 @@
+from core import Commentary, CommentaryEvent, RunCheckpoint
+
+COMMENTARY = Commentary("A friendly.", {"playByPlay": "Ann"}, [CommentaryEvent("00:02", "playByPlay", "Kick off!", "")])
+
+
+def test_checkpoint_resumes_only_unchanged_stages(tmp_path):
+    work_dir = tmp_path / "work"
+    checkpoint = RunCheckpoint(work_dir)
+    checkpoint.record_commentary("analysis-v1", COMMENTARY)
+    clip_path = work_dir / "clip_001.mp3"
+    clip_path.write_bytes(b"audio")
+    checkpoint.record_clip(clip_path, "voice-a", b"audio")
+    stale_path = work_dir / "clip_002.mp3"
+    stale_path.write_bytes(b"audio")
+    checkpoint.record_clip(stale_path, "voice-a", b"audio")
+    stale_path.write_bytes(b"truncated")
+
+    resumed = RunCheckpoint(work_dir, resume=True)
+    assert resumed.load_commentary("analysis-v1") == COMMENTARY
+    assert resumed.load_commentary("analysis-v2") is None
+    assert resumed.clip_is_current(clip_path, "voice-a")
+    assert not resumed.clip_is_current(clip_path, "voice-b")
+    assert not resumed.clip_is_current(stale_path, "voice-a")
+
+    assert RunCheckpoint(work_dir).load_commentary("analysis-v1") is None
@@ -0,0 +1,68 @@
+from pathlib import Path
+
+import main
+from core import Commentary, CommentaryEvent
+from main import run_pipelined, scheduled_events
+from mixing import SchedulePolicy, compute_interrupt_cutoffs
+
+EVENTS = [
+    CommentaryEvent("00:00", "analyst", "A long look at the shape of both teams.", ""),
+    CommentaryEvent("00:05", "analyst", "And now they...", ""),
+    CommentaryEvent("00:05.05", "playByPlay", "GOAL!", "", interrupts="analyst"),
+    CommentaryEvent("00:12", "analyst", "Beautiful finish.", ""),
+]
+
+
+def test_default_path_skips_lines_cut_off_at_their_start():
+    events, numbers = scheduled_events(EVENTS, SchedulePolicy())
+    assert numbers == [1, 3, 4]
+    # The interrupt's target was skipped, so it must not cut the earlier analyst line.
+    assert compute_interrupt_cutoffs(events) == [None, None, None]
+
+
+def test_without_a_mix_every_line_is_kept():
+    events, numbers = scheduled_events(EVENTS, None)
+    assert numbers == [1, 2, 3, 4]
+    assert events == EVENTS
+
+
+class FlakySynthesizer:
+    clip_store = None
+
+    def __init__(self):
+        self.synthesized = []
+
+    def clip_key(self, event):
+        return event.call
+
+    def prefetch(self, event):
+        if event.call == "GOAL!":
+            raise ConnectionError("connection reset")
+
+    def discard_prefetched(self, event):
+        pass
+
+    def synthesize(self, index, event, total):
+        self.synthesized.append(index)
+        return Path(f"clip_{index:03d}.mp3")
+
+    def finish(self):
+        pass
+
+
+def test_failed_prefetch_is_synthesized_again(monkeypatch):
+    commentary = Commentary("A friendly.", {}, [EVENTS[0], EVENTS[2]])
+
+    def stream_commentary(video_path, prompt_path, api_key, on_event, **_):
+        for event in commentary.events:
+            on_event(event)
+        return commentary
+
+    monkeypatch.setattr(main, "stream_commentary", stream_commentary)
+    monkeypatch.setattr(main, "probe_audio_sample_rate", lambda path: 44100)
+    synthesizer = FlakySynthesizer()
+
+    result, clip_paths = run_pipelined(Path("match.mp4"), Path("prompt.md"), "key", synthesizer, None)
+    assert result is commentary
+    assert sorted(synthesizer.synthesized) == [1, 2]
+    assert clip_paths == [Path("clip_001.mp3"), Path("clip_002.mp3")]
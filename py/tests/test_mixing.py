@@ -0,0 +1,152 @@
+import io
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import mixing
+from core import DEFAULT_LOUDNESS_RANGE, DEFAULT_LOUDNESS_TRUE_PEAK, CommentaryEvent
+from mixing import (
+    ClipPlacement,
+    ClipStore,
+    DuckingPolicy,
+    PcmMixer,
+    PcmMuxer,
+    SchedulePolicy,
+    iter_mixed_pcm,
+    iter_progressive_mixed_pcm,
+    schedule_clips,
+)
+
+
+def test_shifted_line_still_stops_at_its_interrupt():
+    events = [
+        CommentaryEvent("00:00", "playByPlay", "Through on goal...", ""),
+        CommentaryEvent("00:02", "analyst", "He has been threatening all half.", ""),
+        CommentaryEvent("00:04", "playByPlay", "GOAL!", "", interrupts="analyst"),
+    ]
+    placements = schedule_clips(events, [3.0, 3.0, 3.0], SchedulePolicy(resolve_overlaps=True))
+    first, analyst, goal = placements
+    assert analyst is not None and analyst.start > first.end
+    assert analyst.end <= 4.0
+    assert goal.start == 4.0
+
+
+def test_background_ducks_under_commentary_and_recovers():
+    rate = 1000
+    mixer = PcmMixer(
+        np.ones((3 * rate, 2), dtype=np.float32),
+        rate,
+        background_volume=0.4,
+        ducking=DuckingPolicy(idle_volume=1.0, attack=0.1, release=0.5),
+    )
+    clip = np.full((rate, 2), 0.5, dtype=np.float32)
+    mixer.place([clip], [ClipPlacement(1.0, 2.0, 0.0)])
+
+    gain = mixer.background_gain(0, 3 * rate)
+    assert gain[200] == pytest.approx(1.0)
+    assert 0.4 < gain[950] < 1.0
+    assert gain[1500] == pytest.approx(0.4)
+    assert 0.4 < gain[2200] < 1.0
+    assert gain[2800] == pytest.approx(1.0)
+    # Gains depend only on the schedule, so any chunking of the mix gives the same samples.
+    assert np.array_equal(mixer.mix(0, 3 * rate), np.concatenate([mixer.mix(0, 1234), mixer.mix(1234, 3 * rate)]))
+    assert mixer.mix(1500, 1501)[0, 0] == pytest.approx(0.9)
+
+
+def test_progressive_mix_emits_chunks_before_later_clips_are_ready():
+    rate = 100
+    background = np.full((6 * rate, 2), 0.1, dtype=np.float32)
+    events = [CommentaryEvent(timestamp, "playByPlay", "Line.", "") for timestamp in ("00:00.5", "00:02.5", "00:04.5")]
+    clips = [np.full((rate, 2), 0.2 * (index + 1), dtype=np.float32) for index in range(3)]
+    log = []
+
+    def loader(index):
+        def load():
+            log.append(f"clip {index}")
+            return clips[index]
+
+        return load
+
+    chunks = []
+    for chunk in iter_progressive_mixed_pcm(background, [loader(index) for index in range(3)], events, rate):
+        log.append(f"chunk {len(chunks)}")
+        chunks.append(chunk)
+
+    assert log == [
+        "clip 0",
+        "chunk 0",
+        "chunk 1",
+        "clip 1",
+        "chunk 2",
+        "chunk 3",
+        "clip 2",
+        "chunk 4",
+        "chunk 5",
+    ]
+    assert np.array_equal(np.concatenate(chunks), np.concatenate(list(iter_mixed_pcm(background, clips, events, rate))))
+
+
+def test_progressive_mix_never_drops_a_clip_it_has_started():
+    rate = 100
+    policy = SchedulePolicy(resolve_overlaps=True, fade_out=0.0)
+    events = [
+        CommentaryEvent("00:00.95", "analyst", "A long look at both teams.", ""),
+        CommentaryEvent("00:01.02", "playByPlay", "Shot!", ""),
+    ]
+    clips = [np.full((3 * rate, 2), 0.2, dtype=np.float32), np.full((rate, 2), 0.4, dtype=np.float32)]
+    loaders = [lambda clip=clip: clip for clip in clips]
+    silence = np.zeros((5 * rate, 2), dtype=np.float32)
+
+    progressive = np.concatenate(list(iter_progressive_mixed_pcm(silence, loaders, events, rate, schedule=policy)))
+    full = np.concatenate(list(iter_mixed_pcm(silence, clips, events, rate, schedule=policy)))
+    # The analyst line is dropped for the call right behind it, so none of it may be emitted.
+    assert not progressive[:100].any()
+    assert np.array_equal(progressive, full)
+
+
+class FinishedProcess:
+    def __init__(self):
+        self.stdin = io.BytesIO()
+        self.stderr = io.BytesIO()
+
+    def wait(self):
+        return 0
+
+
+def test_loudness_target_adds_loudnorm_and_resamples_back(monkeypatch):
+    commands = []
+    monkeypatch.setattr(mixing.subprocess, "Popen", lambda command, **_: commands.append(command) or FinishedProcess())
+    with PcmMuxer(Path("in.mp4"), Path("out.mp4"), 48000):
+        pass
+    with PcmMuxer(Path("in.mp4"), Path("out.mp4"), 48000, loudness_target=-23.0):
+        pass
+
+    plain, normalized = commands
+    assert "-af" not in plain
+    audio_filter = normalized[normalized.index("-af") + 1]
+    assert audio_filter == (
+        f"loudnorm=I=-23.0:TP={DEFAULT_LOUDNESS_TRUE_PEAK}:LRA={DEFAULT_LOUDNESS_RANGE},aresample=48000"
+    )
+    # The filter applies to the streamed mix, not the copied video track.
+    assert normalized.index("-af") > normalized.index("1:a:0")
+
+
+def test_clip_store_spills_past_its_budget_and_resamples(tmp_path):
+    store = ClipStore(max_memory_bytes=8, spill_dir=tmp_path / "spill")
+    first = np.array([0, 16384, -16384, 8192], dtype="<i2")
+    second = np.array([16384, 16384, -16384, -16384], dtype="<i2")
+    store.put(Path("clip_001.pcm"), first.tobytes(), 16000)
+    store.put(Path("clip_002.pcm"), second.tobytes() + b"\0", 16000)
+    assert (store.memory_bytes, store.spilled_bytes) == (8, 8)
+    assert list((tmp_path / "spill").iterdir())
+
+    mono = store.pcm(Path("clip_001.pcm"), 16000, channels=1)
+    assert np.array_equal(mono[:, 0], first / 32768.0)
+    upsampled = store.pcm(Path("clip_002.pcm"), 32000, channels=2)
+    assert upsampled.shape == (8, 2)
+    assert np.allclose(upsampled[::2, 0], second / 32768.0 * np.sqrt(0.5))
+    assert np.array_equal(upsampled[:, 0], upsampled[:, 1])
+
+    store.close()
+    assert Path("clip_001.pcm") not in store
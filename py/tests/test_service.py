@@ -0,0 +1,65 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import pytest
+
+from core import MetricsRecorder
+from service import HttpError, JobStore, read_request_head
+
+
+def read_head(data, limit=64):
+    async def run():
+        reader = asyncio.StreamReader(limit=limit)
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_request_head(reader)
+
+    return asyncio.run(run())
+
+
+def test_reads_request_head():
+    method, target, headers = read_head(b"get /jobs HTTP/1.1\r\nContent-Length: 5\r\n\r\n")
+    assert (method, target, headers) == ("GET", "/jobs", {"content-length": "5"})
+
+
+def test_oversized_request_line_is_rejected():
+    with pytest.raises(HttpError) as error:
+        read_head(b"GET /" + b"a" * 200 + b" HTTP/1.1\r\n\r\n")
+    assert error.value.status == HTTPStatus.REQUEST_URI_TOO_LONG
+
+
+def test_oversized_header_is_rejected():
+    with pytest.raises(HttpError) as error:
+        read_head(b"GET / HTTP/1.1\r\nX-Big: " + b"a" * 200 + b"\r\n\r\n")
+    assert error.value.status == HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE
+
+
+def test_metrics_keep_only_recent_spans():
+    recorder = MetricsRecorder()
+    recorder.limit_spans(3)
+    for index in range(5):
+        with recorder.span("job", index=index):
+            pass
+    assert [span.attributes["index"] for span in recorder.spans] == [2, 3, 4]
+
+
+def test_queue_slots_are_reserved_atomically(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        reserved = list(pool.map(lambda index: store.reserve(f"job-{index}", {"video": f"{index}.mp4"}, 3), range(8)))
+    assert reserved.count(True) == 3
+
+    accepted = [f"job-{index}" for index, ok in enumerate(reserved) if ok]
+    # Uploading jobs hold their slot but are not handed to the dispatcher until queued.
+    assert store.claim_next() is None
+    store.enqueue(accepted[0])
+    store.delete(accepted[1])
+    assert store.claim_next()[0] == accepted[0]
+    # A deleted upload and a claimed job each free their slot.
+    assert [store.reserve(job_id, {"video": f"{job_id}.mp4"}, 3) for job_id in ("a", "b", "c")] == [True, True, False]
+
+    dropped = {payload["video"] for payload in store.drop_reservations()}
+    assert dropped == {f"{accepted[2][4:]}.mp4", "a.mp4", "b.mp4"}
+    assert store.counts() == {"running": 1}
+    store.close()
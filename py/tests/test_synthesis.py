@@ -0,0 +1,108 @@
+import base64
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core import CommentaryEvent
+import synthesis
+from synthesis import ClipSynthesizer, RateLimiter, TTSCache, call_with_tts_retries, synthesize_with_pool
+
+SAMPLE_RATE = 16000
+
+
+class AlignedTextToSpeech:
+    def __init__(self):
+        self.requests = []
+
+    def convert_with_timestamps(self, text, **_):
+        self.requests.append(text)
+        characters, starts, ends = [], [], []
+        for position, character in enumerate(text):
+            characters.append(character)
+            starts.append(position * 0.05)
+            ends.append(position * 0.05 + 0.05)
+        pcm = b"\x01\x00" * int(len(text) * 0.05 * SAMPLE_RATE)
+        return SimpleNamespace(
+            audio_base_64=base64.b64encode(pcm).decode("ascii"),
+            alignment=SimpleNamespace(
+                characters=characters,
+                character_start_times_seconds=starts,
+                character_end_times_seconds=ends,
+            ),
+        )
+
+    def convert(self, **_):
+        raise AssertionError("batched lines should not fall back to single requests")
+
+
+def make_synthesizer(tmp_path, client, run):
+    return ClipSynthesizer(
+        "key",
+        {"playByPlay": "voice-a"},
+        "model",
+        tmp_path / f"clips_{run}",
+        output_format=f"pcm_{SAMPLE_RATE}",
+        cache=TTSCache(tmp_path / "cache"),
+        client=client,
+    )
+
+
+def test_batched_lines_are_served_from_cache_on_rerun(tmp_path):
+    events = [CommentaryEvent(f"00:0{second}", "playByPlay", f"Line {second}!", "") for second in range(3)]
+    tts = AlignedTextToSpeech()
+    client = SimpleNamespace(text_to_speech=tts)
+
+    first = make_synthesizer(tmp_path, client, 1)
+    synthesize_with_pool(first, events, concurrency=1, batch_lines=3)
+    assert len(tts.requests) == 1
+
+    second = make_synthesizer(tmp_path, client, 2)
+    clip_paths = synthesize_with_pool(second, events, concurrency=1, batch_lines=3)
+    assert len(tts.requests) == 1
+    assert second.cache.stats()["hits"] == 3
+    assert [path.read_bytes() for path in clip_paths] == [
+        path.read_bytes() for path in sorted((tmp_path / "clips_1").iterdir())
+    ]
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, headers):
+        super().__init__("too many requests")
+        self.headers = headers
+
+
+def test_rate_limited_requests_back_off_and_retry(monkeypatch):
+    delays = []
+    monkeypatch.setattr(synthesis.time, "sleep", delays.append)
+    failures = [RateLimited({"retry-after": "2"}), RateLimited({})]
+
+    def request(attempt):
+        if failures:
+            raise failures.pop(0)
+        return attempt
+
+    assert call_with_tts_retries(request, "line 1", RateLimiter(0)) == 2
+    # Retry-After wins over the exponential schedule, which is used once it is absent.
+    assert delays == [2.0, synthesis.TTS_BACKOFF_BASE_SECONDS * 2]
+
+    failures.extend([RateLimited({})] * 2)
+    with pytest.raises(RateLimited):
+        call_with_tts_retries(request, "line 2", RateLimiter(0), max_retries=1)
+
+
+def test_cache_evicts_expired_then_least_recently_used(tmp_path):
+    cache = TTSCache(tmp_path / "cache", max_bytes=250, max_age_seconds=100)
+    now = time.time()
+    for age, key in [(1000, "stale"), (30, "first"), (20, "second"), (10, "third")]:
+        cache.put(key, b"x" * 100)
+        os.utime(cache.path_for(key), (now - age, now - age))
+
+    assert cache.get("stale") is None
+    assert cache.get("first") is not None
+    assert cache.evict() == 2
+    assert [cache.contains(key) for key in ("stale", "first", "second", "third")] == [False, True, False, True]
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 2}